@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Mergeable win-ROI accumulators for the odds band reports, and the --jobs shard runner.
+
+BandStats keeps key -> [stake, ret, starters, winners] (key: a band, or (type, band)).
+Returns are whole yen (odds10 * 10), so partial results merge exactly in any order and a
+sharded run prints the same table as a single pass. With keep_hits, the winners' returns
+are kept per key for --ci (roi_ci.flat_stake_ci sorts them, so merge order does not matter).
+
+--jobs N splits the starters by Year or JyoCD (--shard); each worker process opens its own
+read-only connection, fills a BandStats for its shard, and the parent merges them in shard order.
+print_stats writes the --stats line (rows, elapsed, peak RSS) of both reports to stderr.
+"""
+
+import sqlite3
+import sys
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAKE = 100
+SHARD_COLUMNS = {'year': 'um.Year', 'jyo': 'um.JyoCD'}
+
+
+class BandStats:
+    """key -> [stake, ret, starters, winners]; merge() adds another BandStats cell by cell."""
+
+    def __init__(self, keep_hits: bool = False):
+        self.cells: Dict[Hashable, List[int]] = {}
+        # key -> returns of the winners (only kept for --ci)
+        self.hits: Optional[Dict[Hashable, List[float]]] = {} if keep_hits else None
+
+    def _cell(self, key: Hashable) -> List[int]:
+        c = self.cells.get(key)
+        if c is None:
+            c = self.cells[key] = [0, 0, 0, 0]
+        return c
+
+    def add(self, key: Hashable, odds: float, fin) -> None:
+        """One starter bet to win at odds (decimal); fin == 1 pays odds * STAKE."""
+        c = self._cell(key)
+        c[0] += STAKE
+        c[2] += 1
+        if fin == 1:
+            r = round(odds * STAKE)  # odds has one decimal place: whole yen
+            c[1] += r
+            c[3] += 1
+            if self.hits is not None:
+                self.hits.setdefault(key, []).append(float(r))
+
+    def add_totals(self, key: Hashable, stake: int, ret: int, starters: int, winners: int, hits: Iterable[float] = ()) -> None:
+        c = self._cell(key)
+        c[0] += int(stake)
+        c[1] += int(ret)
+        c[2] += int(starters)
+        c[3] += int(winners)
+        if self.hits is not None:
+            self.hits.setdefault(key, []).extend(float(h) for h in hits)
+
+    def merge(self, other: 'BandStats') -> 'BandStats':
+        for key, (stake, ret, starters, winners) in other.cells.items():
+            self.add_totals(key, stake, ret, starters, winners, (other.hits or {}).get(key, ()))
+        return self
+
+    def get(self, key: Hashable) -> Tuple[int, int, int, int]:
+        stake, ret, starters, winners = self.cells.get(key, (0, 0, 0, 0))
+        return stake, ret, starters, winners
+
+    def hits_of(self, key: Hashable) -> List[float]:
+        return (self.hits or {}).get(key, [])
+
+    def to_json(self) -> Dict[str, Any]:
+        # keys are a band or a (type, band) tuple: tuples become lists
+        def k(key):
+            return list(key) if isinstance(key, tuple) else key
+
+        out: Dict[str, Any] = {'cells': [[k(key), *c] for key, c in self.cells.items()]}
+        if self.hits is not None:
+            out['hits'] = [[k(key), h] for key, h in self.hits.items()]
+        return out
+
+    @classmethod
+    def from_json(cls, raw: Dict[str, Any]) -> 'BandStats':
+        def k(key):
+            return tuple(key) if isinstance(key, list) else key
+
+        stats = cls(keep_hits='hits' in raw)
+        for key, *c in raw['cells']:
+            stats.cells[k(key)] = [int(x) for x in c]
+        for key, h in raw.get('hits', []):
+            stats.hits[k(key)] = h
+        return stats
+
+
+def open_ro(db_path: str, index_db: Optional[str] = None) -> sqlite3.Connection:
+    # same read-only URI as the exporter's --jobs workers (escaped: '#' or '?' in the path)
+    from edb_tool import sqlite_uri
+
+    con = sqlite3.connect(sqlite_uri(db_path), uri=True)
+    if index_db:
+        con.execute('ATTACH DATABASE ? AS idx', (index_db,))
+    return con
+
+
+def shard_values(cur: sqlite3.Cursor, shard: str, where: str = '1', params: Sequence[str] = ()) -> List[str]:
+    """Distinct Year/JyoCD of the counted starters, in order."""
+    col = SHARD_COLUMNS[shard]
+    cur.execute(
+        f"""
+        SELECT DISTINCT {col} FROM N_UMA_RACE AS um
+        WHERE um.DataKubun IN ('5','7') AND {where}
+        ORDER BY 1
+        """,
+        list(params),
+    )
+    return [r[0] for r in cur.fetchall() if r[0] is not None]
+
+
+def run_shard_parts(worker: Callable[..., Tuple[BandStats, int]], shard_args: List[tuple], jobs: int) -> List[Tuple[BandStats, int]]:
+    """worker(*args) for each shard on a process pool; the (stats, rows read) of each, in shard order."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    if not shard_args:
+        return []
+    with ProcessPoolExecutor(max_workers=max(1, min(jobs, len(shard_args)))) as ex:
+        futures = [ex.submit(worker, *a) for a in shard_args]
+        return [fut.result() for fut in futures]
+
+
+def run_shards(worker: Callable[..., Tuple[BandStats, int]], shard_args: List[tuple], jobs: int, keep_hits: bool) -> Tuple[BandStats, int]:
+    """run_shard_parts merged: (merged stats, total rows read)."""
+    stats = BandStats(keep_hits)
+    n_rows = 0
+    for part, n in run_shard_parts(worker, shard_args, jobs):
+        stats.merge(part)
+        n_rows += n
+    return stats, n_rows
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024.0 / (1024.0 if sys.platform == 'darwin' else 1.0)  # macOS reports bytes
+
+
+def print_stats(rows: int, t0: float) -> None:
+    rss = peak_rss_mb()
+    rss_s = f'{rss:.1f}MB' if rss is not None else 'n/a'
+    print(f'# stats: rows={rows} elapsed={time.perf_counter() - t0:.2f}s peak_rss={rss_s}', file=sys.stderr)
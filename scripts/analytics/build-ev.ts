@@ -1,4 +1,5 @@
 import 'dotenv/config';
+import crypto from 'node:crypto';
 import fs from 'node:fs';
 import path from 'node:path';
 
@@ -252,6 +253,67 @@ function writeReco(day: DayReco) {
   const file = path.join(outDir, `reco-${day.date}.json`);
   fs.writeFileSync(file, JSON.stringify(day, null, 2));
   console.log(`wrote ${file}`);
+  storeReco(outDir, day);
+}
+
+// 推奨の日次パック（scripts/analytics/reco_store.py と同じ形式）:
+// reco.pack に1日1行の JSON。新しい日付は追記、既存の日付は内容が変わったときだけパックを日付順に書き直して置き換える。
+// reco.pack.idx.json は 日付→[offset, length] とパックの size/sha256（別のパックと組になった索引を読み手が検出する）
+type RecoIndex = { version: number; size: number; sha256: string; dates: Record<string, [number, number]> };
+
+function writeRecoIndex(store: string, dates: Record<string, [number, number]>) {
+  const pack = fs.readFileSync(store);
+  const idxPath = `${store}.idx.json`;
+  const sorted = Object.fromEntries(Object.entries(dates).sort(([a], [b]) => (a < b ? -1 : a > b ? 1 : 0)));
+  const idx: RecoIndex = { version: 2, size: pack.length, sha256: crypto.createHash('sha256').update(pack).digest('hex'), dates: sorted };
+  const tmp = `${idxPath}.tmp-${process.pid}`;
+  fs.writeFileSync(tmp, JSON.stringify(idx));
+  fs.renameSync(tmp, idxPath);
+}
+
+function storeReco(outDir: string, day: DayReco) {
+  const store = path.join(outDir, 'reco.pack');
+  const idxPath = `${store}.idx.json`;
+  const buf = Buffer.from(JSON.stringify(day) + '\n', 'utf8');
+  const pack = fs.existsSync(store) ? fs.readFileSync(store) : null;
+  const idx: RecoIndex | null = fs.existsSync(idxPath) ? JSON.parse(fs.readFileSync(idxPath, 'utf8')) : null;
+  const valid = !!pack && !!idx && idx.version === 2 && idx.size === pack.length
+    && idx.sha256 === crypto.createHash('sha256').update(pack).digest('hex');
+
+  let live: Map<string, Buffer>;
+  if (pack && idx && valid) {
+    const cur = idx.dates[day.date];
+    if (cur && pack.subarray(cur[0], cur[0] + cur[1]).equals(buf)) return;
+    if (!cur) {
+      fs.appendFileSync(store, buf);
+      writeRecoIndex(store, { ...idx.dates, [day.date]: [pack.length, buf.length] });
+      return;
+    }
+    live = new Map(Object.entries(idx.dates).map(([d, [off, len]]) => [d, pack.subarray(off, off + len)]));
+  } else {
+    // パックが無い/索引と合わない: 手元の reco-*.json から作り直す
+    if (pack || idx) console.warn(`${idxPath}: does not match ${store}; rebuilding from reco-*.json`);
+    live = new Map();
+    for (const f of fs.readdirSync(outDir).filter((f) => /^reco-\d{4}-\d{2}-\d{2}\.json$/.test(f))) {
+      const rec = JSON.parse(fs.readFileSync(path.join(outDir, f), 'utf8'));
+      live.set(f.slice(5, 15), Buffer.from(JSON.stringify(rec) + '\n', 'utf8'));
+    }
+  }
+  live.set(day.date, buf);
+
+  const dates: Record<string, [number, number]> = {};
+  const parts: Buffer[] = [];
+  let offset = 0;
+  for (const d of [...live.keys()].sort()) {
+    const b = live.get(d)!;
+    dates[d] = [offset, b.length];
+    parts.push(b);
+    offset += b.length;
+  }
+  const tmp = `${store}.tmp-${process.pid}`;
+  fs.writeFileSync(tmp, Buffer.concat(parts));
+  fs.renameSync(tmp, store);
+  writeRecoIndex(store, dates);
 }
 
 function readDay(isoDate: string): RaceDay {
@@ -4,9 +4,9 @@
 """
 Compute win ROI by odds bands split by horse pace type (A/B/C) from EveryDB2 (SQLite).
 
-Type classification replicates the app's SQLite exporter logic:
+Type classification is shared with the app's SQLite exporter (scripts/sqlite/pace_classifier.py):
   - For each horse (KettoNum), look back before the race date and read up to 20 prior races.
-  - Consider up to the first 3 prior races with any valid corner positions.
+  - Consider up to the first 3 prior races with any valid (non-zero) corner positions.
   - Count:
       nige_cnt += 1 if first corner==1 OR (first==2 AND second==1)
       sen_cnt  += 1 if all corners present are <= 4
@@ -15,17 +15,63 @@ Type classification replicates the app's SQLite exporter logic:
       B if sen_cnt >= 2
       C if sen_cnt >= 1
       else None (skip)
+  - Starters are classified in batches of BATCH (vectorized with NumPy when installed).
+
+Where the label comes from (--mode):
+  - asof:   the horse_pace_asof side table (EDB_INDEX_PATH), read by key
+  - sweep:  one pass over confirmed runs ordered by (KettoNum, date), keeping each horse's
+            recent runs as it goes, so every start is labelled from the runs before it
+            without a history query per starter (sort + one scan)
+  - lookup: the original per-starter history query (slow on a full DB; kept for checking)
+  - auto (default): asof when the side table is up to date, otherwise sweep
+  All modes give the same labels.
+  With --facts DIR the typed per-year starter facts (edb_tool.py build-facts) are read
+  instead of EveryDB2, and the table is a NumPy group-by over them (label, filters included).
 
 Bands: <2, 2-5, 5-10, 10-25, >25
 Stake: 100 per starter; Return: odds*100 if KakuteiJyuni == 1
 
+--ci adds a bootstrap interval of each row's ROI over its starters (roi_ci.py, NumPy).
+
+--jobs N shards the counted starters by Year or JyoCD (--shard) over N worker processes,
+each on its own read-only connection, and merges their BandStats (band_stats.py). In sweep
+mode a shard still reads its horses' earlier runs at every track (a Year shard stops at its
+year), so labels match a single pass.
+
+--cache DIR keeps per-year results and the last CSV (report_cache.py, keyed by the DB file and
+the filters): a rerun on an unchanged DB prints the stored table; after an update the first
+changed year and every later one are recomputed (labels read earlier runs), the rest reused.
+
+Rows are streamed with fetchmany (--arraysize per batch) and aggregated as they arrive;
+--stats prints rows/time/peak RSS to stderr.
+
+Filters (applied in SQL to the starters that are counted; histories always use every track):
+  --from/--to YYYYMMDD, --track JyoCD list (e.g. 05,09), --ground 芝/ダ/障 list
+
 Inputs:
   - EDB_PATH env var pointing to EveryDB2 SQLite DB
+  - EDB_INDEX_PATH (optional) side DB built by `scripts/sqlite/edb_tool.py pace-asof`;
+    when it is up to date, the as-of label is read by key instead of re-reading each history
 """
 
+import argparse
 import os
 import sqlite3
-from typing import Dict, Tuple
+import sys
+import time
+from itertools import groupby
+from typing import Iterable, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sqlite'))
+from edb_tool import CONFIRMED, pace_asof_is_fresh, trim_state  # noqa: E402
+from pace_classifier import PRIMARY_TYPE, classify_histories, corner_int  # noqa: E402
+from starter_facts import BANDS, GROUND_CODE, band_index, band_totals, load_facts, np  # noqa: E402
+from roi_ci import LEVEL, N_BOOT, flat_stake_ci, fmt_ci, require_numpy  # noqa: E402
+from band_stats import SHARD_COLUMNS, BandStats, open_ro, print_stats, run_shard_parts, run_shards, shard_values  # noqa: E402
+from report_cache import ReportCache, render, year_fingerprints  # noqa: E402
+
+BATCH = 5000  # starters per classify_histories call
+GROUND_TRACKCD = {'芝': '1', 'ダ': '2', '障': '5'}  # head digit of N_RACE.TrackCD
 
 
 def to_int_or_none(v):
@@ -48,6 +94,15 @@ def to_odds_decimal(odds10, fallback10):
     return None
 
 
+def iter_rows(cur: sqlite3.Cursor) -> Iterable[Tuple]:
+    # cur.arraysize rows at a time; never holds the whole result
+    while True:
+        batch = cur.fetchmany()
+        if not batch:
+            return
+        yield from batch
+
+
 def band_of(od: float) -> str:
     if od < 2.0:
         return '<2'
@@ -60,114 +115,373 @@ def band_of(od: float) -> str:
     return '>25'
 
 
-def classify_pace_type_for_horse(cur: sqlite3.Cursor, ketto: str, target_num: int):
-    # target_num: YYYYMMDD as integer, compare Year*10000 + MonthDay
+def fetch_pace_history(cur: sqlite3.Cursor, ketto: str, year: str, mmdd: str) -> List[Tuple]:
+    # Year/MonthDay are fixed-width zero-padded text, so a row-value comparison
+    # orders like the integer date and can use the (KettoNum, Year, MonthDay) index
     cur.execute(
         """
         SELECT Jyuni1c, Jyuni2c, Jyuni3c, Jyuni4c
         FROM N_UMA_RACE
         WHERE KettoNum = ? AND DataKubun IN ('5','7')
-          AND (CAST(Year AS INTEGER)*10000 + CAST(MonthDay AS INTEGER)) < ?
-        ORDER BY CAST(Year AS INTEGER) DESC, CAST(MonthDay AS INTEGER) DESC
+          AND (Year, MonthDay) < (?, ?)
+        ORDER BY Year DESC, MonthDay DESC
         LIMIT 20
         """,
-        (ketto, target_num),
+        (ketto, year, mmdd),
     )
-    nige_cnt = 0
-    sen_cnt = 0
-    considered = 0
-    for row in cur.fetchall():
-        c = [to_int_or_none(row[0]), to_int_or_none(row[1]), to_int_or_none(row[2]), to_int_or_none(row[3])]
-        pres = [v for v in c if v is not None]
-        if not pres:
-            continue
-        first = pres[0]
-        second = pres[1] if len(pres) >= 2 else None
-        nige = (first == 1) or (first == 2 and second == 1)
-        senkou = all(v <= 4 for v in pres)
-        if nige:
-            nige_cnt += 1
-        if senkou:
-            sen_cnt += 1
-        considered += 1
-        if considered >= 3:
-            break
-    # decide
-    if nige_cnt >= 2:
-        return 'A'
-    if sen_cnt >= 2:
-        return 'B'
-    if sen_cnt >= 1:
-        return 'C'
-    return None
+    return cur.fetchall()
 
 
-def main():
-    edb = os.environ.get('EDB_PATH') or os.environ.get('SQLITE_DB') or os.environ.get('EDB')
-    if not edb or not os.path.exists(edb):
-        raise SystemExit('EDB_PATH not set or file not found')
+def classify_pace_type_for_horse(cur: sqlite3.Cursor, ketto: str, year: str, mmdd: str):
+    return PRIMARY_TYPE[classify_histories([fetch_pace_history(cur, ketto, year, mmdd)])[0]]
+
+
+def flush(stats: BandStats, pending: List[Tuple[float, object, Optional[int]]], histories: List[List[Tuple]]) -> None:
+    # pending keeps input order; entries without a precomputed code take the next classified history
+    codes = iter(classify_histories(histories))
+    for odds, fin, code in pending:
+        t = PRIMARY_TYPE[code if code is not None else next(codes)]
+        if t is not None:
+            stats.add((t, band_of(odds)), odds, fin)
+    pending.clear()
+    histories.clear()
+
+
+def split_list(s: Optional[str]) -> List[str]:
+    return [x.strip() for x in (s or '').split(',') if x.strip()]
 
-    con = sqlite3.connect(edb)
-    cur = con.cursor()
 
-    # main iterator: all starters with final data
-    sql = """
+def starter_filter(args) -> Tuple[str, List[str]]:
+    """SQL condition (alias um) and params selecting the starters to count."""
+    conds: List[str] = []
+    params: List[str] = []
+    if args.date_from:
+        conds.append('(um.Year, um.MonthDay) >= (?, ?)')
+        params += [args.date_from[:4], args.date_from[4:]]
+    if args.date_to:
+        conds.append('(um.Year, um.MonthDay) <= (?, ?)')
+        params += [args.date_to[:4], args.date_to[4:]]
+    tracks = split_list(args.track)
+    if tracks:
+        conds.append(f"um.JyoCD IN ({','.join('?' * len(tracks))})")
+        params += tracks
+    grounds = [GROUND_TRACKCD[g] for g in split_list(args.ground)]
+    if grounds:
+        conds.append(
+            f"""EXISTS (
+          SELECT 1 FROM N_RACE AS r
+          WHERE r.Year = um.Year AND r.MonthDay = um.MonthDay AND r.JyoCD = um.JyoCD
+            AND r.Kaiji = um.Kaiji AND r.Nichiji = um.Nichiji AND r.RaceNum = um.RaceNum
+            AND substr(r.TrackCD, 1, 1) IN ({','.join('?' * len(grounds))}))"""
+        )
+        params += grounds
+    return (' AND '.join(conds) or '1'), params
+
+
+def run_by_starter(cur: sqlite3.Cursor, stats: BandStats, where: str, params: List[str], pace_code: str, pace_join: str) -> int:
+    """asof / lookup: iterate the counted starters; label from the side table or a history query each."""
+    sql = f"""
       SELECT 
         um.Year, um.MonthDay, um.JyoCD, um.RaceNum,
         um.KettoNum,
         um.Odds AS Odds10, so.TanOdds AS TanOdds10,
-        um.KakuteiJyuni
+        um.KakuteiJyuni,
+        {pace_code} AS PaceCode
       FROM N_UMA_RACE AS um
       LEFT JOIN S_ODDS_TANPUKU AS so
         ON um.Year = so.Year AND um.MonthDay = so.MonthDay 
-       AND um.JyoCD = so.JyoCD AND um.RaceNum = so.RaceNum AND um.Umaban = so.Umaban
-      WHERE um.DataKubun IN ('5','7')
+       AND um.JyoCD = so.JyoCD AND um.RaceNum = so.RaceNum AND um.Umaban = so.Umaban{pace_join}
+      WHERE um.DataKubun IN ('5','7') AND {where}
     """
-    cur.execute(sql)
+    cur.execute(sql, params)
+    hcur = cur.connection.cursor()  # history lookups must not reset the streaming cursor
 
-    # type -> band -> (stake, ret, starters, winners)
-    agg: Dict[str, Dict[str, Tuple[int, float, int, int]]] = {}
-
-    rows = cur.fetchall()
-    for row in rows:
+    n_rows = 0
+    pending: List[Tuple[float, object, Optional[int]]] = []
+    histories: List[List[Tuple]] = []
+    for row in iter_rows(cur):
+        n_rows += 1
         year = str(row[0]).strip()
         mmdd = str(row[1]).strip()
         ketto = (str(row[4]).strip() if row[4] is not None else '')
         odds10 = row[5]
         tan10 = row[6]
         fin = to_int_or_none(row[7])
-        if not year or not mmdd or not ketto:
-            continue
-        try:
-            target_num = int(year) * 10000 + int(mmdd)
-        except Exception:
+        if not year.isdigit() or not mmdd.isdigit() or not ketto:
             continue
         odds = to_odds_decimal(odds10, tan10)
         if odds is None:
             continue
-        t = classify_pace_type_for_horse(cur, ketto, target_num)
-        if t not in ('A','B','C'):
-            continue
-        band = band_of(odds)
-        if t not in agg:
-            agg[t] = {}
-        stake, ret, starters, winners = agg[t].get(band, (0, 0.0, 0, 0))
-        stake += 100
-        starters += 1
-        if fin == 1:
-            ret += odds * 100.0
-            winners += 1
-        agg[t][band] = (stake, ret, starters, winners)
-
-    # print CSV
-    print('type,band,starters,winners,stake,ret,roi')
-    order = ['<2', '2-5', '5-10', '10-25', '>25']
+        code = row[8]
+        pending.append((odds, fin, code))
+        if code is None:
+            histories.append(fetch_pace_history(hcur, ketto, year, mmdd))
+        if len(pending) >= BATCH:
+            flush(stats, pending, histories)
+    flush(stats, pending, histories)
+    return n_rows
+
+
+def run_sweep(
+    cur: sqlite3.Cursor, stats: BandStats, where: str, params: List[str], filtered: bool, until_year: Optional[str] = None
+) -> int:
+    """sweep: every confirmed run ordered by (KettoNum, date), one pass.
+
+    Each horse's state is its recent runs [[ymd, c1, c2, c3, c4], ...] (newest first, trimmed
+    like the pace-asof builder). Starts on one day are labelled from the state before that day,
+    then the day's runs are folded in, which matches the `(Year, MonthDay) < date` history query.
+    With filters, only horses that have a counted start are read; until_year drops runs after
+    that year (a Year shard never needs them).
+    """
+    horse_cond = ''
+    horse_params: List[str] = []
+    if filtered:
+        horse_cond = f"""
+        AND um.KettoNum IN (
+          SELECT um.KettoNum FROM N_UMA_RACE AS um
+          WHERE um.DataKubun IN ('5','7') AND {where})"""
+        horse_params = params
+    if until_year is not None:
+        horse_cond += ' AND um.Year <= ?'
+        horse_params = [*horse_params, until_year]
+    cur.execute(
+        f"""
+        SELECT um.KettoNum,
+               CAST(um.Year AS INTEGER)*10000 + CAST(um.MonthDay AS INTEGER) AS ymd,
+               um.Jyuni1c, um.Jyuni2c, um.Jyuni3c, um.Jyuni4c,
+               CASE WHEN {where} THEN 1 ELSE 0 END AS counted,
+               um.Odds, so.TanOdds, um.KakuteiJyuni
+        FROM N_UMA_RACE AS um
+        LEFT JOIN S_ODDS_TANPUKU AS so
+          ON um.Year = so.Year AND um.MonthDay = so.MonthDay
+         AND um.JyoCD = so.JyoCD AND um.RaceNum = so.RaceNum AND um.Umaban = so.Umaban
+        WHERE um.DataKubun IN ({','.join('?' * len(CONFIRMED))})
+          AND um.KettoNum IS NOT NULL AND trim(um.KettoNum) <> ''{horse_cond}
+        ORDER BY um.KettoNum, um.Year, um.MonthDay
+        """,
+        [*params, *CONFIRMED, *horse_params],
+    )
+
+    n_rows = 0
+
+    def rows() -> Iterable[Tuple]:
+        nonlocal n_rows
+        for row in iter_rows(cur):
+            n_rows += 1
+            yield row
+
+    pending: List[Tuple[float, object, Optional[int]]] = []
+    histories: List[List[Tuple]] = []
+    for _, horse in groupby(rows(), key=lambda r: r[0]):
+        hist: List[List[int]] = []
+        for ymd, day in groupby(horse, key=lambda r: r[1]):
+            day = list(day)
+            before = None
+            for _, _, c1, c2, c3, c4, counted, odds10, tan10, fin in day:
+                if not counted:
+                    continue
+                odds = to_odds_decimal(odds10, tan10)
+                if odds is None:
+                    continue
+                if before is None:
+                    before = [row[1:] for row in hist]
+                pending.append((odds, to_int_or_none(fin), None))
+                histories.append(before)
+            for r in day:
+                hist = trim_state([[ymd, corner_int(r[2]), corner_int(r[3]), corner_int(r[4]), corner_int(r[5])]] + hist)
+        if len(pending) >= BATCH:
+            flush(stats, pending, histories)
+    flush(stats, pending, histories)
+    return n_rows
+
+
+def run_facts(args, stats: BandStats) -> int:
+    """--facts: filters and labels as boolean masks over the fact columns."""
+    years = None
+    if args.date_from or args.date_to:
+        years = range(int((args.date_from or '0000')[:4]), int((args.date_to or '9999')[:4]) + 1)
+    f = load_facts(args.facts, ['ymd', 'jyo', 'ground', 'odds10', 'finish', 'pace'], years)
+    m = np.ones(len(f['ymd']), dtype=bool)
+    if args.date_from:
+        m &= f['ymd'] >= int(args.date_from)
+    if args.date_to:
+        m &= f['ymd'] <= int(args.date_to)
+    tracks = [int(x) for x in split_list(args.track)]
+    if tracks:
+        m &= np.isin(f['jyo'], tracks)
+    grounds = [GROUND_CODE[g] for g in split_list(args.ground)]
+    if grounds:
+        m &= np.isin(f['ground'], grounds)
+    primary = np.array([PRIMARY_TYPE[c] or '' for c in range(len(PRIMARY_TYPE))])
+    label = primary[f['pace']]
+    for t in ('A', 'B', 'C'):
+        sel = m & (label == t)
+        won = sel & (f['odds10'] > 0) & (f['finish'] == 1)
+        idx = band_index(f['odds10'][won])
+        for i, (b, totals) in enumerate(zip(BANDS, band_totals(f['odds10'][sel], f['finish'][sel]))):
+            stats.add_totals((t, b), *totals, hits=(f['odds10'][won][idx == i] * 10 if stats.hits is not None else ()))
+    return len(f['ymd'])
+
+
+PACE_JOIN = """
+      LEFT JOIN idx.horse_pace_asof AS pa
+        ON pa.KettoNum = um.KettoNum
+       AND pa.ymd = CAST(um.Year AS INTEGER)*10000 + CAST(um.MonthDay AS INTEGER)"""
+
+
+def run_mode(cur: sqlite3.Cursor, stats: BandStats, mode: str, where: str, params: List[str], until_year: Optional[str] = None) -> int:
+    if mode == 'sweep':
+        return run_sweep(cur, stats, where, params, filtered=bool(params), until_year=until_year)
+    if mode == 'asof':
+        return run_by_starter(cur, stats, where, params, 'pa.code', PACE_JOIN)
+    return run_by_starter(cur, stats, where, params, 'NULL', '')
+
+
+def run_shard(
+    edb: str, index_db: Optional[str], mode: str, where: str, params: List[str],
+    shard: str, value: str, arraysize: int, keep_hits: bool,
+) -> Tuple[BandStats, int]:
+    """--jobs worker: the starters of one Year/JyoCD on its own read-only connection."""
+    con = open_ro(edb, index_db if mode == 'asof' else None)
+    try:
+        cur = con.cursor()
+        cur.arraysize = arraysize
+        stats = BandStats(keep_hits)
+        n_rows = run_mode(
+            cur, stats, mode, f'{where} AND {SHARD_COLUMNS[shard]} = ?', [*params, value],
+            until_year=value if shard == 'year' else None,
+        )
+        return stats, n_rows
+    finally:
+        con.close()
+
+
+def print_table(stats: BandStats, args) -> None:
+    print('type,band,starters,winners,stake,ret,roi' + (',roi_lo,roi_hi' if args.ci else ''))
     for t in ['A','B','C']:
-        bands = agg.get(t, {})
-        for b in order:
-            stake, ret, starters, winners = bands.get(b, (0, 0.0, 0, 0))
+        for b in BANDS:
+            stake, ret, starters, winners = stats.get((t, b))
             roi = (ret / stake) if stake > 0 else 0.0
-            print(f"{t},{b},{starters},{winners},{stake},{int(ret)},{roi:.3f}")
+            line = f"{t},{b},{starters},{winners},{stake},{int(ret)},{roi:.3f}"
+            if args.ci:
+                ci = flat_stake_ci(starters, stats.hits_of((t, b)), n_boot=args.boot, level=args.ci_level)
+                line += ',' + fmt_ci(ci)
+            print(line)
+
+
+def run_cached(edb: str, index_db: Optional[str], mode: str, where: str, params: List[str], args) -> int:
+    """--cache: print the stored CSV, or recompute from the first changed year on and store the new one."""
+    key = {
+        'from': args.date_from, 'to': args.date_to, 'track': split_list(args.track),
+        'ground': split_list(args.ground), 'ci': args.ci,
+    }
+    # modules whose logic decides the numbers: labels (pace_classifier, edb_tool.trim_state), bands (starter_facts)
+    sources = [os.path.abspath(__file__)] + [sys.modules[m].__file__ for m in ('pace_classifier', 'edb_tool', 'starter_facts')]
+    cache = ReportCache(args.cache, 'odds_band_by_type', key, sources, refresh=args.refresh)
+    output = {'boot': args.boot, 'ci_level': args.ci_level} if args.ci else {}
+    text = cache.cached_csv(edb, output)
+    n_rows = 0
+    if text is None:
+        con = sqlite3.connect(edb)
+        fps = year_fingerprints(con.cursor())
+        con.close()
+        years = cache.stale_years(fps, cascade=True)
+        # years outside --from/--to count no starters: nothing to read
+        lo, hi = (args.date_from or '0000')[:4], (args.date_to or '9999')[:4]
+        fresh = {y: BandStats(args.ci) for y in years if not lo <= y <= hi}
+        scan = [y for y in years if y not in fresh]
+        shards = [(edb, index_db, mode, where, params, 'year', y, max(1, args.arraysize), args.ci) for y in scan]
+        if args.jobs > 1:
+            parts = run_shard_parts(run_shard, shards, args.jobs)
+        else:
+            parts = [run_shard(*a) for a in shards]
+        n_rows = sum(n for _, n in parts)
+        fresh.update((y, part) for y, (part, _) in zip(scan, parts))
+        stats = cache.merge_years(fps, fresh, args.ci)
+        text = render(print_table, stats, args)
+        cache.save(edb, output, text)
+    sys.stdout.write(text)
+    return n_rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Win ROI by odds band and pace type (EveryDB2 SQLite)')
+    ap.add_argument('--mode', choices=['auto', 'asof', 'sweep', 'lookup'], default='auto', help='where pace labels come from')
+    ap.add_argument('--from', dest='date_from', help='YYYYMMDD (inclusive)')
+    ap.add_argument('--to', dest='date_to', help='YYYYMMDD (inclusive)')
+    ap.add_argument('--track', help='JyoCD list, e.g. 05,09')
+    ap.add_argument('--ground', help='芝,ダ,障 (comma separated)')
+    ap.add_argument('--arraysize', type=int, default=BATCH, help='rows per fetchmany batch')
+    ap.add_argument('--stats', action='store_true', help='print rows/elapsed/peak RSS to stderr')
+    ap.add_argument('--facts', help='starter facts directory (edb_tool.py build-facts); EveryDB2 is not read')
+    ap.add_argument('--ci', action='store_true', help='add bootstrap interval columns roi_lo,roi_hi')
+    ap.add_argument('--boot', type=int, default=N_BOOT, help='bootstrap resamples for --ci')
+    ap.add_argument('--ci-level', type=float, default=LEVEL, help='interval coverage for --ci')
+    ap.add_argument('--jobs', type=int, default=1, help='worker processes (shards by --shard)')
+    ap.add_argument('--shard', choices=sorted(SHARD_COLUMNS), default='year', help='how --jobs splits the starters (--cache always uses year)')
+    ap.add_argument('--cache', help='result cache directory (per-year results + last CSV, keyed by DB and parameters)')
+    ap.add_argument('--refresh', action='store_true', help='with --cache: ignore stored results and recompute')
+    args = ap.parse_args()
+    t0 = time.perf_counter()
+    if args.ci:
+        require_numpy()
+    for g in split_list(args.ground):
+        if g not in GROUND_TRACKCD:
+            ap.error(f'--ground: unknown value {g!r} (use 芝, ダ, 障)')
+
+    # (type, band) -> [stake, ret, starters, winners]
+    stats = BandStats(keep_hits=args.ci)
+
+    if args.facts:
+        n_rows = run_facts(args, stats)
+        print_table(stats, args)
+        if args.stats:
+            print_stats(n_rows, t0)
+        return
+
+    edb = os.environ.get('EDB_PATH') or os.environ.get('SQLITE_DB') or os.environ.get('EDB')
+    if not edb or not os.path.exists(edb):
+        raise SystemExit('EDB_PATH not set or file not found')
+
+    con = sqlite3.connect(edb)
+    cur = con.cursor()
+    cur.arraysize = max(1, args.arraysize)
+
+    mode = args.mode
+    index_db = os.environ.get('EDB_INDEX_PATH')
+    if mode in ('auto', 'asof'):
+        fresh = False
+        if index_db and os.path.exists(index_db):
+            cur.execute('ATTACH DATABASE ? AS idx', (index_db,))
+            fresh = pace_asof_is_fresh(con, edb)
+            if not fresh:
+                print(f'[WARN] pace-asof table is stale or missing, ignored: {index_db}', file=sys.stderr)
+        if mode == 'asof' and not fresh:
+            raise SystemExit('--mode asof needs an up-to-date pace-asof table in EDB_INDEX_PATH')
+        mode = 'asof' if fresh else 'sweep'
+
+    where, params = starter_filter(args)
+
+    if args.cache:
+        con.close()
+        n_rows = run_cached(edb, index_db, mode, where, params, args)
+        if args.stats:
+            print_stats(n_rows, t0)
+        return
+
+    if args.jobs > 1:
+        shards = [
+            (edb, index_db, mode, where, params, args.shard, v, cur.arraysize, args.ci)
+            for v in shard_values(cur, args.shard, where, params)
+        ]
+        con.close()
+        stats, n_rows = run_shards(run_shard, shards, args.jobs, args.ci)
+    else:
+        n_rows = run_mode(cur, stats, mode, where, params)
+
+    print_table(stats, args)
+    if args.stats:
+        print_stats(n_rows, t0)
 
 
 if __name__ == '__main__':
@@ -13,11 +13,29 @@ Logic:
   - Finish = KakuteiJyuni (1 = win)
   - Bands: <2, 2-5, 5-10, 10-25, >=25
   - Stake 100 per starter in band; Return = 100 * odds (decimal) if finish=1
+  - Rows are streamed with fetchmany (--arraysize per batch), so memory stays flat
+    however many years the DB holds; --stats prints rows/time/peak RSS to stderr
+  - --facts DIR: read the typed per-year starter facts (edb_tool.py build-facts) instead
+    of EveryDB2 and aggregate with NumPy
+  - --ci: bootstrap interval of each band's ROI over its starters (roi_ci.py, NumPy)
+  - --jobs N: shard the starters by Year or JyoCD (--shard) over N worker processes, each
+    with its own read-only connection; the partial BandStats (band_stats.py) are merged
+  - --cache DIR: keep per-year results and the last CSV (report_cache.py); a rerun on an
+    unchanged DB prints the stored table, and after an update only changed years are rescanned
 """
 
+import argparse
 import os
 import sqlite3
-from typing import Dict, Tuple
+import sys
+import time
+from typing import Sequence
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sqlite'))
+from starter_facts import BANDS, band_index, band_totals, load_facts  # noqa: E402
+from roi_ci import LEVEL, N_BOOT, flat_stake_ci, fmt_ci, require_numpy  # noqa: E402
+from band_stats import SHARD_COLUMNS, BandStats, open_ro, print_stats, run_shard_parts, run_shards, shard_values  # noqa: E402
+from report_cache import ReportCache, render, year_fingerprints  # noqa: E402
 
 
 def to_int_or_none(v):
@@ -30,16 +48,34 @@ def to_int_or_none(v):
         return None
 
 
-def main():
-    edb = os.environ.get('EDB_PATH') or os.environ.get('SQLITE_DB') or os.environ.get('EDB')
-    if not edb or not os.path.exists(edb):
-        raise SystemExit('EDB_PATH not set or file not found')
+def band_of(od: float) -> str:
+    if od < 2.0:
+        return '<2'
+    if od < 5.0:
+        return '2-5'
+    if od < 10.0:
+        return '5-10'
+    if od <= 25.0:
+        return '10-25'
+    return '>25'
+
+
+def print_bands(stats: BandStats, args) -> None:
+    # print table sorted by intuitive order
+    print('band,starters,winners,stake,ret,roi' + (',roi_lo,roi_hi' if args.ci else ''))
+    for k in BANDS:
+        stake, ret, starters, winners = stats.get(k)
+        roi = (ret / stake) if stake > 0 else 0.0
+        line = f"{k},{starters},{winners},{stake},{int(ret)},{roi:.3f}"
+        if args.ci:
+            line += ',' + fmt_ci(flat_stake_ci(starters, stats.hits_of(k), n_boot=args.boot, level=args.ci_level))
+        print(line)
 
-    con = sqlite3.connect(edb)
-    cur = con.cursor()
 
+def scan(cur: sqlite3.Cursor, stats: BandStats, cond: str = '1', params: Sequence[str] = ()) -> int:
+    """Stream the confirmed starters matching cond (alias um) into stats; returns rows read."""
     # Join N_UMA_RACE with S_ODDS_TANPUKU for fallback odds
-    sql = """
+    sql = f"""
       SELECT 
         um.Year, um.MonthDay, um.JyoCD, um.RaceNum,
         um.Odds AS Odds10, so.TanOdds AS TanOdds10,
@@ -48,51 +84,122 @@ def main():
       LEFT JOIN S_ODDS_TANPUKU AS so
         ON um.Year = so.Year AND um.MonthDay = so.MonthDay 
        AND um.JyoCD = so.JyoCD AND um.RaceNum = so.RaceNum AND um.Umaban = so.Umaban
-      WHERE um.DataKubun IN ('5','7')
+      WHERE um.DataKubun IN ('5','7') AND {cond}
     """
-    cur.execute(sql)
-
-    # band accumulators: key -> (stake, ret, starters, winners)
-    bands: Dict[str, Tuple[int, float, int, int]] = {}
-
-    def band_of(od: float) -> str:
-        if od < 2.0:
-            return '<2'
-        if od < 5.0:
-            return '2-5'
-        if od < 10.0:
-            return '5-10'
-        if od <= 25.0:
-            return '10-25'
-        return '>25'
-
-    for row in cur.fetchall():
-        Odds10 = to_int_or_none(row[4])
-        TanOdds10 = to_int_or_none(row[5])
-        fin = to_int_or_none(row[6])
-        odds = None
-        if Odds10 is not None and Odds10 > 0:
-            odds = Odds10 / 10.0
-        elif TanOdds10 is not None and TanOdds10 > 0:
-            odds = TanOdds10 / 10.0
-        if odds is None:
-            continue
-        b = band_of(odds)
-        stake, ret, starters, winners = bands.get(b, (0, 0.0, 0, 0))
-        stake += 100
-        starters += 1
-        if fin == 1:
-            ret += odds * 100.0
-            winners += 1
-        bands[b] = (stake, ret, starters, winners)
+    cur.execute(sql, list(params))
+
+    n_rows = 0
+    while True:
+        batch = cur.fetchmany()
+        if not batch:
+            break
+        n_rows += len(batch)
+        for row in batch:
+            Odds10 = to_int_or_none(row[4])
+            TanOdds10 = to_int_or_none(row[5])
+            fin = to_int_or_none(row[6])
+            odds = None
+            if Odds10 is not None and Odds10 > 0:
+                odds = Odds10 / 10.0
+            elif TanOdds10 is not None and TanOdds10 > 0:
+                odds = TanOdds10 / 10.0
+            if odds is None:
+                continue
+            stats.add(band_of(odds), odds, fin)
+    return n_rows
+
+
+def scan_shard(edb: str, shard: str, value: str, arraysize: int, keep_hits: bool):
+    """--jobs worker: one Year/JyoCD on its own read-only connection."""
+    con = open_ro(edb)
+    try:
+        cur = con.cursor()
+        cur.arraysize = arraysize
+        stats = BandStats(keep_hits)
+        n_rows = scan(cur, stats, f'{SHARD_COLUMNS[shard]} = ?', [value])
+        return stats, n_rows
+    finally:
+        con.close()
+
+
+def run_cached(edb: str, args) -> int:
+    """--cache: print the stored CSV, or rescan the changed years and store the new one."""
+    cache = ReportCache(args.cache, 'odds_band', {'ci': args.ci}, [os.path.abspath(__file__)], refresh=args.refresh)
+    output = {'boot': args.boot, 'ci_level': args.ci_level} if args.ci else {}
+    text = cache.cached_csv(edb, output)
+    n_rows = 0
+    if text is None:
+        con = sqlite3.connect(edb)
+        fps = year_fingerprints(con.cursor())
+        con.close()
+        years = cache.stale_years(fps)
+        shards = [(edb, 'year', y, max(1, args.arraysize), args.ci) for y in years]
+        if args.jobs > 1:
+            parts = run_shard_parts(scan_shard, shards, args.jobs)
+        else:
+            parts = [scan_shard(*a) for a in shards]
+        n_rows = sum(n for _, n in parts)
+        stats = cache.merge_years(fps, {y: part for y, (part, _) in zip(years, parts)}, args.ci)
+        text = render(print_bands, stats, args)
+        cache.save(edb, output, text)
+    sys.stdout.write(text)
+    return n_rows
 
-    # print table sorted by intuitive order
-    order = ['<2', '2-5', '5-10', '10-25', '>25']
-    print('band,starters,winners,stake,ret,roi')
-    for k in order:
-        stake, ret, starters, winners = bands.get(k, (0, 0.0, 0, 0))
-        roi = (ret / stake) if stake > 0 else 0.0
-        print(f"{k},{starters},{winners},{stake},{int(ret)},{roi:.3f}")
+
+def main():
+    ap = argparse.ArgumentParser(description='Win ROI by odds band (EveryDB2 SQLite)')
+    ap.add_argument('--arraysize', type=int, default=5000, help='rows per fetchmany batch')
+    ap.add_argument('--stats', action='store_true', help='print rows/elapsed/peak RSS to stderr')
+    ap.add_argument('--facts', help='starter facts directory (edb_tool.py build-facts); EveryDB2 is not read')
+    ap.add_argument('--ci', action='store_true', help='add bootstrap interval columns roi_lo,roi_hi')
+    ap.add_argument('--boot', type=int, default=N_BOOT, help='bootstrap resamples for --ci')
+    ap.add_argument('--ci-level', type=float, default=LEVEL, help='interval coverage for --ci')
+    ap.add_argument('--jobs', type=int, default=1, help='worker processes (shards by --shard)')
+    ap.add_argument('--shard', choices=sorted(SHARD_COLUMNS), default='year', help='how --jobs splits the starters (--cache always uses year)')
+    ap.add_argument('--cache', help='result cache directory (per-year results + last CSV, keyed by DB and parameters)')
+    ap.add_argument('--refresh', action='store_true', help='with --cache: ignore stored results and recompute')
+    args = ap.parse_args()
+    t0 = time.perf_counter()
+    if args.ci:
+        require_numpy()
+
+    stats = BandStats(keep_hits=args.ci)
+
+    if args.facts:
+        f = load_facts(args.facts, ['odds10', 'finish'])
+        won = (f['odds10'] > 0) & (f['finish'] == 1)
+        idx = band_index(f['odds10'][won])
+        for i, (k, totals) in enumerate(zip(BANDS, band_totals(f['odds10'], f['finish']))):
+            stats.add_totals(k, *totals, hits=(f['odds10'][won][idx == i] * 10 if args.ci else ()))
+        print_bands(stats, args)
+        if args.stats:
+            print_stats(len(f['odds10']), t0)
+        return
+
+    edb = os.environ.get('EDB_PATH') or os.environ.get('SQLITE_DB') or os.environ.get('EDB')
+    if not edb or not os.path.exists(edb):
+        raise SystemExit('EDB_PATH not set or file not found')
+
+    if args.cache:
+        n_rows = run_cached(edb, args)
+        if args.stats:
+            print_stats(n_rows, t0)
+        return
+
+    con = sqlite3.connect(edb)
+    cur = con.cursor()
+    cur.arraysize = max(1, args.arraysize)
+
+    if args.jobs > 1:
+        shards = [(edb, args.shard, v, cur.arraysize, args.ci) for v in shard_values(cur, args.shard)]
+        con.close()
+        stats, n_rows = run_shards(scan_shard, shards, args.jobs, args.ci)
+    else:
+        n_rows = scan(cur, stats)
+
+    print_bands(stats, args)
+    if args.stats:
+        print_stats(n_rows, t0)
 
 
 if __name__ == '__main__':
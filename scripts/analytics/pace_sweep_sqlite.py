@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Parameter sweep for the race pace score (展開カウント) rules over EveryDB2 (SQLite).
+
+The score is the one used by the exporter (scripts/sqlite/pace_classifier.py):
+  score = w_b*B + w_c*C + no_a*(A==0) + multi_a*(A>=multi_a_min) + few_b*(B<=few_b_max)
+and a race is flagged (★) when it has any typed horse and round(score, 1) <= cutoff.
+A low score means the front runners should have an easy race, so for every flagged
+race the "front" horses (label B = all corners <= 4 in 2 of the last 3 runs; with
+--target BC also label C) are backed to win with a stake of 100 each.
+
+How it stays fast:
+  - Each confirmed race is reduced once to its (A, B, C) headcounts plus the result
+    of its front horses. Races with the same headcounts fall into the same cell,
+    so the whole history collapses to a few hundred cells.
+  - Every weight/threshold combination is then a (combos x cells) mask, and the
+    totals come from one matrix product (NumPy when installed, plain loops otherwise).
+
+Labels come from the horse_pace_asof table (scripts/sqlite/edb_tool.py pace-asof).
+Without an up-to-date side DB, a temporary one is built for the run.
+
+Output: CSV of the best combinations by ROI (flagged races >= --min-races), and
+the current rules as the first row ("current").
+
+Inputs:
+  - EDB_PATH env var (or --db) pointing to EveryDB2 SQLite DB
+  - EDB_INDEX_PATH env var (or --index-db): side DB with horse_pace_asof (optional)
+
+Example:
+  EDB_PATH=... python3 scripts/analytics/pace_sweep_sqlite.py \\
+    --w-b 0.5,1.0,1.5 --w-c 0,0.5,1.0 --no-a -3.5,-2.5,-1.5 --cutoff 2,3,4,5,6
+"""
+
+import argparse
+import itertools
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Dict, List, Sequence, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sqlite'))
+from edb_tool import build_pace_asof, pace_asof_is_fresh, sqlite_uri  # noqa: E402
+from pace_classifier import CODE_A_ONLY, DEFAULT_WEIGHTS, PaceWeights, np, score_from_counts  # noqa: E402
+
+# per-cell totals, in this order
+STATS = ('races', 'bets', 'wins', 'ret', 'win_races', 'top3_races')
+FRONT_CODES = {'B': (1, 4), 'BC': (1, 2, 4, 5)}
+
+
+def to_int_or_none(v):
+    try:
+        s = str(v).strip()
+        if s == '' or s.upper() == 'NULL':
+            return None
+        return int(float(s))
+    except Exception:
+        return None
+
+
+def to_odds_decimal(odds10, fallback10):
+    o = to_int_or_none(odds10)
+    if o is not None and o > 0:
+        return o / 10.0
+    f = to_int_or_none(fallback10)
+    if f is not None and f > 0:
+        return f / 10.0
+    return None
+
+
+def floats(s: str) -> List[float]:
+    return [float(x) for x in s.split(',') if x.strip()]
+
+
+def ints(s: str) -> List[int]:
+    return [int(x) for x in s.split(',') if x.strip()]
+
+
+def load_cells(cur: sqlite3.Cursor, date_from: str, date_to: str, target: str) -> Dict[Tuple[int, int, int], List[float]]:
+    """Reduce every confirmed race in the range to (A, B, C) -> summed STATS."""
+    cur.execute(
+        """
+        SELECT
+          um.Year, um.MonthDay, um.JyoCD, um.Kaiji, um.Nichiji, um.RaceNum,
+          COALESCE(pa.code, 0), um.KakuteiJyuni, um.Odds, so.TanOdds
+        FROM N_UMA_RACE AS um
+        LEFT JOIN S_ODDS_TANPUKU AS so
+          ON um.Year = so.Year AND um.MonthDay = so.MonthDay
+         AND um.JyoCD = so.JyoCD AND um.RaceNum = so.RaceNum AND um.Umaban = so.Umaban
+        LEFT JOIN idx.horse_pace_asof AS pa
+          ON pa.KettoNum = um.KettoNum
+         AND pa.ymd = CAST(um.Year AS INTEGER)*10000 + CAST(um.MonthDay AS INTEGER)
+        WHERE um.DataKubun IN ('5','7')
+          AND (um.Year, um.MonthDay) >= (?, ?) AND (um.Year, um.MonthDay) <= (?, ?)
+        ORDER BY um.Year, um.MonthDay, um.JyoCD, um.Kaiji, um.Nichiji, um.RaceNum
+        """,
+        (date_from[:4], date_from[4:], date_to[:4], date_to[4:]),
+    )
+    front = FRONT_CODES[target]
+    cells: Dict[Tuple[int, int, int], List[float]] = {}
+
+    def close(counts, res):
+        a, b, c = counts
+        if a + b + c == 0:
+            return  # no typed horse: the score is "invalid" (-3.5) and never flagged
+        cell = cells.setdefault((a, b, c), [0.0] * len(STATS))
+        for i, v in enumerate(res):
+            cell[i] += v
+
+    key = None
+    counts = [0, 0, 0]
+    res = [0.0] * len(STATS)
+    while True:
+        batch = cur.fetchmany(10000)
+        if not batch:
+            break
+        for y, md, jyo, kaiji, nichiji, rno, code, fin, odds10, tan10 in batch:
+            rk = (y, md, jyo, kaiji, nichiji, rno)
+            if rk != key:
+                if key is not None:
+                    close(counts, res)
+                key = rk
+                counts = [0, 0, 0]
+                res = [1.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+            if code >= CODE_A_ONLY:
+                counts[0] += 2 if code == CODE_A_ONLY else 1
+            if code in (1, 4):
+                counts[1] += 1
+            elif code in (2, 5):
+                counts[2] += 1
+            if code in front:
+                f = to_int_or_none(fin)
+                res[1] += 1
+                if f == 1:
+                    odds = to_odds_decimal(odds10, tan10)
+                    res[2] += 1
+                    res[3] += odds * 100.0 if odds else 0.0
+                    res[4] = 1.0
+                if f is not None and 1 <= f <= 3:
+                    res[5] = 1.0
+    if key is not None:
+        close(counts, res)
+    return cells
+
+
+class _Cols:
+    """PaceWeights-like view whose fields are (combos, 1) arrays, so score_from_counts broadcasts."""
+
+    def __init__(self, cols):
+        self.__dict__.update(cols)
+
+
+def evaluate(cells: Dict[Tuple[int, int, int], List[float]], combos: Sequence[PaceWeights]) -> List[List[float]]:
+    """Totals of STATS over the flagged cells, for every combination."""
+    keys = list(cells)
+    if np is not None:
+        a, b, c = (np.array([k[i] for k in keys]) for i in range(3))
+        stats = np.array([cells[k] for k in keys])
+        out = []
+        chunk = max(1, 2_000_000 // max(1, len(keys)))
+        for i in range(0, len(combos), chunk):
+            part = combos[i : i + chunk]
+            # (combos, 1) columns against (1, cells) rows -> (combos, cells)
+            p = {f: np.array([[getattr(w, f)] for w in part]) for f in PaceWeights.__dataclass_fields__}
+            score = score_from_counts(a[None, :], b[None, :], c[None, :], _Cols(p))
+            flagged = np.round(score, 1) <= p['mark_max']
+            out.extend((flagged.astype(float) @ stats).tolist())
+        return out
+
+    out = []
+    for w in combos:
+        tot = [0.0] * len(STATS)
+        for k in keys:
+            if round(score_from_counts(k[0], k[1], k[2], w), 1) <= w.mark_max:
+                for i, v in enumerate(cells[k]):
+                    tot[i] += v
+        out.append(tot)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Sweep pace score weights/thresholds (vectorized over precomputed race cells)')
+    ap.add_argument('--db', default=os.environ.get('EDB_PATH') or os.environ.get('SQLITE_DB') or os.environ.get('EDB'))
+    ap.add_argument('--index-db', default=os.environ.get('EDB_INDEX_PATH'), help='side DB with horse_pace_asof')
+    ap.add_argument('--from', dest='date_from', default='00000000', help='YYYYMMDD (inclusive)')
+    ap.add_argument('--to', dest='date_to', default='99991231', help='YYYYMMDD (inclusive)')
+    ap.add_argument('--target', choices=sorted(FRONT_CODES), default='B', help='front horses to back in flagged races')
+    d = DEFAULT_WEIGHTS
+    ap.add_argument('--w-b', default='0.5,1.0,1.5', help=f'weight per B horse (current {d.b})')
+    ap.add_argument('--w-c', default='0,0.5,1.0', help=f'weight per C horse (current {d.c})')
+    ap.add_argument('--no-a', default='-3.5,-2.5,-1.5', help=f'term when A == 0 (current {d.no_a})')
+    ap.add_argument('--multi-a', default='0.5,1.5,2.5', help=f'term when A >= multi-a-min (current {d.multi_a})')
+    ap.add_argument('--multi-a-min', default='2', help=f'(current {d.multi_a_min})')
+    ap.add_argument('--few-b', default='-2.0,-1.0,0', help=f'term when B <= few-b-max (current {d.few_b})')
+    ap.add_argument('--few-b-max', default='1,2,3', help=f'(current {d.few_b_max})')
+    ap.add_argument('--cutoff', default='2,3,4,5,6', help=f'★ when score <= cutoff (current {d.mark_max})')
+    ap.add_argument('--min-races', type=int, default=100, help='skip combinations flagging fewer races')
+    ap.add_argument('--top', type=int, default=30)
+    args = ap.parse_args()
+
+    if not args.db or not os.path.exists(args.db):
+        raise SystemExit('EDB_PATH not set or file not found')
+
+    con = sqlite3.connect(sqlite_uri(args.db), uri=True)
+    cur = con.cursor()
+    tmpdir = None
+    index_db = args.index_db
+    if index_db and os.path.exists(index_db):
+        cur.execute('ATTACH DATABASE ? AS idx', (index_db,))
+        if not pace_asof_is_fresh(con, args.db):
+            print(f'[WARN] pace-asof table is stale or missing: {index_db}', file=sys.stderr)
+            cur.execute('DETACH DATABASE idx')
+            index_db = None
+    else:
+        index_db = None
+    if index_db is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        index_db = os.path.join(tmpdir.name, 'pace-asof.sqlite')
+        build_pace_asof(index_db, args.db).close()
+        cur.execute('ATTACH DATABASE ? AS idx', (index_db,))
+
+    t0 = time.perf_counter()
+    cells = load_cells(cur, args.date_from, args.date_to, args.target)
+    t1 = time.perf_counter()
+
+    combos = [
+        PaceWeights(b=wb, c=wc, no_a=na, multi_a=ma, multi_a_min=mam, few_b=fb, few_b_max=fbm, mark_max=co)
+        for wb, wc, na, ma, mam, fb, fbm, co in itertools.product(
+            floats(args.w_b), floats(args.w_c), floats(args.no_a), floats(args.multi_a), ints(args.multi_a_min),
+            floats(args.few_b), ints(args.few_b_max), floats(args.cutoff),
+        )
+    ]
+    totals = evaluate(cells, [DEFAULT_WEIGHTS] + combos)
+    t2 = time.perf_counter()
+    print(
+        f'races={int(sum(v[0] for v in cells.values()))} cells={len(cells)} combos={len(combos)} '
+        f'load={t1 - t0:.1f}s sweep={t2 - t1:.2f}s',
+        file=sys.stderr,
+    )
+
+    def row(label: str, w: PaceWeights, tot: List[float]) -> str:
+        races, bets, wins, ret, win_races, top3_races = tot
+        roi = ret / (bets * 100.0) if bets else 0.0
+        hit = win_races / races if races else 0.0
+        top3 = top3_races / races if races else 0.0
+        return (
+            f'{label},{w.b:g},{w.c:g},{w.no_a:g},{w.multi_a:g},{w.multi_a_min},{w.few_b:g},{w.few_b_max},{w.mark_max:g},'
+            f'{int(races)},{int(bets)},{int(wins)},{hit:.3f},{top3:.3f},{roi:.3f}'
+        )
+
+    print('rank,w_b,w_c,no_a,multi_a,multi_a_min,few_b,few_b_max,cutoff,races,bets,wins,win_hit,top3_hit,roi')
+    print(row('current', DEFAULT_WEIGHTS, totals[0]))
+    ranked = sorted(
+        (t for t in zip(combos, totals[1:]) if t[1][0] >= args.min_races),
+        key=lambda t: (t[1][3] / (t[1][1] * 100.0) if t[1][1] else 0.0),
+        reverse=True,
+    )
+    for i, (w, tot) in enumerate(ranked[: args.top], 1):
+        print(row(str(i), w, tot))
+    if tmpdir is not None:
+        con.close()
+        tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
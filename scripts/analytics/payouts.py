@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Decoder for every bet type of EveryDB2 N_HARAI, with constant-time combination lookups.
+
+N_HARAI keeps each bet type as numbered (Kumi/Umaban, Pay) column pairs. Kumi is fixed width:
+2 digits per horse (umaban), 1 digit per frame for 枠連 (e.g. '0203', '020304', '12'), so a
+combination is decoded by slicing, never by a regex. Each race decodes once into
+bet -> {combo: pay}, where combo is a tuple of ints, sorted for the unordered bets.
+
+  pays = RacePayouts.from_row(row, layout)
+  pays.payout('sanrentan', (5, 4, 7))  # -> yen per 100, 0 when it did not pay
+  pays.box('sanrentan', [1, 2, 3, 4, 5, 6])  # -> (120 tickets, return): one dict probe per ticket
+"""
+
+import itertools
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# bet -> (key column prefix, pay column prefix, max n, horses per combo, digits per horse, ordered)
+#  EveryDB2 naming: PayTansyoUmaban{n} / PayTansyoPay{n}, PayUmarenKumi{n} / PayUmarenPay{n}, ...
+BET_TYPES: Dict[str, Tuple[str, str, int, int, int, bool]] = {
+    'win': ('PayTansyoUmaban', 'PayTansyoPay', 3, 1, 2, True),  # 単勝
+    'place': ('PayFukusyoUmaban', 'PayFukusyoPay', 5, 1, 2, True),  # 複勝
+    'wakuren': ('PayWakurenKumi', 'PayWakurenPay', 3, 2, 1, False),  # 枠連
+    'umaren': ('PayUmarenKumi', 'PayUmarenPay', 3, 2, 2, False),  # 馬連
+    'wide': ('PayWideKumi', 'PayWidePay', 7, 2, 2, False),  # ワイド
+    'umatan': ('PayUmatanKumi', 'PayUmatanPay', 6, 2, 2, True),  # 馬単
+    'sanrenpuku': ('PaySanrenpukuKumi', 'PaySanrenpukuPay', 3, 3, 2, False),  # 3連複
+    'sanrentan': ('PaySanrentanKumi', 'PaySanrentanPay', 6, 3, 2, True),  # 3連単
+}
+
+Combo = Tuple[int, ...]
+# (bet, [(key column, pay column), ...]) in SELECT order
+Layout = List[Tuple[str, List[Tuple[str, str]]]]
+
+
+def payout_layout(cur: sqlite3.Cursor, bets: Optional[Iterable[str]] = None) -> Layout:
+    """The numbered column pairs present in N_HARAI for the given bets (default: all)."""
+    cur.execute("PRAGMA table_info(N_HARAI)")
+    cols = {r[1] for r in cur.fetchall()}
+    layout: Layout = []
+    for bet in (bets or BET_TYPES):
+        key, pay, max_n = BET_TYPES[bet][:3]
+        pairs = [(f"{key}{n}", f"{pay}{n}") for n in range(1, max_n + 1) if f"{key}{n}" in cols and f"{pay}{n}" in cols]
+        layout.append((bet, pairs))
+    return layout
+
+
+def layout_columns(layout: Layout) -> List[str]:
+    return [c for _, pairs in layout for pair in pairs for c in pair]
+
+
+def decode_combo(raw, horses: int, width: int) -> Optional[Combo]:
+    """'020304' -> (2, 3, 4); None for blanks, wrong widths and zero horses."""
+    s = str(raw or '').strip()
+    if len(s) != horses * width or not s.isdigit():
+        return None
+    combo = tuple(int(s[i : i + width]) for i in range(0, len(s), width))
+    return combo if all(combo) else None
+
+
+def decode_pay(raw) -> int:
+    s = str(raw or '').strip()
+    return int(s) if s.isdigit() else 0
+
+
+def combo_key(bet: str, combo: Sequence[int]) -> Combo:
+    """Lookup key of a ticket: sorted for the unordered bets."""
+    return tuple(combo) if BET_TYPES[bet][5] else tuple(sorted(combo))
+
+
+def combo_str(combo: Combo) -> str:
+    return '-'.join(str(x) for x in combo)
+
+
+def parse_combo_str(s: str) -> Combo:
+    return tuple(int(x) for x in s.split('-'))
+
+
+class RacePayouts:
+    """bet -> {combo: pay} of one race."""
+
+    __slots__ = ('pays',)
+
+    def __init__(self, pays: Optional[Dict[str, Dict[Combo, int]]] = None):
+        self.pays: Dict[str, Dict[Combo, int]] = pays if pays is not None else {}
+
+    @classmethod
+    def from_row(cls, vals: Sequence, layout: Layout) -> 'RacePayouts':
+        """vals: the layout_columns() values of one N_HARAI row."""
+        pays: Dict[str, Dict[Combo, int]] = {}
+        i = 0
+        for bet, pairs in layout:
+            horses, width, ordered = BET_TYPES[bet][3:]
+            m: Dict[Combo, int] = {}
+            for _ in pairs:
+                combo = decode_combo(vals[i], horses, width)
+                pay = decode_pay(vals[i + 1])
+                i += 2
+                if combo and pay:
+                    m[combo if ordered else tuple(sorted(combo))] = pay
+            pays[bet] = m
+        return cls(pays)
+
+    def table(self, bet: str) -> Dict[Combo, int]:
+        return self.pays.get(bet) or {}
+
+    def payout(self, bet: str, combo: Sequence[int]) -> int:
+        return self.table(bet).get(combo_key(bet, combo), 0)
+
+    def box(self, bet: str, horses: Sequence[int]) -> Tuple[int, int]:
+        """(tickets, total return) of a box over horses: combinations or permutations of the bet's size."""
+        n, _, ordered = BET_TYPES[bet][3:]
+        m = self.table(bet)
+        if ordered:
+            tickets = list(itertools.permutations(horses, n))
+        else:
+            tickets = list(itertools.combinations(sorted(horses), n))  # already the sorted keys
+        return len(tickets), sum(m.get(t, 0) for t in tickets)
+
+    def to_json(self) -> Dict[str, Dict[str, int]]:
+        return {bet: {combo_str(c): p for c, p in m.items()} for bet, m in self.pays.items()}
+
+    @classmethod
+    def from_json(cls, raw: Dict[str, Dict[str, int]]) -> 'RacePayouts':
+        return cls({bet: {parse_combo_str(k): int(v) for k, v in m.items()} for bet, m in raw.items()})
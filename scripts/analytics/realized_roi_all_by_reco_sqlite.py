@@ -8,18 +8,29 @@ Inputs:
   - EDB_PATH env var: path to EveryDB2 SQLite DB
   - Dates via CLI: YYYY-MM-DD (space-separated)
 
-Reco source: data/days/reco-YYYY-MM-DD.json or public/data/reco-YYYY-MM-DD.json
+Reco source: the packed store data/days/reco.pack (reco_store.py, --reco-store), else
+data/days/reco-YYYY-MM-DD.json or public/data/reco-YYYY-MM-DD.json
 Stake per pick: 100
 WIN return: odds * 100 if finish=1 (fallback via N_UMA_RACE/S_ODDS_TANPUKU similar to prior script)
 PLACE return: payout from N_HARAI (fukusho)
 UMAREN return: payout from N_HARAI (umaren) for each pair in quinella_box
+
+Payouts for all requested dates are loaded with one query (payout columns only) and decoded
+once per race by payouts.py (fixed-width Kumi slicing, dict lookups per ticket). --cache DIR keeps the decoded payouts per date (harai-YYYY-MM-DD.json), each
+stamped with that date's own N_HARAI rows (count, DataKubun range, payout checksum, from one
+grouped query), so a daily DB update only re-reads the dates whose payouts changed.
+--ci adds a bootstrap interval of each row's ROI, resampling races (roi_ci.py, NumPy).
 """
 
+import argparse
 import json
 import os
 import sqlite3
-import re
-from typing import Dict, Tuple, List, Any
+from typing import Dict, Tuple, List, Sequence
+
+from payouts import RacePayouts, layout_columns, payout_layout
+from reco_store import DEFAULT_STORE, load_recos
+from roi_ci import LEVEL, N_BOOT, fmt_ci, require_numpy, unit_ci
 
 NAME_TO_JYO = {
     "札幌": "01", "函館": "02", "福島": "03", "新潟": "04", "東京": "05",
@@ -37,19 +48,6 @@ def to_int_or_none(v):
         return None
 
 
-def digits_int(v: Any) -> int | None:
-    s = str(v or '').strip()
-    if not s:
-        return None
-    ds = re.sub(r"\D", "", s)
-    if not ds:
-        return None
-    try:
-        return int(ds)
-    except Exception:
-        return None
-
-
 def to_odds_decimal(odds10, fallback10):
     o = to_int_or_none(odds10)
     if o is not None and o > 0:
@@ -60,90 +58,158 @@ def to_odds_decimal(odds10, fallback10):
     return None
 
 
-def read_reco(date_iso: str):
-    p = os.path.join('data', 'days', f'reco-{date_iso}.json')
-    if not os.path.exists(p):
-        p2 = os.path.join('public', 'data', f'reco-{date_iso}.json')
-        if os.path.exists(p2):
-            p = p2
-        else:
-            raise FileNotFoundError(p)
-    with open(p, 'r', encoding='utf-8') as f:
-        return json.load(f)
+MARKETS = ('win', 'place', 'umaren')  # bet types of the reco picks (payouts.BET_TYPES names)
+DATE_CHUNK = 400  # dates per IN (VALUES ...) query
+CACHE_FORMAT = 3  # harai-*.json layout; older files are re-read from the DB
+
+
+def cache_path(cache_dir: str, date_iso: str) -> str:
+    return os.path.join(cache_dir, f'harai-{date_iso}.json')
+
+
+def date_stamps(cur: sqlite3.Cursor, dates: Sequence[str], layout) -> Dict[str, List]:
+    """date_iso -> [rows, min DataKubun, max DataKubun, payout checksum] of its N_HARAI rows.
+
+    One grouped query per DATE_CHUNK dates; the checksum weights each payout column by its
+    position so a payout moving between columns still changes it. Dates without rows are absent.
+    """
+    pays = [pay for _, pairs in layout for _, pay in pairs]
+    sums = ', '.join(f'total(CAST({c} AS INTEGER))' for c in pays) or '0'
+    stamps: Dict[str, List] = {}
+    for i in range(0, len(dates), DATE_CHUNK):
+        chunk = dates[i : i + DATE_CHUNK]
+        params: List[str] = []
+        for d in chunk:
+            params += [d[0:4], d[5:7] + d[8:10]]
+        cur.execute(
+            f"""
+            SELECT Year, MonthDay, COUNT(*), MIN(DataKubun), MAX(DataKubun), {sums}
+            FROM N_HARAI WHERE (Year, MonthDay) IN (VALUES {','.join(['(?,?)'] * len(chunk))})
+            GROUP BY Year, MonthDay
+            """,
+            params,
+        )
+        for y, md, n, lo, hi, *totals in cur.fetchall():
+            stamps[f'{y}-{md[:2]}-{md[2:]}'] = [n, lo, hi, sum((k + 1) * t for k, t in enumerate(totals))]
+    return stamps
 
 
-def normalize_umaren_code(raw: Any) -> str | None:
-    s = str(raw or '').strip()
-    if not s:
+def read_cached(cache_dir: str, date_iso: str, stamp: List) -> Dict[Tuple[str, str], RacePayouts] | None:
+    try:
+        with open(cache_path(cache_dir, date_iso), 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+    except (OSError, ValueError):
         return None
-    # pattern: 1-2, 01=02, 1 / 2
-    import re
-    m = re.search(r"(\d{1,2})\D+(\d{1,2})", s)
-    if m:
-        a = int(m.group(1)); b = int(m.group(2))
-        if a>0 and b>0:
-            x,y = sorted([a,b])
-            return f"{x:02d}{y:02d}"
-    # 4 digits: 0102, 1203
-    digits = re.sub(r"\D", "", s)
-    if len(digits) == 4:
-        a = int(digits[:2]); b = int(digits[2:])
-        if a>0 and b>0:
-            x,y = sorted([a,b])
-            return f"{x:02d}{y:02d}"
-    # 3 digits: 112 -> 1 and 12
-    if len(digits) == 3:
-        a = int(digits[:1]); b = int(digits[1:])
-        if a>0 and b>0:
-            x,y = sorted([a,b])
-            return f"{x:02d}{y:02d}"
-    return None
+    if raw.get('stamp') != stamp or raw.get('format') != CACHE_FORMAT:
+        return None  # the date's payouts changed since (e.g. a partly loaded day)
+    out: Dict[Tuple[str, str], RacePayouts] = {}
+    for rk, pays in raw['races'].items():
+        jyo, no = rk.split('-')
+        out[(jyo, no)] = RacePayouts.from_json(pays)
+    return out
+
+
+def write_cached(cache_dir: str, date_iso: str, stamp: List, races: Dict[Tuple[str, str], RacePayouts]) -> None:
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(cache_dir, date_iso)
+    tmp = f'{path}.tmp-{os.getpid()}'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        body = {f'{jyo}-{no}': pays.to_json() for (jyo, no), pays in races.items()}
+        json.dump({'stamp': stamp, 'format': CACHE_FORMAT, 'races': body}, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def load_payout_index(
+    cur: sqlite3.Cursor, dates: Sequence[str], cache_dir: str | None = None
+) -> Dict[str, Dict[Tuple[str, str], RacePayouts]]:
+    """date_iso -> (JyoCD, RaceNum) -> decoded payouts, for all dates in one query per DATE_CHUNK dates.
+
+    Only the payout columns are selected and each race is decoded once. With cache_dir, dates
+    whose cached stamp equals their current one (date_stamps) are not queried, and dates that
+    have payouts are written back (harai-YYYY-MM-DD.json).
+    """
+    dates = list(dict.fromkeys(dates))
+    layout = payout_layout(cur, MARKETS)
+    stamps = date_stamps(cur, dates, layout) if cache_dir else {}
+    index: Dict[str, Dict[Tuple[str, str], RacePayouts]] = {}
+    todo: List[str] = []
+    for d in dates:
+        cached = read_cached(cache_dir, d, stamps.get(d)) if cache_dir and d in stamps else None
+        if cached is not None:
+            index[d] = cached
+        else:
+            index[d] = {}
+            todo.append(d)
+    if not todo:
+        return index
+
+    cols = layout_columns(layout)
+    select = ', '.join(['Year', 'MonthDay', 'JyoCD', 'RaceNum'] + cols)
+    for i in range(0, len(todo), DATE_CHUNK):
+        chunk = todo[i : i + DATE_CHUNK]
+        params: List[str] = []
+        for d in chunk:
+            params += [d[0:4], d[5:7] + d[8:10]]
+        cur.execute(
+            f"SELECT {select} FROM N_HARAI WHERE (Year, MonthDay) IN (VALUES {','.join(['(?,?)'] * len(chunk))})",
+            params,
+        )
+        for row in cur.fetchall():
+            y, md, jyo, no = row[:4]
+            races = index.get(f'{y}-{md[:2]}-{md[2:]}')
+            if races is None or (jyo, no) in races:
+                continue  # first row per race, like the old LIMIT 1
+            races[(jyo, no)] = RacePayouts.from_row(row[4:], layout)
+    if cache_dir:
+        for d in todo:
+            if index[d] and d in stamps:
+                write_cached(cache_dir, d, stamps[d], index[d])
+    return index
 
 
 def main():
-    edb = os.environ.get('EDB_PATH') or os.environ.get('SQLITE_DB') or os.environ.get('EDB')
-    if not edb or not os.path.exists(edb):
-        raise SystemExit('EDB_PATH not set or file not found')
-    import sys
-    dates = [d for d in sys.argv[1:] if d and len(d) == 10]
+    ap = argparse.ArgumentParser(description='Realized WIN/PLACE/UMAREN ROI of reco picks (EveryDB2 N_HARAI)')
+    ap.add_argument('dates', nargs='*', help='YYYY-MM-DD')
+    ap.add_argument('--reco-store', default=DEFAULT_STORE, help='packed reco store (reco_store.py); dates it lacks use reco-*.json')
+    ap.add_argument('--cache', help='directory for per-date decoded payouts (harai-YYYY-MM-DD.json)')
+    ap.add_argument('--ci', action='store_true', help='add bootstrap interval columns roi_lo,roi_hi')
+    ap.add_argument('--boot', type=int, default=N_BOOT, help='bootstrap resamples for --ci')
+    ap.add_argument('--ci-level', type=float, default=LEVEL, help='interval coverage for --ci')
+    args = ap.parse_args()
+    if args.ci:
+        require_numpy()
+    dates = [d for d in args.dates if d and len(d) == 10]
     if not dates:
         raise SystemExit('Usage: realized_roi_all_by_reco_sqlite.py YYYY-MM-DD [YYYY-MM-DD ...]')
 
+    # recos first: a missing one fails before any DB work
+    recos = load_recos(dates, args.reco_store)
+    missing = [d for d in dates if d not in recos]
+    if missing:
+        raise FileNotFoundError(os.path.join('data', 'days', f'reco-{missing[0]}.json'))
+
+    edb = os.environ.get('EDB_PATH') or os.environ.get('SQLITE_DB') or os.environ.get('EDB')
+    if not edb or not os.path.exists(edb):
+        raise SystemExit('EDB_PATH not set or file not found')
     con = sqlite3.connect(edb)
-    cur = con.cursor()
-
-    # Preload N_HARAI column names
-    cur.execute("PRAGMA table_info(N_HARAI)")
-    cols = [r[1] for r in cur.fetchall()]
-    # Column naming (EveryDB2):
-    #  - 複勝: PayFukusyoUmaban{n} / PayFukusyoPay{n} (n=1..5)
-    #  - 馬連: PayUmarenKumi{n} / PayUmarenPay{n}   (n=1..3)
-    import re
-    def numbered_pairs(prefix_key: str, prefix_pay: str, max_n: int) -> List[tuple[str,str]]:
-        pairs: List[tuple[str,str]] = []
-        for n in range(1, max_n+1):
-            a = f"{prefix_key}{n}"
-            b = f"{prefix_pay}{n}"
-            if a in cols and b in cols:
-                pairs.append((a,b))
-        return pairs
-    # WIN (tansyo), PLACE (fukusyo), UMAREN (umaren)
-    tan_pairs = numbered_pairs('PayTansyoUmaban', 'PayTansyoPay', 3)
-    fuku_pairs = numbered_pairs('PayFukusyoUmaban', 'PayFukusyoPay', 5)
-    uma_pairs = numbered_pairs('PayUmarenKumi', 'PayUmarenPay', 3)
-
-    print('date,market,stake,ret,roi')
+    payouts = load_payout_index(con.cursor(), dates, args.cache)
+
+    def ci_cols(units: List[List[float]]) -> str:
+        if not args.ci:
+            return ''
+        return ',' + fmt_ci(unit_ci([u[0] for u in units], [u[1] for u in units], n_boot=args.boot, level=args.ci_level))
+
+    print('date,market,stake,ret,roi' + (',roi_lo,roi_hi' if args.ci else ''))
     total = { 'win': {'stake':0,'ret':0.0}, 'place': {'stake':0,'ret':0.0}, 'umaren': {'stake':0,'ret':0.0} }
+    # market -> [[stake, ret] per race with a stake], for --ci
+    total_units: Dict[str, List[List[float]]] = {'win': [], 'place': [], 'umaren': []}
 
     for date_iso in dates:
-        reco = read_reco(date_iso)
-        y = int(date_iso[:4])
-        mm = int(date_iso[5:7])
-        dd = int(date_iso[8:10])
-        y_str = f"{y:04d}"
-        md_str = f"{mm:02d}{dd:02d}"
+        reco = recos[date_iso]
+        races = payouts.get(date_iso, {})
 
         sums = { 'win': {'stake':0,'ret':0.0}, 'place': {'stake':0,'ret':0.0}, 'umaren': {'stake':0,'ret':0.0} }
+        units: Dict[str, List[List[float]]] = {'win': [], 'place': [], 'umaren': []}
 
         for r in reco.get('races', []):
             track = str(r.get('track','')).strip()
@@ -151,88 +217,38 @@ def main():
             if not jyo:
                 continue
             no = to_int_or_none(r.get('no')) or 0
-            # load payout row
-            cur.execute(
-                "SELECT * FROM N_HARAI WHERE Year=? AND MonthDay=? AND JyoCD=? AND RaceNum=? LIMIT 1",
-                (y_str, md_str, str(jyo).zfill(2), f"{int(no):02d}")
-            )
-            row = cur.fetchone()
-            desc = [d[0] for d in cur.description] if cur.description else []
-            row_map = { desc[i]: row[i] for i in range(len(desc)) } if row else {}
-
-            # WIN: stake from reco picks, ret from N_HARAI tansyo payouts
-            win_list = r.get('win') or []
-            for _ in win_list:
-                sums['win']['stake'] += 100
-            if row_map and win_list:
-                tan_pay_map: Dict[int,int] = {}
-                for a,b in tan_pairs:
-                    ua = row_map.get(a)
-                    pb = row_map.get(b)
-                    u = digits_int(ua)
-                    p = digits_int(pb)
-                    if u and p:
-                        tan_pay_map[u] = p
-                for umaban in win_list:
-                    p = tan_pay_map.get(int(umaban))
-                    if p:
-                        sums['win']['ret'] += float(p)
-
-            # PLACE: stake from reco picks, ret from N_HARAI when available
-            pl = r.get('place') or []
-            # stake increments regardless of payout availability
-            for _ in pl:
-                sums['place']['stake'] += 100
-            if row_map and pl:
-                # build map horse->payout from fukusho pairs
-                fuku_pay_map: Dict[int,int] = {}
-                for a,b in fuku_pairs:
-                    ua = row_map.get(a)
-                    pb = row_map.get(b)
-                    u = digits_int(ua)
-                    p = digits_int(pb)
-                    if u and p:
-                        fuku_pay_map[u] = p
-                for umaban in pl:
-                    p = fuku_pay_map.get(int(umaban))
-                    if p:
-                        sums['place']['ret'] += float(p)
-
-            # UMAREN: box pairs to payout mapping
+            pays = races.get((str(jyo).zfill(2), f"{int(no):02d}")) or RacePayouts()
+            before = {mk: (sums[mk]['stake'], sums[mk]['ret']) for mk in sums}
+
+            # WIN / PLACE: stake per pick regardless of payout availability
+            for mk in ('win', 'place'):
+                picks = r.get(mk) or []
+                sums[mk]['stake'] += 100 * len(picks)
+                for umaban in picks:
+                    sums[mk]['ret'] += pays.payout(mk, (int(umaban),))
+
+            # UMAREN: every pair of the box
             box = r.get('quinella_box') or []
             if isinstance(box, list) and len(box) >= 2:
-                import itertools
-                pairs = list(itertools.combinations([int(x) for x in box], 2))
-                # stake increments for all pairs
-                sums['umaren']['stake'] += 100 * len(pairs)
-                # build payout map if row exists
-                uma_pay_map: Dict[str,int] = {}
-                if row_map:
-                    for a,b in uma_pairs:
-                        ra = row_map.get(a)
-                        rb = row_map.get(b)
-                        code = normalize_umaren_code(ra)
-                        pay = digits_int(rb)
-                        if code and pay:
-                            uma_pay_map[code] = pay
-                # add returns for hit pairs (map may be empty)
-                for a,b in pairs:
-                    x,y = sorted([a,b])
-                    code = f"{x:02d}{y:02d}"
-                    pay = uma_pay_map.get(code)
-                    if pay:
-                        sums['umaren']['ret'] += float(pay)
+                tickets, ret = pays.box('umaren', [int(x) for x in box])
+                sums['umaren']['stake'] += 100 * tickets
+                sums['umaren']['ret'] += ret
+
+            for mk, (st0, ret0) in before.items():
+                if sums[mk]['stake'] > st0:
+                    units[mk].append([sums[mk]['stake'] - st0, sums[mk]['ret'] - ret0])
 
         for mk in ['win','place','umaren']:
             total[mk]['stake'] += sums[mk]['stake']
             total[mk]['ret'] += sums[mk]['ret']
+            total_units[mk].extend(units[mk])
             roi = (sums[mk]['ret']/sums[mk]['stake']) if sums[mk]['stake']>0 else 0.0
-            print(f"{date_iso},{mk},{sums[mk]['stake']},{int(sums[mk]['ret'])},{roi:.3f}")
+            print(f"{date_iso},{mk},{sums[mk]['stake']},{int(sums[mk]['ret'])},{roi:.3f}" + ci_cols(units[mk]))
 
     # totals
     for mk in ['win','place','umaren']:
         roi = (total[mk]['ret']/total[mk]['stake']) if total[mk]['stake']>0 else 0.0
-        print(f"TOTAL,{mk},{total[mk]['stake']},{int(total[mk]['ret'])},{roi:.3f}")
+        print(f"TOTAL,{mk},{total[mk]['stake']},{int(total[mk]['ret'])},{roi:.3f}" + ci_cols(total_units[mk]))
 
 
 if __name__ == '__main__':
@@ -8,16 +8,27 @@ Inputs:
   - EDB_PATH env var: path to EveryDB2 SQLite database
   - Dates via CLI: YYYY-MM-DD (space-separated)
 
-Reads reco from data/days/reco-YYYY-MM-DD.json and evaluates WIN picks.
+Reads reco from the packed store data/days/reco.pack (reco_store.py, --reco-store), else
+data/days/reco-YYYY-MM-DD.json, and evaluates WIN picks.
 Stake: 100 per WIN pick. Return: odds*100 if KakuteiJyuni == 1, else 0.
 Odds source: N_UMA_RACE.Odds (10x) fallback S_ODDS_TANPUKU.TanOdds (10x).
+All picks of all dates are resolved at once: one join of a temp pick table against
+N_UMA_RACE/S_ODDS_TANPUKU, or with --facts DIR, sorted-key searches over the starter
+facts (edb_tool.py build-facts).
+--ci adds a bootstrap interval of each row's ROI, resampling races (picks of one race move together).
 """
 
-import json
+import argparse
 import os
 import sqlite3
+import sys
 from typing import Dict, Tuple, List
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sqlite'))
+from starter_facts import load_facts, np  # noqa: E402
+from roi_ci import LEVEL, N_BOOT, fmt_ci, require_numpy, unit_ci  # noqa: E402
+from reco_store import DEFAULT_STORE, iter_picks, load_recos  # noqa: E402
+
 NAME_TO_JYO = {
     "札幌": "01", "函館": "02", "福島": "03", "新潟": "04", "東京": "05",
     "中山": "06", "中京": "07", "京都": "08", "阪神": "09", "小倉": "10",
@@ -44,89 +55,162 @@ def to_odds_decimal(odds10, fallback10):
     return None
 
 
-def read_reco(date_iso: str):
-    p = os.path.join('data', 'days', f'reco-{date_iso}.json')
-    if not os.path.exists(p):
-        # fallback to public if needed
-        p2 = os.path.join('public', 'data', f'reco-{date_iso}.json')
-        if os.path.exists(p2):
-            p = p2
-        else:
-            raise FileNotFoundError(p)
-    with open(p, 'r', encoding='utf-8') as f:
-        return json.load(f)
+def race_key(ymd, jyo, no, umaban):
+    # one int64 per starter: YYYYMMDD JJ RR UU
+    return ((ymd * 100 + jyo) * 100 + no) * 100 + umaban
+
+
+class FactsLookup:
+    """(date, JyoCD, race, umaban) -> (finish, odds10) over the starter facts of the given years."""
+
+    def __init__(self, facts_dir: str, years):
+        f = load_facts(facts_dir, ['ymd', 'jyo', 'race_no', 'umaban', 'finish', 'odds10'], years)
+        keys = race_key(f['ymd'].astype(np.int64), f['jyo'], f['race_no'], f['umaban'])
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.finish = f['finish'][order]
+        self.odds10 = f['odds10'][order]
+
+    def get(self, ymd: int, jyo: str, no: int, umaban: int):
+        k = race_key(ymd, int(jyo), no, umaban)
+        i = int(np.searchsorted(self.keys, k))
+        if i >= len(self.keys) or self.keys[i] != k:
+            return None
+        return int(self.finish[i]), int(self.odds10[i])
+
+
+def resolve_picks(con: sqlite3.Connection, picks) -> Dict[Tuple[str, str, str, str, str], Tuple]:
+    """All picks in one join: the distinct keys go to a temp table keyed like N_UMA_RACE.
+
+    Every join column is compared as stored text, so each pick is an index search on
+    N_UMA_RACE (Year, MonthDay, JyoCD, ..., Umaban). CROSS JOIN keeps the pick table as the
+    outer loop; the planner has no statistics for it and would otherwise scan N_UMA_RACE.
+    """
+    cur = con.cursor()
+    cur.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS reco_pick (
+          Year TEXT, MonthDay TEXT, JyoCD TEXT, RaceNum TEXT, Umaban TEXT,
+          PRIMARY KEY (Year, MonthDay, JyoCD, RaceNum, Umaban)
+        ) WITHOUT ROWID
+        """
+    )
+    cur.execute("DELETE FROM temp.reco_pick")
+    cur.executemany(
+        "INSERT OR IGNORE INTO temp.reco_pick VALUES (?, ?, ?, ?, ?)",
+        (k for keys in picks.values() if keys for k in keys),
+    )
+    cur.execute(
+        """
+        SELECT p.Year, p.MonthDay, p.JyoCD, p.RaceNum, p.Umaban,
+               um.KakuteiJyuni, um.Odds, so.TanOdds
+        FROM temp.reco_pick AS p
+        CROSS JOIN N_UMA_RACE AS um
+          ON um.Year = p.Year AND um.MonthDay = p.MonthDay
+         AND um.JyoCD = p.JyoCD AND um.RaceNum = p.RaceNum AND um.Umaban = p.Umaban
+         AND um.DataKubun IN ('5','7')
+        LEFT JOIN S_ODDS_TANPUKU AS so
+          ON um.Year = so.Year AND um.MonthDay = so.MonthDay
+         AND um.JyoCD = so.JyoCD AND um.RaceNum = so.RaceNum AND um.Umaban = so.Umaban
+        """
+    )
+    out: Dict[Tuple[str, str, str, str, str], Tuple] = {}
+    for y, md, jyo, no, umaban, fin, odds10, tan10 in cur.fetchall():
+        out.setdefault((y, md, jyo, no, umaban), (to_int_or_none(fin), to_odds_decimal(odds10, tan10)))
+    cur.execute("DELETE FROM temp.reco_pick")
+    return out
+
+
+def resolve_picks_facts(facts_dir: str, picks) -> Dict[Tuple[str, str, str, str, str], Tuple]:
+    keys = {k for ks in picks.values() if ks for k in ks}
+    facts = FactsLookup(facts_dir, sorted({int(k[0]) for k in keys}))
+    out: Dict[Tuple[str, str, str, str, str], Tuple] = {}
+    for k in keys:
+        hit = facts.get(int(k[0] + k[1]), k[2], int(k[3]), int(k[4]))
+        if hit:
+            out[k] = (hit[0], hit[1] / 10.0 if hit[1] > 0 else None)
+    return out
 
 
 def main():
-    edb = os.environ.get('EDB_PATH') or os.environ.get('SQLITE_DB') or os.environ.get('EDB')
-    if not edb or not os.path.exists(edb):
-        raise SystemExit('EDB_PATH not set or file not found')
-    import sys
-    dates = [d for d in sys.argv[1:] if d and len(d) == 10]
+    ap = argparse.ArgumentParser(description='Realized WIN ROI of reco picks (EveryDB2 SQLite)')
+    ap.add_argument('dates', nargs='*', help='YYYY-MM-DD')
+    ap.add_argument('--reco-store', default=DEFAULT_STORE, help='packed reco store (reco_store.py); dates it lacks use reco-*.json')
+    ap.add_argument('--facts', help='starter facts directory (edb_tool.py build-facts); EveryDB2 is not read')
+    ap.add_argument('--ci', action='store_true', help='add bootstrap interval columns roi_lo,roi_hi')
+    ap.add_argument('--boot', type=int, default=N_BOOT, help='bootstrap resamples for --ci')
+    ap.add_argument('--ci-level', type=float, default=LEVEL, help='interval coverage for --ci')
+    args = ap.parse_args()
+    if args.ci:
+        require_numpy()
+    dates = [d for d in args.dates if d and len(d) == 10]
     if not dates:
         raise SystemExit('Usage: realized_roi_win_by_reco_sqlite.py YYYY-MM-DD [YYYY-MM-DD ...]')
 
-    con = sqlite3.connect(edb)
-    cur = con.cursor()
-
-    print('date,stake,ret,roi')
+    # every WIN pick of every date: date -> [(Year, MonthDay, JyoCD, RaceNum, Umaban), ...] (None: no reco file)
+    recos = load_recos(dates, args.reco_store)
+    picks: Dict[str, List[Tuple[str, str, str, str, str]] | None] = {d: ([] if d in recos else None) for d in dates}
+    for date_iso, track, no, r in iter_picks(recos):
+        y = date_iso[0:4]
+        md = date_iso[5:7] + date_iso[8:10]
+        jyo = NAME_TO_JYO.get(track)
+        if not jyo:
+            continue
+        no = to_int_or_none(no) or 0
+        win_list = r.get('win') or []
+        if not isinstance(win_list, list):
+            continue
+        for umaban in win_list:
+            picks[date_iso].append((y, md, jyo, f"{int(no):02d}", f"{int(umaban):02d}"))
+
+    # (Year, MonthDay, JyoCD, RaceNum, Umaban) -> (finish, odds decimal or None)
+    if args.facts:
+        results = resolve_picks_facts(args.facts, picks)
+    else:
+        edb = os.environ.get('EDB_PATH') or os.environ.get('SQLITE_DB') or os.environ.get('EDB')
+        if not edb or not os.path.exists(edb):
+            raise SystemExit('EDB_PATH not set or file not found')
+        con = sqlite3.connect(edb)
+        results = resolve_picks(con, picks)
+
+    def ci_cols(units: List[List[float]]) -> str:
+        if not args.ci:
+            return ''
+        return ',' + fmt_ci(unit_ci([u[0] for u in units], [u[1] for u in units], n_boot=args.boot, level=args.ci_level))
+
+    print('date,stake,ret,roi' + (',roi_lo,roi_hi' if args.ci else ''))
     total_stake = 0
     total_ret = 0.0
+    all_units: List[List[float]] = []
     for date_iso in dates:
-        try:
-            reco = read_reco(date_iso)
-        except FileNotFoundError:
-            print(f'{date_iso},0,0,0.000')
+        keys = picks[date_iso]
+        if keys is None:
+            print(f'{date_iso},0,0,0.000' + (',,' if args.ci else ''))
             continue
-        y = date_iso[0:4]
-        mm = date_iso[5:7]
-        dd = date_iso[8:10]
-        ymd_num = int(y) * 10000 + int(mm + dd)
 
         stake = 0
         ret = 0.0
-
-        for r in reco.get('races', []):
-            track = str(r.get('track', '')).strip()
-            jyo = NAME_TO_JYO.get(track)
-            if not jyo:
-                continue
-            no = to_int_or_none(r.get('no')) or 0
-            win_list = r.get('win') or []
-            if not isinstance(win_list, list):
+        races: Dict[Tuple[str, ...], List[float]] = {}  # race -> [stake, ret]
+        for k in keys:
+            stake += 100
+            unit = races.setdefault(k[:4], [0.0, 0.0])
+            unit[0] += 100
+            hit = results.get(k)
+            if not hit:
                 continue
-            for umaban in win_list:
-                stake += 100
-                # fetch finish and odds
-                cur.execute(
-                    """
-                    SELECT um.KakuteiJyuni, um.Odds, so.TanOdds
-                    FROM N_UMA_RACE AS um
-                    LEFT JOIN S_ODDS_TANPUKU AS so
-                      ON um.Year = so.Year AND um.MonthDay = so.MonthDay
-                     AND um.JyoCD = so.JyoCD AND um.RaceNum = so.RaceNum AND um.Umaban = so.Umaban
-                    WHERE CAST(um.Year AS INTEGER) = ? AND CAST(um.MonthDay AS INTEGER) = ?
-                      AND um.JyoCD = ? AND CAST(um.RaceNum AS INTEGER) = ? AND CAST(um.Umaban AS INTEGER) = ?
-                      AND um.DataKubun IN ('5','7')
-                    LIMIT 1
-                    """,
-                    (int(y), int(mm + dd), jyo, int(no), int(umaban)),
-                )
-                row = cur.fetchone()
-                if not row:
-                    continue
-                fin = to_int_or_none(row[0])
-                odds = to_odds_decimal(row[1], row[2])
-                if fin == 1 and odds is not None:
-                    ret += odds * 100.0
+            fin, odds = hit
+            if fin == 1 and odds is not None:
+                ret += odds * 100.0
+                unit[1] += odds * 100.0
 
         total_stake += stake
         total_ret += ret
+        all_units.extend(races.values())
         roi = (ret / stake) if stake > 0 else 0.0
-        print(f"{date_iso},{stake},{int(ret)},{roi:.3f}")
+        print(f"{date_iso},{stake},{int(ret)},{roi:.3f}" + ci_cols(list(races.values())))
 
     total_roi = (total_ret / total_stake) if total_stake > 0 else 0.0
-    print(f"TOTAL,{total_stake},{int(total_ret)},{total_roi:.3f}")
+    print(f"TOTAL,{total_stake},{int(total_ret)},{total_roi:.3f}" + ci_cols(all_units))
 
 
 if __name__ == '__main__':
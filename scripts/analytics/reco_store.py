@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Packed store of the daily recommendations (reco), instead of one reco-YYYY-MM-DD.json per date.
+
+Layout (shared with build-ev.ts, which stores every day it writes):
+  - data/days/reco.pack: one compact JSON document per day ({"date", "races": [...]}), one per
+    line. A new date is appended; a date already stored is replaced by rewriting the pack in
+    date order (unchanged records are left alone), so the pack holds one copy per date
+  - data/days/reco.pack.idx.json: {"version": 2, "size": pack bytes, "sha256": pack digest,
+    "dates": {"YYYY-MM-DD": [offset, length]}}, replaced atomically after the pack
+
+Readers memory-map the pack and read the records of the requested dates in offset order;
+records closer than GAP bytes are taken in one slice, so a date range (appended in date
+order) is one sequential read instead of a file open + parse per date.
+The index only applies to the pack whose size and digest it records: an index paired with
+another pack (e.g. only one of the two files copied or committed) is ignored with a warning
+and the readers use reco-*.json.
+
+  python3 scripts/analytics/reco_store.py pack      # (re)build from data/days/reco-*.json
+  python3 scripts/analytics/reco_store.py append 2024-06-01 2024-06-02
+  python3 scripts/analytics/reco_store.py compact   # rewrite in date order
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_STORE = os.path.join('data', 'days', 'reco.pack')
+DAYS_DIR = os.path.join('data', 'days')
+INDEX_VERSION = 2
+GAP = 1 << 20  # records closer than this are read in one slice
+
+Reco = Dict[str, Any]
+
+
+def index_path(store: str) -> str:
+    return f'{store}.idx.json'
+
+
+def reco_json_path(date_iso: str) -> Optional[str]:
+    """data/days/reco-YYYY-MM-DD.json, else public/data/reco-YYYY-MM-DD.json, else None."""
+    for p in (os.path.join(DAYS_DIR, f'reco-{date_iso}.json'), os.path.join('public', 'data', f'reco-{date_iso}.json')):
+        if os.path.exists(p):
+            return p
+    return None
+
+
+def read_reco_json(date_iso: str) -> Reco:
+    p = reco_json_path(date_iso)
+    if p is None:
+        raise FileNotFoundError(os.path.join(DAYS_DIR, f'reco-{date_iso}.json'))
+    with open(p, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class PackMismatch(ValueError):
+    """The index is missing, of another version, or records another pack's size/digest."""
+
+
+def read_index(store: str, data) -> Dict[str, List[int]]:
+    """The date index of store, checked against data (the pack's bytes)."""
+    path = index_path(store)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        raise PackMismatch(f'{path}: missing') from None
+    if raw.get('version') != INDEX_VERSION:
+        raise PackMismatch(f'{path}: unsupported version {raw.get("version")!r}')
+    if raw.get('size') != len(data) or raw.get('sha256') != hashlib.sha256(data).hexdigest():
+        raise PackMismatch(f'{path}: does not match {store}')
+    return raw['dates']
+
+
+def write_index(store: str, dates: Dict[str, List[int]]) -> None:
+    with open(store, 'rb') as f:
+        data = f.read()
+    path = index_path(store)
+    tmp = f'{path}.tmp-{os.getpid()}'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(
+            {
+                'version': INDEX_VERSION,
+                'size': len(data),
+                'sha256': hashlib.sha256(data).hexdigest(),
+                'dates': dict(sorted(dates.items())),
+            },
+            f,
+            separators=(',', ':'),
+        )
+    os.replace(tmp, path)
+
+
+def encode_day(reco: Reco) -> bytes:
+    return (json.dumps(reco, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def store_days(store: str, days: Iterable[Tuple[str, Reco]]) -> int:
+    """Store (date, reco) records; returns the number written (unchanged records are skipped).
+
+    New dates are appended. When a date is already stored with other content, the pack is
+    rewritten in date order with the new record in its place, so it never holds two copies.
+    Raises PackMismatch when store exists but its index does not match it.
+    """
+    bufs = {date_iso: encode_day(reco) for date_iso, reco in days}
+    if not os.path.exists(store):
+        return write_pack(store, sorted(bufs.items()), encoded=True)
+    with RecoStore(store) as rs:
+        changed = {d: b for d, b in bufs.items() if d not in rs or rs.raw(d) != b}
+        # read before the pack is replaced (and unmapped)
+        live = {d: rs.raw(d) for d in rs.dates()} if any(d in rs for d in changed) else None
+        index = dict(rs.index)
+    if not changed:
+        return 0
+    if live is not None:
+        live.update(changed)
+        write_pack(store, sorted(live.items()), encoded=True)
+        return len(changed)
+    with open(store, 'ab') as f:
+        offset = f.seek(0, os.SEEK_END)
+        for date_iso, buf in changed.items():
+            f.write(buf)
+            index[date_iso] = [offset, len(buf)]
+            offset += len(buf)
+    write_index(store, index)
+    return len(changed)
+
+
+def write_pack(store: str, days: Iterable[Tuple[str, Any]], encoded: bool = False) -> int:
+    """A fresh pack of the given days (date order expected), replacing store and its index.
+
+    With encoded, the records are already encode_day() bytes.
+    """
+    os.makedirs(os.path.dirname(store) or '.', exist_ok=True)
+    index: Dict[str, List[int]] = {}
+    tmp = f'{store}.tmp-{os.getpid()}'
+    with open(tmp, 'wb') as f:
+        offset = 0
+        for date_iso, reco in days:
+            buf = reco if encoded else encode_day(reco)
+            f.write(buf)
+            index[date_iso] = [offset, len(buf)]
+            offset += len(buf)
+    os.replace(tmp, store)
+    write_index(store, index)
+    return len(index)
+
+
+class RecoStore:
+    """Read side: the memory-mapped pack and its date index (PackMismatch if they do not match)."""
+
+    def __init__(self, store: str = DEFAULT_STORE):
+        self.path = store
+        self._f = open(store, 'rb')
+        size = os.fstat(self._f.fileno()).st_size
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        try:
+            self.index = read_index(store, self._mm)
+        except PackMismatch:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._f.close()
+
+    def __enter__(self) -> 'RecoStore':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __contains__(self, date_iso: str) -> bool:
+        return date_iso in self.index
+
+    def dates(self) -> List[str]:
+        return sorted(self.index)
+
+    def raw(self, date_iso: str) -> bytes:
+        off, length = self.index[date_iso]
+        return bytes(self._mm[off : off + length])
+
+    def load(self, dates: Sequence[str]) -> Dict[str, Reco]:
+        """date -> reco for the stored ones among dates (others are left out)."""
+        spans = sorted((self.index[d][0], self.index[d][1], d) for d in dict.fromkeys(dates) if d in self.index)
+        out: Dict[str, Reco] = {}
+        i = 0
+        while i < len(spans):
+            # a run of records with small gaps: one slice of the map
+            start = spans[i][0]
+            j = i + 1
+            while j < len(spans) and spans[j][0] - (spans[j - 1][0] + spans[j - 1][1]) < GAP:
+                j += 1
+            end = spans[j - 1][0] + spans[j - 1][1]
+            buf = memoryview(self._mm[start:end])
+            for off, length, d in spans[i:j]:
+                out[d] = json.loads(bytes(buf[off - start : off - start + length]))
+            i = j
+        return out
+
+    def iter_races(self, dates: Sequence[str]) -> Iterator[Tuple[str, str, Any, Dict[str, Any]]]:
+        return iter_picks(self.load(dates))
+
+
+def iter_picks(recos: Dict[str, Reco]) -> Iterator[Tuple[str, str, Any, Dict[str, Any]]]:
+    """(date, track, no, race) for every race of every reco, the race dict holding the picks."""
+    for date_iso, reco in recos.items():
+        for r in reco.get('races', []):
+            yield date_iso, str(r.get('track', '')).strip(), r.get('no'), r
+
+
+def load_recos(dates: Sequence[str], store: Optional[str] = DEFAULT_STORE) -> Dict[str, Reco]:
+    """date -> reco in dates order: from the pack when it has the date, else the per-date JSON.
+
+    Dates with neither are left out. A pack whose index does not match it is not used.
+    """
+    found: Dict[str, Reco] = {}
+    if store and os.path.exists(store):
+        try:
+            with RecoStore(store) as rs:
+                found = rs.load(dates)
+        except PackMismatch as e:
+            print(f'warning: {e}; reading reco-*.json (rebuild with reco_store.py pack)', file=sys.stderr)
+    out: Dict[str, Reco] = {}
+    for d in dict.fromkeys(dates):
+        if d in found:
+            out[d] = found[d]
+        elif reco_json_path(d):
+            out[d] = read_reco_json(d)
+    return out
+
+
+def json_days(days_dir: str, dates: Optional[Sequence[str]] = None) -> Iterator[Tuple[str, Reco]]:
+    if dates is None:
+        names = sorted(glob.glob(os.path.join(days_dir, 'reco-????-??-??.json')))
+        dates = [re.search(r'reco-(\d{4}-\d{2}-\d{2})\.json$', p).group(1) for p in names]
+    for d in dates:
+        with open(os.path.join(days_dir, f'reco-{d}.json'), 'r', encoding='utf-8') as f:
+            yield d, json.load(f)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Packed reco store (reco.pack + date index)')
+    ap.add_argument('--store', default=DEFAULT_STORE, help='pack path (index: <pack>.idx.json)')
+    ap.add_argument('--days', default=DAYS_DIR, help='directory of reco-YYYY-MM-DD.json')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('pack', help='rebuild the store from every reco-*.json')
+    p_app = sub.add_parser('append', help='store the given dates from their reco-*.json (replacing stored copies)')
+    p_app.add_argument('dates', nargs='+', help='YYYY-MM-DD')
+    sub.add_parser('compact', help='rewrite in date order')
+    args = ap.parse_args()
+
+    try:
+        if args.cmd == 'pack':
+            n = write_pack(args.store, json_days(args.days))
+        elif args.cmd == 'append':
+            n = store_days(args.store, json_days(args.days, args.dates))
+        else:
+            with RecoStore(args.store) as rs:
+                live = {d: rs.raw(d) for d in rs.dates()}  # read before the pack is replaced (and unmapped)
+            n = write_pack(args.store, sorted(live.items()), encoded=True)
+    except PackMismatch as e:
+        raise SystemExit(f'{e} (rebuild with reco_store.py pack)')
+    print(f'{args.cmd}: {n} days -> {args.store}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Result cache for the odds band reports (--cache DIR).
+
+One JSON file per report and set of parameters that change the numbers (script name + hash of
+them). It holds:
+  - the BandStats of every Year, with that year's fingerprint: N_UMA_RACE row counts (all,
+    DataKubun '5', DataKubun '7'), its latest MonthDay, and total() checksums of the corner,
+    KakuteiJyuni and Odds columns; S_ODDS_TANPUKU rows and a TanOdds checksum; N_RACE rows and
+    a TrackCD/Kyori checksum (the --ground filter joins N_RACE). One GROUP BY Year per table, so
+    a day moving from '5' to '7' with corners/finishes/odds filled in, or a corrected track,
+    changes it
+  - the last printed CSV, with the EveryDB2 file stamp (path/size/mtime) and the output-only
+    parameters (--boot, --ci-level)
+
+A rerun on an unchanged DB file prints the stored CSV without opening SQLite. After an update,
+only the years whose fingerprint moved are recomputed (with cascade, also every later year:
+pace labels read earlier years' runs) and merged with the stored ones.
+PRAGMA data_version is not used: it only changes within one connection's lifetime, so it
+cannot tell a new process that the file changed.
+The script sources are part of the key, so editing a report invalidates its cache. The
+checksums are sums, so edits that cancel out exactly are not detected: --refresh recomputes all.
+"""
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sqlite3
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import band_stats
+from band_stats import BandStats
+from edb_tool import source_stamp
+
+CACHE_FORMAT = 3
+
+
+def sources_version(paths: Sequence[str]) -> str:
+    h = hashlib.sha1()
+    for p in paths:
+        with open(p, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def year_fingerprints(cur: sqlite3.Cursor) -> Dict[str, List]:
+    """Year -> [rows, '5' rows, '7' rows, max MonthDay, corner/finish/odds sums, odds rows, TanOdds sum,
+    N_RACE rows, TrackCD sum, Kyori sum]."""
+    fps: Dict[str, List] = {}
+    # the weights keep a value moving between columns (or horses) from cancelling out
+    cur.execute(
+        """
+        SELECT Year, COUNT(*), SUM(DataKubun = '5'), SUM(DataKubun = '7'), MAX(MonthDay),
+               total(CAST(Jyuni1c AS INTEGER) + 3*CAST(Jyuni2c AS INTEGER)
+                     + 7*CAST(Jyuni3c AS INTEGER) + 11*CAST(Jyuni4c AS INTEGER)),
+               total(CAST(KakuteiJyuni AS INTEGER) * (CAST(Umaban AS INTEGER) + 1)),
+               total(CAST(Odds AS INTEGER))
+        FROM N_UMA_RACE GROUP BY Year
+        """
+    )
+    for y, *fp in cur.fetchall():
+        if y is not None:
+            fps[y] = [*fp, 0, 0.0, 0, 0.0, 0.0]
+    cur.execute("SELECT Year, COUNT(*), total(CAST(TanOdds AS INTEGER)) FROM S_ODDS_TANPUKU GROUP BY Year")
+    for y, n, odds in cur.fetchall():
+        if y in fps:
+            fps[y][-5:-3] = [n, odds]
+    cur.execute(
+        """
+        SELECT Year, COUNT(*),
+               total(CAST(TrackCD AS INTEGER) * (CAST(RaceNum AS INTEGER) + 1)),
+               total(CAST(Kyori AS INTEGER) * (CAST(RaceNum AS INTEGER) + 1))
+        FROM N_RACE GROUP BY Year
+        """
+    )
+    for y, n, track, kyori in cur.fetchall():
+        if y in fps:
+            fps[y][-3:] = [n, track, kyori]
+    return fps
+
+
+def render(print_fn: Callable[..., None], *args) -> str:
+    """What print_fn(*args) prints, as a string (the CSV to store and write)."""
+    buf = io.StringIO()
+    with contextlib.redirect_stdout(buf):
+        print_fn(*args)
+    return buf.getvalue()
+
+
+def param_hash(params: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(params, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+class ReportCache:
+    """Per-year BandStats and the last CSV of one report/parameter set."""
+
+    def __init__(self, cache_dir: str, report: str, params: Dict[str, Any], sources: Sequence[str], refresh: bool = False):
+        versions = sources_version([*sources, band_stats.__file__, __file__])
+        self.key = {'format': CACHE_FORMAT, 'report': report, 'params': params, 'sources': versions}
+        self.path = os.path.join(cache_dir, f'{report}-{param_hash(self.key)}.json')
+        self.entry: Dict[str, Any] = {}
+        if not refresh:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    raw = json.load(f)
+                if raw.get('key') == self.key:
+                    self.entry = raw
+            except (OSError, ValueError):
+                pass
+
+    def cached_csv(self, db_path: str, output: Dict[str, Any]) -> Optional[str]:
+        """The stored CSV when the DB file and the output parameters are unchanged."""
+        csv = self.entry.get('csv') or {}
+        if csv.get('db') == source_stamp(db_path) and csv.get('output') == output:
+            return csv.get('text')
+        return None
+
+    def stale_years(self, fps: Dict[str, List], cascade: bool = False) -> List[str]:
+        years = self.entry.get('years', {})
+        stale = [y for y in sorted(fps) if y not in years or years[y]['fp'] != fps[y]]
+        if cascade and stale:
+            stale = [y for y in sorted(fps) if y >= stale[0]]
+        return stale
+
+    def merge_years(self, fps: Dict[str, List], fresh: Dict[str, BandStats], keep_hits: bool) -> BandStats:
+        """Stored years (still in the DB) + freshly computed ones, merged; keeps them for save()."""
+        years = self.entry.get('years', {})
+        kept: Dict[str, Any] = {}
+        total = BandStats(keep_hits)
+        for y in sorted(fps):
+            if y in fresh:
+                kept[y] = {'fp': fps[y], 'stats': fresh[y].to_json()}
+                total.merge(fresh[y])
+            elif y in years:
+                kept[y] = years[y]
+                total.merge(BandStats.from_json(years[y]['stats']))
+        self.entry['years'] = kept
+        return total
+
+    def save(self, db_path: str, output: Dict[str, Any], text: str) -> None:
+        self.entry['key'] = self.key
+        self.entry['csv'] = {'db': source_stamp(db_path), 'output': output, 'text': text}
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = f'{self.path}.tmp-{os.getpid()}'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.entry, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, self.path)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bootstrap percentile intervals for ROI rows (--ci in the analytics scripts).
+
+ROI = sum(returns) / sum(stakes) over the units of a row (starters, picks or races).
+Each resample draws the row's n units with replacement; all resamples of a batch are
+one NumPy array operation, never a Python loop per resample.
+
+Two resamplers:
+  - flat_stake_ci(n, hits, stake): every unit has the same stake and most return 0
+    (a band of starters bet to win). Only the units that paid are stored. A resample
+    takes T ~ Binomial(n, k/n) of the k paying units, each uniformly, and the rest are
+    zero returns; this is the same distribution as drawing n of n, with memory in k.
+    The paying units are grouped by distinct return, and the T draws are split over
+    them with one multinomial per resample, so cost follows the distinct payouts, not k.
+  - unit_ci(stakes, returns): any stakes (e.g. one unit per race with several picks).
+    A (resamples x n) matrix of unit indices per batch; ROI = returns[idx].sum / stakes[idx].sum.
+
+Both return (lo, hi) of the central `level` interval, or (nan, nan) when a row is empty.
+NumPy is required for --ci.
+"""
+
+from typing import Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; only --ci needs it
+    np = None
+
+N_BOOT = 10000
+LEVEL = 0.95
+BATCH_CELLS = 4_000_000  # array elements per batch (bounds memory)
+
+
+def require_numpy() -> None:
+    if np is None:
+        raise SystemExit('--ci needs numpy (pip install numpy)')
+
+
+def _interval(rois, level: float) -> Tuple[float, float]:
+    a = (1.0 - level) / 2.0
+    lo, hi = np.quantile(rois, [a, 1.0 - a])
+    return float(lo), float(hi)
+
+
+def flat_stake_ci(
+    n: int, hits: Sequence[float], stake: float = 100.0, n_boot: int = N_BOOT, level: float = LEVEL, rng=None
+) -> Tuple[float, float]:
+    """n units of equal stake; hits are the non-zero returns among them."""
+    require_numpy()
+    if n <= 0:
+        return float('nan'), float('nan')
+    rng = rng if rng is not None else np.random.default_rng(0)
+    # np.unique sorts, so the interval does not depend on the order the rows came in
+    values, counts = np.unique(np.asarray(hits, dtype=float), return_counts=True)
+    k = int(counts.sum())
+    if k == 0:
+        return 0.0, 0.0
+    t_all = rng.binomial(n, k / n, size=n_boot)
+    p = counts / k
+    sums = np.empty(n_boot)
+    step = max(1, BATCH_CELLS // len(values))
+    for i in range(0, n_boot, step):
+        draws = rng.multinomial(t_all[i : i + step], p)  # (resamples x distinct returns)
+        sums[i : i + len(draws)] = draws @ values
+    return _interval(sums / (stake * n), level)
+
+
+def unit_ci(
+    stakes: Sequence[float], returns: Sequence[float], n_boot: int = N_BOOT, level: float = LEVEL, rng=None
+) -> Tuple[float, float]:
+    """Units with their own stake and return (e.g. races)."""
+    require_numpy()
+    stakes = np.asarray(stakes, dtype=float)
+    returns = np.asarray(returns, dtype=float)
+    n = len(stakes)
+    if n == 0 or stakes.sum() <= 0:
+        return float('nan'), float('nan')
+    rng = rng if rng is not None else np.random.default_rng(0)
+    rois = np.empty(n_boot)
+    step = max(1, BATCH_CELLS // n)
+    for i in range(0, n_boot, step):
+        idx = rng.integers(0, n, size=(min(step, n_boot - i), n))
+        st = stakes[idx].sum(axis=1)
+        # a resample can miss every staked unit only when some units have zero stake
+        rois[i : i + len(idx)] = np.divide(returns[idx].sum(axis=1), st, out=np.zeros(len(idx)), where=st > 0)
+    return _interval(rois, level)
+
+
+def fmt_ci(ci: Tuple[float, float]) -> str:
+    lo, hi = ci
+    if lo != lo:  # nan
+        return ','
+    return f'{lo:.3f},{hi:.3f}'
@@ -17,6 +17,8 @@ fi
 
 # 3) Stage outputs
 git add public/data/date*.json || true
+# 事前圧縮サイドカーとマニフェスト（export_raceday.py --publish-only/--publish-latest）。削除もステージする
+git add -A -- 'public/data/date*.json.gz' 'public/data/date*.json.br' public/data/publish-manifest.json 2>/dev/null || true
 git add public/data/reco*.json || true
 
 # 3.1) Remove old per-day reco files in public (now deprecated)
@@ -27,6 +29,10 @@ fi
 # Optionally include data snapshots (ignored by .gitignore). Enable via COMMIT_DAYS=1
 if [[ "${COMMIT_DAYS:-0}" == "1" ]]; then
   git add -f data/days/*.json || true
+  # 推奨パックの索引(reco.pack.idx.json)は上の glob に含まれるため、パック本体も必ず一緒にステージする
+  if [[ -f data/days/reco.pack ]]; then
+    git add -f data/days/reco.pack
+  fi
   git add -f data/races/*/*.json || true
 fi
 
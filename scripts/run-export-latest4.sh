@@ -14,7 +14,7 @@ fi
 
 if [[ -n "${EDB_PATH:-}" && -f "$EDB_PATH" ]]; then
   echo "[1/2] 最新4日分をエクスポート（SQLite→data）"
-  python3 scripts/sqlite/export_raceday.py --db "$EDB_PATH" --latest 4
+  python3 scripts/sqlite/export_raceday.py --db "$EDB_PATH" --latest 4 --incremental
 else
   echo "[1/2] 最新4日分をエクスポート（PG→data）"
   npm run -s pg:export -- latest 4
@@ -30,8 +30,15 @@ echo "[+] 推奨（EV）を生成（最新4日分）"
 WIN_ODDS_NO_CUT="${WIN_ODDS_NO_CUT:-1}" npm run -s reco:latest -- 4 || true
 
 echo "[2/2] public/data へ反映（date1..4.json / reco1..4.json）"
-# 脚質付与後の day を再発行して date1..4.json に反映
-npm run -s data:publish || true
+# 脚質付与後の day を再発行して date1..4.json に反映。
+# 内容ハッシュ比較で変化した日だけ書き換え、.gz/.br サイドカーと publish-manifest.json も揃える
+if command -v python3 >/dev/null 2>&1; then
+  python3 scripts/sqlite/export_raceday.py --publish-only || true
+else
+  npm run -s data:publish || true
+  # publish-latest.ts はサイドカー/マニフェストを更新しないため、古いものを残さない
+  rm -f public/data/date*.json.gz public/data/date*.json.br public/data/publish-manifest.json
+fi
 ls -1 public/data/date*.json 2>/dev/null || echo "public/data に date*.json が見つかりません"
 tsx scripts/publish-reco-latest.ts || true
 ls -1 public/data/reco*.json 2>/dev/null || echo "public/data に reco*.json が見つかりません"
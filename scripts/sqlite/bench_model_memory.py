@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RaceDay モデルのメモリ比較（__slots__ 版 vs 従来の dict ベース dataclass）
+
+slots 側は現行どおり展開タイプのラベル列を intern_pace_labels で共有する。
+
+1年分相当（既定: 104開催日 × 3開催 × 12R × 16頭）の RaceDay を合成し、
+両モデルで保持したときの確保メモリを tracemalloc で測る。
+文字列・数値は両モデルで同じ生成器から作るため、差はオブジェクトの器の分だけになる。
+
+使用例:
+  python3 scripts/sqlite/bench_model_memory.py
+  python3 scripts/sqlite/bench_model_memory.py --days 104 --meetings 3 --races 12 --horses 16
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import random
+import tracemalloc
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from export_raceday import Horse, Meeting, Race, RaceDay, intern_pace_labels
+
+
+# --- 従来モデル（__slots__ なし、position_bias は動的属性） ---
+@dataclass
+class LegacyHorse:
+    num: int
+    draw: int
+    name: str
+    sex: str
+    age: int
+    weight: int
+    jockey: str
+    trainer: str
+    odds: Optional[float] = None
+    popularity: Optional[int] = None
+    pace_type: Optional[List[str]] = None
+    ketto: Optional[str] = None
+
+
+@dataclass
+class LegacyRace:
+    no: int
+    name: str
+    distance_m: int
+    ground: str
+    course_note: Optional[str] = None
+    condition: Optional[str] = None
+    start_time: Optional[str] = None
+    pace_score: Optional[int] = None
+    pace_mark: Optional[str] = None
+    horses: List[LegacyHorse] = None
+
+
+@dataclass
+class LegacyMeeting:
+    track: str
+    kaiji: int
+    nichiji: int
+    races: List[LegacyRace]
+
+
+@dataclass
+class LegacyRaceDay:
+    date: str
+    meetings: List[LegacyMeeting]
+
+
+MODELS = {
+    "legacy": (LegacyRaceDay, LegacyMeeting, LegacyRace, LegacyHorse),
+    "slots": (RaceDay, Meeting, Race, Horse),
+}
+
+
+def build_days(model: str, days: int, meetings: int, races: int, horses: int, seed: int) -> List:
+    RD, MT, RC, HS = MODELS[model]
+    rnd = random.Random(seed)
+    labels = [None, ["A"], ["B"], ["C"], ["A", "B"], ["A", "C"]]
+    # 騎手/調教師名は実際のエクスポートと同様に名前マップの文字列を共有する
+    jockeys = [f"騎手{i}" for i in range(150)]
+    trainers = [f"調教師{i}" for i in range(250)]
+    out = []
+    for d in range(days):
+        mts = []
+        for m in range(meetings):
+            rcs = []
+            for r in range(1, races + 1):
+                hs = []
+                for u in range(1, horses + 1):
+                    lb = rnd.choice(labels)
+                    # 従来モデルは1頭ごとに list を生成していた
+                    pace_type = (list(lb) if lb else None) if model == "legacy" else intern_pace_labels(lb)
+                    hs.append(
+                        HS(
+                            num=u,
+                            draw=(u + 1) // 2,
+                            name=f"馬{d:03d}{m}{r:02d}{u:02d}",
+                            sex="牡",
+                            age=rnd.randint(2, 7),
+                            weight=rnd.choice([54.0, 55.0, 56.0, 57.0]),
+                            jockey=rnd.choice(jockeys),
+                            trainer=rnd.choice(trainers),
+                            odds=rnd.randint(11, 3000) / 10.0,
+                            popularity=u,
+                            pace_type=pace_type,
+                            ketto=f"20{rnd.randint(15, 22)}{rnd.randint(0, 999999):06d}",
+                        )
+                    )
+                rcs.append(RC(no=r, name=f"{r}R", distance_m=1600, ground="芝", pace_score=1.5, horses=hs))
+            mt = MT(track="東京", kaiji=1, nichiji=d % 8 + 1, races=rcs)
+            bias: Dict[str, dict] = {"芝": {"pace": {}}, "ダ": {"pace": {}}}
+            if model == "legacy":
+                setattr(mt, "position_bias", bias)
+            else:
+                mt.position_bias = bias
+            mts.append(mt)
+        out.append(RD(date=f"2024-{d:04d}", meetings=mts))
+    return out
+
+
+def measure(model: str, args: argparse.Namespace) -> int:
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    data = build_days(model, args.days, args.meetings, args.races, args.horses, args.seed)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del data
+    return used
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=int, default=104, help="開催日数（1年 ≒ 104）")
+    ap.add_argument("--meetings", type=int, default=3)
+    ap.add_argument("--races", type=int, default=12)
+    ap.add_argument("--horses", type=int, default=16)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    n_horses = args.days * args.meetings * args.races * args.horses
+    print(f"horses={n_horses} races={args.days * args.meetings * args.races}")
+    print("model,bytes,bytes_per_horse")
+    results = {}
+    for model in ("legacy", "slots"):
+        used = measure(model, args)
+        results[model] = used
+        print(f"{model},{used},{used / n_horses:.1f}")
+    if results["legacy"]:
+        print(f"saving,{results['legacy'] - results['slots']},{1 - results['slots'] / results['legacy']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
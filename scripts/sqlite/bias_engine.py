@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ポジション/枠順バイアスの集計エンジン（任意の期間 × 競馬場 × 馬場）
+
+export_raceday.py の当日バイアス（position_bias）と同じ集計を、期間全体に対する
+1回の集約SQLで行う（レースごとの Python ループを回さない）。
+エクスポータは読み込み済みの当日行（DayRows）から aggregate_day で同じ集計を作る（再読込しない）。
+
+集計（確定データ DataKubun 5/7、障害・新潟芝1000m は除外）:
+- 位置取り: 通過順の有効コーナーがすべて4番手以内=A / すべて5番手以下=B / それ以外=C
+- win_place: 3着以内の位置取り / quinella: 2着以内 / longshot: 3着以内かつ4番人気以下
+- draw: 頭数14以上のレースの3着以内を 1〜4枠=inner / 5〜8枠=outer、race_count は頭数14以上のレース数
+
+集計単位(scope):
+- day     開催日 × 場 × 回 × 日次（エクスポータの position_bias と同じ）
+- kaisai  場 × 回（その開催の初日〜対象日）
+- days    場（その場自身の、対象日までの直近N開催日）
+
+使用例:
+  python3 scripts/sqlite/bias_engine.py --db path/to/everydb2.sqlite --date 20240915 --scope kaisai
+  python3 scripts/sqlite/bias_engine.py --db path/to/everydb2.sqlite --date 20240915 --scope days --days 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+POS_TYPES = ("A", "B", "C")
+DRAW_MIN_HEADCOUNT = 14
+
+
+def int_or_none(v) -> Optional[int]:
+    # sql_int と同じく、数字のみの値だけを整数化（それ以外は None）
+    s = str(v).strip() if v is not None else ""
+    return int(s) if s.isascii() and s.isdigit() else None
+
+
+def sql_int(col: str) -> str:
+    # int(str(x).strip()) と同じく、数字のみの値だけを整数化（それ以外は NULL）
+    return f"(CASE WHEN TRIM({col}) <> '' AND TRIM({col}) NOT GLOB '*[^0-9]*' THEN CAST(TRIM({col}) AS INTEGER) END)"
+
+
+def _pos_sql() -> str:
+    cs = [f"COALESCE({sql_int(f'um.Jyuni{i}c')}, 0)" for i in range(1, 5)]
+    present = " + ".join(f"({c} > 0)" for c in cs)
+    le4 = " + ".join(f"({c} BETWEEN 1 AND 4)" for c in cs)
+    ge5 = " + ".join(f"({c} >= 5)" for c in cs)
+    return f"""(CASE
+              WHEN {present} = 0 THEN NULL
+              WHEN {le4} = {present} THEN 'A'
+              WHEN {ge5} = {present} THEN 'B'
+              ELSE 'C' END)"""
+
+
+def _count_cols() -> List[Tuple[str, str]]:
+    # (列名, 集計対象の条件)。race_count 以外は出走馬単位
+    cols: List[Tuple[str, str]] = []
+    for p in POS_TYPES:
+        cols.append((f"wp_{p}", f"fin <= 3 AND pos = '{p}'"))
+        cols.append((f"q_{p}", f"fin <= 2 AND pos = '{p}'"))
+        cols.append((f"ls_{p}", f"fin <= 3 AND pos = '{p}' AND pop >= 4"))
+    cols.append(("inner", f"fin <= 3 AND pos IS NOT NULL AND headcount >= {DRAW_MIN_HEADCOUNT} AND waku BETWEEN 1 AND 4"))
+    cols.append(("outer", f"fin <= 3 AND pos IS NOT NULL AND headcount >= {DRAW_MIN_HEADCOUNT} AND waku BETWEEN 5 AND 8"))
+    return cols
+
+
+COUNT_COLS = _count_cols()
+
+# 期間内の全レースを 開催日×場×回×日次×トラック×距離 に集約する。
+# 確定行のないレース（当日未確定など）も 0件として残す（エクスポータは馬場キーを必ず出力するため）。
+# 馬場キーの並びを従来どおりにするため、各グループ最初のレース番号順に返す
+BIAS_SQL = f"""
+WITH u AS (
+  SELECT
+    um.Year, um.MonthDay, um.JyoCD, um.Kaiji, um.Nichiji, um.RaceNum,
+    {sql_int('um.KakuteiJyuni')} AS fin,
+    {sql_int('um.Ninki')} AS pop,
+    {sql_int('um.Wakuban')} AS waku,
+    {_pos_sql()} AS pos,
+    COUNT(*) OVER (
+      PARTITION BY um.Year, um.MonthDay, um.JyoCD, um.Kaiji, um.Nichiji, um.RaceNum
+    ) AS headcount
+  FROM N_UMA_RACE AS um
+  WHERE um.DataKubun IN ('5','7')
+    AND (um.Year, um.MonthDay) >= (?, ?) AND (um.Year, um.MonthDay) <= (?, ?)
+    AND (? IS NULL OR um.JyoCD = ?)
+),
+per_race AS (
+  SELECT
+    Year, MonthDay, JyoCD, Kaiji, Nichiji, RaceNum,
+    MAX(headcount) AS headcount,
+    {", ".join(f"SUM(COALESCE({cond}, 0)) AS {name}" for name, cond in COUNT_COLS)}
+  FROM u
+  GROUP BY Year, MonthDay, JyoCD, Kaiji, Nichiji, RaceNum
+)
+SELECT
+  r.Year, r.MonthDay, r.JyoCD, r.Kaiji, r.Nichiji, r.TrackCD, r.Kyori,
+  SUM(COALESCE(pr.headcount, 0) >= {DRAW_MIN_HEADCOUNT}) AS race_count,
+  {", ".join(f"SUM(COALESCE(pr.{name}, 0)) AS {name}" for name, _ in COUNT_COLS)}
+FROM N_RACE AS r
+LEFT JOIN per_race AS pr
+  ON pr.Year = r.Year AND pr.MonthDay = r.MonthDay AND pr.JyoCD = r.JyoCD
+ AND pr.Kaiji = r.Kaiji AND pr.Nichiji = r.Nichiji AND pr.RaceNum = r.RaceNum
+WHERE (r.Year, r.MonthDay) >= (?, ?) AND (r.Year, r.MonthDay) <= (?, ?)
+  AND (? IS NULL OR r.JyoCD = ?)
+GROUP BY r.Year, r.MonthDay, r.JyoCD, r.Kaiji, r.Nichiji, r.TrackCD, r.Kyori
+ORDER BY r.Year, r.MonthDay, r.JyoCD, r.Kaiji, r.Nichiji, MIN(CAST(r.RaceNum AS INTEGER))
+"""
+
+
+def _int0(v) -> int:
+    try:
+        s = str(v).strip()
+        return int(float(s)) if s and s.upper() != "NULL" else 0
+    except Exception:
+        return 0
+
+
+def ground_of(trackcd) -> str:
+    s = str(trackcd) if trackcd is not None else ""
+    return {"1": "芝", "2": "ダ"}.get(s[:1], "")
+
+
+def empty_stat() -> dict:
+    def pace():
+        return {"A": 0, "B": 0, "C": 0, "total": 0}
+
+    return {
+        "pace": {"wp": pace(), "q": pace(), "ls": pace()},
+        "draw": {"inner": 0, "outer": 0, "total": 0, "race_count": 0},
+    }
+
+
+def scope_key(scope: str, ymd: str, jyo: str, kaiji: int, nichiji: int) -> tuple:
+    if scope == "day":
+        return (ymd, jyo, kaiji, nichiji)
+    if scope == "kaisai":
+        return (ymd[:4], jyo, kaiji)
+    return (jyo,)
+
+
+def _add_counts(
+    agg: Dict[tuple, Dict[str, dict]],
+    scope: str,
+    ymd: str,
+    jyo_cd,
+    kaiji,
+    nichiji,
+    trackcd,
+    kyori,
+    race_count: int,
+    counts: Dict[str, int],
+) -> None:
+    # 障害・新潟芝1000m は除外
+    ground = ground_of(trackcd)
+    jyo = str(jyo_cd).zfill(2)
+    if not ground or (jyo == "04" and ground == "芝" and _int0(kyori) == 1000):
+        return
+    key = scope_key(scope, ymd, jyo, _int0(kaiji), _int0(nichiji))
+    stat = agg[key].setdefault(ground, empty_stat())
+    for kind in ("wp", "q", "ls"):
+        st = stat["pace"][kind]
+        for p in POS_TYPES:
+            st[p] += counts[f"{kind}_{p}"]
+            st["total"] += counts[f"{kind}_{p}"]
+    draw = stat["draw"]
+    draw["inner"] += counts["inner"]
+    draw["outer"] += counts["outer"]
+    draw["total"] += counts["inner"] + counts["outer"]
+    draw["race_count"] += race_count
+
+
+def aggregate_bias(
+    cur: sqlite3.Cursor,
+    start_ymd: str,
+    end_ymd: str,
+    scope: str = "day",
+    jyo_cd: Optional[str] = None,
+    starts: Optional[Dict[str, str]] = None,
+) -> Dict[tuple, Dict[str, dict]]:
+    """start_ymd〜end_ymd（両端含む、YYYYMMDD）を1クエリで集計し、scope のキー→馬場→集計値を返す。
+
+    キー: day=(YYYYMMDD, JyoCD, 回, 日次) / kaisai=(YYYY, JyoCD, 回) / days=(JyoCD,)
+    jyo_cd 指定時はその競馬場のみ（--watch で確定したレースの開催だけ更新する場合など）。
+    starts（JyoCD→YYYYMMDD）指定時は、場ごとにその日より前の開催日を除く（last_n_days_start）。
+    集計値は export_raceday の position_bias 判定（bias_summary）にそのまま渡せる形。
+    """
+    cur.execute(BIAS_SQL, (start_ymd[:4], start_ymd[4:], end_ymd[:4], end_ymd[4:], jyo_cd, jyo_cd) * 2)
+    agg: Dict[tuple, Dict[str, dict]] = defaultdict(dict)
+    for row in cur.fetchall():
+        year, mmdd, jyo, kaiji, nichiji, trackcd, kyori, race_count = row[:8]
+        ymd = f"{year}{mmdd}"
+        if starts is not None and ymd < starts.get(str(jyo).zfill(2), ymd):
+            continue
+        counts = dict(zip((name for name, _ in COUNT_COLS), row[8:]))
+        _add_counts(agg, scope, ymd, jyo, kaiji, nichiji, trackcd, kyori, race_count, counts)
+    return agg
+
+
+def race_counts(results: Iterable[Tuple]) -> Tuple[int, Dict[str, int]]:
+    """1レースの確定行 (Wakuban, Ninki, KakuteiJyuni, Jyuni1c..Jyuni4c) の (race_count, COUNT_COLS の件数)。
+
+    BIAS_SQL の per_race と同じ判定（数字以外の値は NULL 扱い）。
+    """
+    rows = list(results)
+    headcount = len(rows)
+    counts = {name: 0 for name, _ in COUNT_COLS}
+    for waku, pop, fin, *corners in rows:
+        cs = [int_or_none(c) or 0 for c in corners]
+        present = [c for c in cs if c > 0]
+        if not present:
+            continue
+        pos = "A" if all(c <= 4 for c in present) else "B" if all(c >= 5 for c in present) else "C"
+        fin = int_or_none(fin)
+        if fin is None or fin > 3:
+            continue
+        counts[f"wp_{pos}"] += 1
+        if fin <= 2:
+            counts[f"q_{pos}"] += 1
+        pop = int_or_none(pop)
+        if pop is not None and pop >= 4:
+            counts[f"ls_{pos}"] += 1
+        waku = int_or_none(waku)
+        if headcount >= DRAW_MIN_HEADCOUNT and waku is not None:
+            if 1 <= waku <= 4:
+                counts["inner"] += 1
+            elif 5 <= waku <= 8:
+                counts["outer"] += 1
+    return int(headcount >= DRAW_MIN_HEADCOUNT), counts
+
+
+def aggregate_day(ymd: str, races: Iterable[Tuple]) -> Dict[tuple, Dict[str, dict]]:
+    """読み込み済みの1日分を aggregate_bias(cur, ymd, ymd, scope="day") と同じ形に集計する。
+
+    races: (JyoCD, Kaiji, Nichiji, TrackCD, Kyori, 確定行) をレース番号順に。確定行は race_counts の列順。
+    """
+    agg: Dict[tuple, Dict[str, dict]] = defaultdict(dict)
+    for jyo, kaiji, nichiji, trackcd, kyori, results in races:
+        race_count, counts = race_counts(results)
+        _add_counts(agg, "day", ymd, jyo, kaiji, nichiji, trackcd, kyori, race_count, counts)
+    return agg
+
+
+# --- 判定 ---
+def decide_pace(stat: dict, min_n: int = 1):
+    total = stat.get("total", 0)
+    if total is None or total < min_n or total == 0:
+        return None
+    best = max((('A', stat.get('A',0)), ('B', stat.get('B',0)), ('C', stat.get('C',0))), key=lambda kv: kv[1])
+    label, cnt = best
+    ratio = (cnt / total) if total > 0 else 0.0
+    if ratio >= 0.7:
+        return {"target": label, "ratio": ratio, "n_total": total}
+    return None
+
+
+def decide_draw(stat: dict):
+    races = stat.get("race_count", 0)
+    total = stat.get("total", 0)
+    if races is None or races < 2 or total == 0:
+        return None
+    best = max((('inner', stat.get('inner',0)), ('outer', stat.get('outer',0))), key=lambda kv: kv[1])
+    label, cnt = best
+    ratio = (cnt / total) if total > 0 else 0.0
+    if ratio >= 0.7:
+        return {"target": label, "ratio": ratio, "n_total": total}
+    return None
+
+
+def bias_summary(gmap: Dict[str, dict]) -> Optional[Dict[str, dict]]:
+    """馬場→集計値 から position_bias（馬場→{pace, draw}）を作る。"""
+    out_g: Dict[str, dict] = {}
+    for ground, stat in gmap.items():
+        pace = {
+            **({"win_place": decide_pace(stat["pace"]["wp"]) } if decide_pace(stat["pace"]["wp"]) else {}),
+            **({"quinella": decide_pace(stat["pace"]["q"]) } if decide_pace(stat["pace"]["q"]) else {}),
+            **({"longshot": decide_pace(stat["pace"]["ls"], min_n=6) } if decide_pace(stat["pace"]["ls"], min_n=6) else {}),
+        }
+        draw = decide_draw(stat["draw"]) or None
+        out = {"pace": pace}
+        if draw:
+            out["draw"] = draw
+        # フラットも表示するため、閾値未達でも ground を必ず出力
+        out_g[ground] = out
+    return out_g or None
+
+
+# --- 期間の決定 ---
+def kaisai_start(cur: sqlite3.Cursor, ymd: str) -> str:
+    """対象日に行われている開催（場×回）の最も早い初日。"""
+    cur.execute(
+        """
+        SELECT MIN(r.Year || r.MonthDay)
+        FROM N_RACE AS r
+        JOIN (SELECT DISTINCT JyoCD, Kaiji FROM N_RACE WHERE Year = ? AND MonthDay = ?) AS d
+          ON d.JyoCD = r.JyoCD AND d.Kaiji = r.Kaiji
+        WHERE r.Year = ? AND r.MonthDay <= ?
+        """,
+        (ymd[:4], ymd[4:], ymd[:4], ymd[4:]),
+    )
+    row = cur.fetchone()
+    return row[0] if row and row[0] else ymd
+
+
+def last_n_days_start(cur: sqlite3.Cursor, ymd: str, n: int) -> Dict[str, str]:
+    """JyoCD→その場の対象日までの直近 n 開催日の初日（場ごとに自分の開催日で数える）。"""
+    cur.execute(
+        """
+        SELECT JyoCD, MIN(Year || MonthDay) FROM (
+          SELECT JyoCD, Year, MonthDay,
+                 ROW_NUMBER() OVER (PARTITION BY JyoCD ORDER BY Year DESC, MonthDay DESC) AS rn
+          FROM (SELECT DISTINCT JyoCD, Year, MonthDay FROM N_RACE WHERE (Year, MonthDay) <= (?, ?))
+        )
+        WHERE rn <= ?
+        GROUP BY JyoCD
+        """,
+        (ymd[:4], ymd[4:], n),
+    )
+    return {str(jyo).zfill(2): start for jyo, start in cur.fetchall() if jyo is not None and start}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="期間指定のポジション/枠順バイアス集計")
+    ap.add_argument("--db", required=True, help="SQLite DB file path")
+    ap.add_argument("--date", required=True, help="対象日(YYYYMMDD)。期間の最終日")
+    ap.add_argument("--scope", choices=("day", "kaisai", "days"), default="kaisai")
+    ap.add_argument("--days", type=int, default=8, help="--scope days の開催日数")
+    args = ap.parse_args()
+
+    from edb_tool import sqlite_uri
+
+    conn = sqlite3.connect(sqlite_uri(args.db), uri=True)
+    cur = conn.cursor()
+    starts: Optional[Dict[str, str]] = None
+    if args.scope == "day":
+        start = args.date
+    elif args.scope == "kaisai":
+        start = kaisai_start(cur, args.date)
+    else:
+        starts = last_n_days_start(cur, args.date, args.days)
+        start = min(starts.values(), default=args.date)
+    agg = aggregate_bias(cur, start, args.date, scope=args.scope, starts=starts)
+    if args.scope == "kaisai":
+        # 対象日に開催中の場×回のみ
+        cur.execute("SELECT DISTINCT JyoCD, Kaiji FROM N_RACE WHERE Year = ? AND MonthDay = ?", (args.date[:4], args.date[4:]))
+        live = {(str(j).zfill(2), _int0(k)) for j, k in cur.fetchall()}
+        agg = {k: v for k, v in agg.items() if (k[1], k[2]) in live}
+    out = [
+        {
+            "key": list(key),
+            "from": starts.get(key[0], start) if starts is not None else start,
+            "to": args.date,
+            "position_bias": bias_summary(gmap),
+            "counts": gmap,
+        }
+        for key, gmap in sorted(agg.items())
+    ]
+    print(json.dumps(out, ensure_ascii=False, indent=2))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+EveryDB2(SQLite) 保守用コマンド
+
+サブコマンド:
+  index      エクスポート/分析スクリプトが使うインデックスを作成し、EXPLAIN QUERY PLAN を前後比較で出力
+  pace-asof  側DBに「各馬・各出走日時点の展開タイプ」表 horse_pace_asof を作成/増分更新
+  build-facts  確定出走を年ごとの型付き列指向ファイルに書き出す（starter_facts.py、分析の --facts 用）
+
+index の作成先:
+- 既定: EveryDB2 本体に CREATE INDEX IF NOT EXISTS（rc_ 接頭辞）
+- --side-db 指定時: 本体は読み取り専用で開き、別DBに近走参照用の縮約テーブル uma_hist
+  (KettoNum, ymd INTEGER, Jyuni1c..4c) と索引を作る。export_raceday.py --index-db で利用。
+  SQLite の索引は同一DB内のテーブルにしか張れないため、側DBでは近走参照のみを対象とする。
+
+pace-asof:
+- horse_pace_asof(KettoNum, ymd, code, run1..run3): N_UMA_RACE の出走行（DataKubun 1〜7）ごとに、
+  その日より前の確定走から判定したラベルコード(pace_classifier)と、判定に使った近走の ymd
+- N_UMA_RACE を日付順に1回走査して作る。2回目以降は前回の確定済み区間の続きから増分で延長する
+  （馬ごとの近走状態を horse_pace_state に保持）。確定済み区間の過去データを修正した場合は --rebuild
+- export_raceday.py --index-db / odds_band_by_type_sqlite.py (EDB_INDEX_PATH) が近走の再読込の代わりに参照
+
+使用例:
+  python3 scripts/sqlite/edb_tool.py index --db path/to/everydb2.sqlite
+  python3 scripts/sqlite/edb_tool.py index --db path/to/everydb2.sqlite --side-db data/edb-index.sqlite
+  python3 scripts/sqlite/edb_tool.py pace-asof --db path/to/everydb2.sqlite --side-db data/edb-index.sqlite
+  python3 scripts/sqlite/edb_tool.py build-facts --db path/to/everydb2.sqlite --out data/facts
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import pathlib
+import sqlite3
+import sys
+import time
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pace_classifier import RUNS, classify_histories, corner_int
+
+
+# (索引名, テーブル, 列)。Year/MonthDay は固定長のゼロ埋め文字列のため、文字列順=日付順
+INDEXES: List[Tuple[str, str, List[str]]] = [
+    # 近走参照（馬→日付降順）。通過順まで含めてテーブル本体を読まない
+    ("rc_uma_ketto_date", "N_UMA_RACE",
+     ["KettoNum", "Year", "MonthDay", "DataKubun", "Jyuni1c", "Jyuni2c", "Jyuni3c", "Jyuni4c"]),
+    # 開催日/レース単位の出走馬
+    ("rc_uma_race", "N_UMA_RACE", ["Year", "MonthDay", "JyoCD", "Kaiji", "Nichiji", "RaceNum", "Umaban"]),
+    ("rc_race_date", "N_RACE", ["Year", "MonthDay", "JyoCD", "Kaiji", "Nichiji", "RaceNum"]),
+    ("rc_odds_race", "S_ODDS_TANPUKU", ["Year", "MonthDay", "JyoCD", "RaceNum", "Umaban"]),
+    ("rc_harai_race", "N_HARAI", ["Year", "MonthDay", "JyoCD", "RaceNum"]),
+]
+
+# 各スクリプトの代表クエリ（EXPLAIN QUERY PLAN 用）
+PLAN_QUERIES: List[Tuple[str, str, tuple]] = [
+    (
+        "available_dates (export_raceday)",
+        "SELECT DISTINCT Year, MonthDay FROM N_RACE WHERE Year <> '' AND MonthDay <> '' ORDER BY Year, MonthDay",
+        (),
+    ),
+    (
+        "day_races (export_raceday)",
+        "SELECT * FROM N_RACE WHERE Year = ? AND MonthDay = ?",
+        ("2024", "0914"),
+    ),
+    (
+        "day_entries (export_raceday)",
+        "SELECT * FROM N_UMA_RACE WHERE Year = ? AND MonthDay = ? AND DataKubun IN ('1','2','3','4','5','6','7')",
+        ("2024", "0914"),
+    ),
+    (
+        "day_odds (export_raceday)",
+        "SELECT JyoCD, RaceNum, Umaban, TanOdds, TanNinki FROM S_ODDS_TANPUKU WHERE Year = ? AND MonthDay = ?",
+        ("2024", "0914"),
+    ),
+    (
+        "pace_history (export_raceday / odds_band_by_type)",
+        """
+        SELECT Jyuni1c, Jyuni2c, Jyuni3c, Jyuni4c FROM N_UMA_RACE
+        WHERE KettoNum = ? AND DataKubun IN ('5','7') AND (Year, MonthDay) < (?, ?)
+        ORDER BY Year DESC, MonthDay DESC LIMIT 20
+        """,
+        ("2020100000", "2024", "0914"),
+    ),
+    (
+        "win_pick (realized_roi_win_by_reco)",
+        """
+        SELECT um.KakuteiJyuni, um.Odds, so.TanOdds
+        FROM N_UMA_RACE AS um
+        LEFT JOIN S_ODDS_TANPUKU AS so
+          ON um.Year = so.Year AND um.MonthDay = so.MonthDay
+         AND um.JyoCD = so.JyoCD AND um.RaceNum = so.RaceNum AND um.Umaban = so.Umaban
+        WHERE um.Year = ? AND um.MonthDay = ? AND um.JyoCD = ? AND um.RaceNum = ? AND um.Umaban = ?
+          AND um.DataKubun IN ('5','7')
+        """,
+        ("2024", "0914", "06", "11", "01"),
+    ),
+    (
+        "payout (realized_roi_all_by_reco)",
+        "SELECT * FROM N_HARAI WHERE Year = ? AND MonthDay = ? AND JyoCD = ? AND RaceNum = ? LIMIT 1",
+        ("2024", "0914", "06", "11"),
+    ),
+]
+
+SIDE_PLAN_QUERIES: List[Tuple[str, str, tuple]] = [
+    (
+        "pace_history (index-db uma_hist)",
+        """
+        SELECT Jyuni1c, Jyuni2c, Jyuni3c, Jyuni4c FROM uma_hist
+        WHERE KettoNum = ? AND ymd < ?
+        ORDER BY ymd DESC LIMIT 20
+        """,
+        ("2020100000", 20240914),
+    ),
+]
+
+
+def table_exists(cur: sqlite3.Cursor, table: str, schema: str = "main") -> bool:
+    cur.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type='table' AND name=?", (table,))
+    return cur.fetchone() is not None
+
+
+def explain(cur: sqlite3.Cursor, sql: str, params: tuple) -> List[str]:
+    cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+    return [str(r[3]) for r in cur.fetchall()]
+
+
+def print_plans(cur: sqlite3.Cursor, title: str, queries: List[Tuple[str, str, tuple]]) -> Dict[str, List[str]]:
+    print(f"== EXPLAIN QUERY PLAN: {title} ==")
+    plans: Dict[str, List[str]] = {}
+    for label, sql, params in queries:
+        try:
+            lines = explain(cur, sql, params)
+        except sqlite3.Error as e:
+            lines = [f"(skip: {e})"]
+        plans[label] = lines
+        print(f"- {label}")
+        for ln in lines:
+            print(f"    {ln}")
+    return plans
+
+
+def is_full_scan(line: str) -> bool:
+    # "SCAN t" は全件走査。"SCAN t USING (COVERING) INDEX" は索引順走査なので除外
+    return line.startswith("SCAN ") and " USING " not in line
+
+
+def create_indexes(conn: sqlite3.Connection) -> List[str]:
+    cur = conn.cursor()
+    created: List[str] = []
+    for name, table, cols in INDEXES:
+        if not table_exists(cur, table):
+            print(f"skip: {table} not found ({name})")
+            continue
+        t0 = time.perf_counter()
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(cols)})")
+        conn.commit()
+        print(f"index: {name} ON {table}({', '.join(cols)}) {time.perf_counter() - t0:.1f}s")
+        created.append(name)
+    cur.execute("ANALYZE")
+    conn.commit()
+    return created
+
+
+def source_stamp(db_path: str) -> Dict[str, str]:
+    st = os.stat(db_path)
+    return {
+        "src_path": os.path.abspath(db_path),
+        "src_size": str(st.st_size),
+        "src_mtime_ns": str(st.st_mtime_ns),
+    }
+
+
+def sqlite_uri(path: str, read_only: bool = True) -> str:
+    """ファイルパスを SQLite の URI ファイル名にする（'#'・'?'・'%'・空白などをエスケープ）。
+
+    f"file:{path}" のままだと '#' 以降が切り捨てられ、?mode=ro も効かずに別の空DBが作られる。
+    """
+    uri = pathlib.Path(path).resolve().as_uri()
+    return f"{uri}?mode=ro" if read_only else uri
+
+
+def build_side_index(side_db: str, db_path: str) -> sqlite3.Connection:
+    """本体を読み取り専用で ATTACH し、側DBに近走参照テーブル uma_hist を作り直す。"""
+    conn = sqlite3.connect(sqlite_uri(side_db, read_only=False), uri=True)
+    conn.execute("ATTACH DATABASE ? AS src", (sqlite_uri(db_path),))
+    cur = conn.cursor()
+    t0 = time.perf_counter()
+    cur.execute("DROP TABLE IF EXISTS uma_hist")
+    cur.execute(
+        """
+        CREATE TABLE uma_hist (
+          KettoNum TEXT NOT NULL,
+          ymd INTEGER NOT NULL,
+          Jyuni1c TEXT, Jyuni2c TEXT, Jyuni3c TEXT, Jyuni4c TEXT
+        )
+        """
+    )
+    cur.execute(
+        """
+        INSERT INTO uma_hist (KettoNum, ymd, Jyuni1c, Jyuni2c, Jyuni3c, Jyuni4c)
+        SELECT KettoNum, CAST(Year AS INTEGER)*10000 + CAST(MonthDay AS INTEGER),
+               Jyuni1c, Jyuni2c, Jyuni3c, Jyuni4c
+        FROM src.N_UMA_RACE
+        WHERE DataKubun IN ('5','7') AND KettoNum IS NOT NULL AND KettoNum <> ''
+        """
+    )
+    cur.execute(
+        "CREATE INDEX uma_hist_ketto_ymd ON uma_hist (KettoNum, ymd, Jyuni1c, Jyuni2c, Jyuni3c, Jyuni4c)"
+    )
+    cur.execute("CREATE TABLE IF NOT EXISTS index_meta (key TEXT PRIMARY KEY, value TEXT)")
+    meta = source_stamp(db_path)
+    meta["built_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    cur.executemany("INSERT OR REPLACE INTO index_meta (key, value) VALUES (?, ?)", meta.items())
+    conn.commit()
+    cur.execute("SELECT COUNT(*) FROM uma_hist")
+    n = cur.fetchone()[0]
+    print(f"side index: uma_hist rows={n} {time.perf_counter() - t0:.1f}s -> {side_db}")
+    return conn
+
+
+def side_index_is_fresh(conn: sqlite3.Connection, db_path: str, schema: str = "idx") -> bool:
+    """側DBが現在の本体ファイル(サイズ/更新時刻)から作られたものか。"""
+    cur = conn.cursor()
+    if not table_exists(cur, "index_meta", schema) or not table_exists(cur, "uma_hist", schema):
+        return False
+    cur.execute(f"SELECT key, value FROM {schema}.index_meta")
+    meta = dict(cur.fetchall())
+    now = source_stamp(db_path)
+    return all(meta.get(k) == now[k] for k in ("src_size", "src_mtime_ns"))
+
+
+# --- pace-asof ---
+HISTORY_ROWS = 20  # エクスポータと同じく、近走は直近20行までしか見ない
+CONFIRMED = ("5", "7")
+FINAL = "7"  # asof_through はこれだけの日まで進める（'5' の通過順は後から埋まりうる）
+
+
+def trim_state(hist: List[List[int]]) -> List[List[int]]:
+    """馬の近走状態 [[ymd, c1, c2, c3, c4], ...]（新しい順）を判定に必要な分だけ残す。
+
+    直近20行のうち、有効コーナーのある走が RUNS 件そろった行までで十分。
+    """
+    valid = 0
+    for i, row in enumerate(hist[:HISTORY_ROWS]):
+        if row[1] or row[2] or row[3] or row[4]:
+            valid += 1
+            if valid >= RUNS:
+                return hist[: i + 1]
+    return hist[:HISTORY_ROWS]
+
+
+def run_keys(hist: List[List[int]]) -> List[Optional[int]]:
+    keys: List[Optional[int]] = [row[0] for row in hist if row[1] or row[2] or row[3] or row[4]][:RUNS]
+    return keys + [None] * (RUNS - len(keys))
+
+
+def load_pace_states(cur: sqlite3.Cursor, kettos: Iterable[str], into: Dict[str, List[List[int]]]) -> None:
+    todo = [k for k in kettos if k not in into]
+    for i in range(0, len(todo), 500):
+        chunk = todo[i : i + 500]
+        cur.execute(
+            f"SELECT KettoNum, hist FROM horse_pace_state WHERE KettoNum IN ({','.join('?' * len(chunk))})",
+            chunk,
+        )
+        for k, h in cur.fetchall():
+            into[k] = json.loads(h)
+    for k in todo:
+        into.setdefault(k, [])
+
+
+def build_pace_asof(side_db: str, db_path: str, rebuild: bool = False) -> sqlite3.Connection:
+    """N_UMA_RACE を日付順に走査し、horse_pace_asof を作成（または前回の続きから延長）する。
+
+    日ごとに、その日の出走馬全頭を「前日までの状態」で一括判定してから確定走を状態に畳み込む。
+    DataKubun '5'（月曜確定）の通過順は後の '7' で埋まることが多いため、判定には使うが
+    再開点には含めない。全行が '7' でない最初の日以降は次回も走査し直すため、状態は
+    その直前の日まで（asof_through）で保存する。
+    進捗行は stderr に出す（分析スクリプトが一時的に作る場合も CSV 出力に混ざらない）。
+    """
+    conn = sqlite3.connect(sqlite_uri(side_db, read_only=False), uri=True)
+    conn.execute("ATTACH DATABASE ? AS src", (sqlite_uri(db_path),))
+    cur = conn.cursor()
+    t0 = time.perf_counter()
+    cur.execute("CREATE TABLE IF NOT EXISTS index_meta (key TEXT PRIMARY KEY, value TEXT)")
+    cur.execute("SELECT value FROM index_meta WHERE key = 'asof_through'")
+    row = cur.fetchone()
+    through = int(row[0]) if row and not rebuild and table_exists(cur, "horse_pace_asof") else 0
+    if not through:
+        cur.execute("DROP TABLE IF EXISTS horse_pace_asof")
+        cur.execute("DROP TABLE IF EXISTS horse_pace_state")
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS horse_pace_asof (
+          KettoNum TEXT NOT NULL,
+          ymd INTEGER NOT NULL,
+          code INTEGER NOT NULL,
+          run1 INTEGER, run2 INTEGER, run3 INTEGER,
+          PRIMARY KEY (KettoNum, ymd)
+        ) WITHOUT ROWID
+        """
+    )
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS horse_pace_state (KettoNum TEXT PRIMARY KEY, hist TEXT NOT NULL) WITHOUT ROWID"
+    )
+    # 前回の未確定区間は作り直す
+    cur.execute("DELETE FROM horse_pace_asof WHERE ymd > ?", (through,))
+
+    src = conn.cursor()
+    src.execute(
+        """
+        SELECT CAST(Year AS INTEGER)*10000 + CAST(MonthDay AS INTEGER) AS ymd,
+               KettoNum, DataKubun, Jyuni1c, Jyuni2c, Jyuni3c, Jyuni4c
+        FROM src.N_UMA_RACE
+        WHERE DataKubun IN ('1','2','3','4','5','6','7')
+          AND KettoNum IS NOT NULL AND KettoNum <> ''
+          AND (Year, MonthDay) > (?, ?)
+        ORDER BY Year, MonthDay
+        """,
+        (f"{through // 10000:04d}", f"{through % 10000:04d}"),
+    )
+    states: Dict[str, List[List[int]]] = {}
+    saved: Optional[Dict[str, List[List[int]]]] = None  # 未確定日の直前で固定した状態
+    dirty: set = set()
+    new_through = through
+    n_rows = 0
+
+    def day_rows() -> Iterable[Tuple]:
+        while True:
+            batch = src.fetchmany(5000)
+            if not batch:
+                return
+            yield from batch
+
+    for ymd, grp in groupby(day_rows(), key=lambda r: r[0]):
+        day: Dict[str, Tuple[bool, List[int]]] = {}
+        final_day = True  # 全行が成績確定('7')か
+        for _, ketto, kubun, c1, c2, c3, c4 in grp:
+            final_day = final_day and str(kubun) == FINAL
+            confirmed = str(kubun) in CONFIRMED
+            if ketto in day and day[ketto][0] and not confirmed:
+                continue
+            day[ketto] = (confirmed, [ymd, corner_int(c1), corner_int(c2), corner_int(c3), corner_int(c4)])
+        kettos = list(day)
+        load_pace_states(cur, kettos, states)
+        hists = [states[k] for k in kettos]
+        codes = classify_histories([[row[1:] for row in h] for h in hists])
+        cur.executemany(
+            "INSERT OR REPLACE INTO horse_pace_asof (KettoNum, ymd, code, run1, run2, run3) VALUES (?, ?, ?, ?, ?, ?)",
+            ((k, ymd, code, *run_keys(h)) for k, code, h in zip(kettos, codes, hists)),
+        )
+        n_rows += len(kettos)
+        if saved is None and not final_day:
+            saved = dict(states)
+        for k, (confirmed, row) in day.items():
+            if confirmed:
+                states[k] = trim_state([row] + states[k])
+                if saved is None:
+                    dirty.add(k)
+        if saved is None:
+            new_through = ymd
+
+    if saved is None:
+        saved = states
+    cur.executemany(
+        "INSERT OR REPLACE INTO horse_pace_state (KettoNum, hist) VALUES (?, ?)",
+        ((k, json.dumps(saved[k], separators=(",", ":"))) for k in dirty),
+    )
+    meta = {f"asof_{k}": v for k, v in source_stamp(db_path).items()}
+    meta["asof_through"] = str(new_through)
+    meta["asof_built_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    cur.executemany("INSERT OR REPLACE INTO index_meta (key, value) VALUES (?, ?)", meta.items())
+    conn.commit()
+    mode = "rebuild" if not through else f"from {through}"
+    print(
+        f"pace asof: {mode} rows={n_rows} through={new_through} states={len(dirty)} "
+        f"{time.perf_counter() - t0:.1f}s -> {side_db}",
+        file=sys.stderr,
+    )
+    return conn
+
+
+def pace_asof_is_fresh(conn: sqlite3.Connection, db_path: str, schema: str = "idx") -> bool:
+    """horse_pace_asof が現在の本体ファイル(サイズ/更新時刻)まで延長済みか。"""
+    cur = conn.cursor()
+    if not table_exists(cur, "index_meta", schema) or not table_exists(cur, "horse_pace_asof", schema):
+        return False
+    cur.execute(f"SELECT key, value FROM {schema}.index_meta")
+    meta = dict(cur.fetchall())
+    now = source_stamp(db_path)
+    return all(meta.get(f"asof_{k}") == now[k] for k in ("src_size", "src_mtime_ns"))
+
+
+def cmd_pace_asof(args: argparse.Namespace) -> None:
+    if not os.path.exists(args.db):
+        raise SystemExit(f"DB not found: {args.db}")
+    conn = build_pace_asof(args.side_db, args.db, rebuild=args.rebuild)
+    conn.close()
+
+
+def cmd_build_facts(args: argparse.Namespace) -> None:
+    if not os.path.exists(args.db):
+        raise SystemExit(f"DB not found: {args.db}")
+    from starter_facts import build_facts  # starter_facts が本モジュールを import するため
+
+    years = [int(y) for y in args.years.split(",") if y.strip()] if args.years else None
+    build_facts(args.db, args.out, index_db=args.index_db, years=years)
+
+
+def cmd_index(args: argparse.Namespace) -> None:
+    if not os.path.exists(args.db):
+        raise SystemExit(f"DB not found: {args.db}")
+
+    if args.side_db:
+        if args.explain:
+            ro = sqlite3.connect(sqlite_uri(args.db), uri=True)
+            print_plans(ro.cursor(), "before (EveryDB2)", PLAN_QUERIES)
+            ro.close()
+        conn = build_side_index(args.side_db, args.db)
+        if args.explain:
+            print_plans(conn.cursor(), "after (index-db)", SIDE_PLAN_QUERIES)
+        conn.close()
+        return
+
+    conn = sqlite3.connect(args.db)
+    cur = conn.cursor()
+    before = print_plans(cur, "before", PLAN_QUERIES) if args.explain else {}
+    create_indexes(conn)
+    if args.explain:
+        after = print_plans(cur, "after", PLAN_QUERIES)
+        print("== full scans ==")
+        for label in after:
+            b = sum(1 for ln in before.get(label, []) if is_full_scan(ln))
+            a = sum(1 for ln in after[label] if is_full_scan(ln))
+            print(f"- {label}: {b} -> {a}")
+    conn.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="EveryDB2(SQLite) 保守コマンド")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    ap_index = sub.add_parser("index", help="スクリプト用の索引を作成")
+    ap_index.add_argument("--db", required=True, help="EveryDB2 SQLite DB file path")
+    ap_index.add_argument(
+        "--side-db",
+        help="本体を変更せず、別DBに近走参照テーブル(uma_hist)と索引を作成",
+    )
+    ap_index.add_argument(
+        "--no-explain",
+        dest="explain",
+        action="store_false",
+        help="EXPLAIN QUERY PLAN の前後比較を出力しない",
+    )
+    ap_index.set_defaults(func=cmd_index)
+
+    ap_asof = sub.add_parser("pace-asof", help="側DBに出走日時点の展開タイプ表を作成/増分更新")
+    ap_asof.add_argument("--db", required=True, help="EveryDB2 SQLite DB file path")
+    ap_asof.add_argument("--side-db", required=True, help="作成先の側DB（index --side-db と同じファイルでよい）")
+    ap_asof.add_argument("--rebuild", action="store_true", help="増分ではなく全期間を作り直す")
+    ap_asof.set_defaults(func=cmd_pace_asof)
+
+    ap_facts = sub.add_parser("build-facts", help="確定出走を年ごとの列指向ファイル(Parquet/npz)に書き出す")
+    ap_facts.add_argument("--db", required=True, help="EveryDB2 SQLite DB file path")
+    ap_facts.add_argument("--out", default=os.path.join("data", "facts"), help="出力ディレクトリ")
+    ap_facts.add_argument(
+        "--index-db",
+        default=os.environ.get("EDB_INDEX_PATH"),
+        help="horse_pace_asof のある側DB（無い・古い場合は一時的に作成）",
+    )
+    ap_facts.add_argument("--years", help="作り直す年（カンマ区切り。既定は全年）")
+    ap_facts.set_defaults(func=cmd_build_facts)
+
+    args = ap.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+export_raceday.py --profile 用の計測
+
+- フェーズ別の経過時間（同名フェーズは加算）
+- SQL 文ごとの実行回数・時間・VM命令数（正規化した文面でまとめる）
+  sqlite3 の trace コールバックで文の開始を、progress ハンドラで実行中の進捗を捉える。
+  文の時間は「開始 → 最後の進捗通知」で近似する（PROGRESS_OPS 命令ごとの粒度）。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+PROGRESS_OPS = 1000  # progress ハンドラを呼ぶ VM 命令間隔
+
+_RE_STR = re.compile(r"'(?:[^']|'')*'")
+_RE_NUM = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_IN = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_WS = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    # リテラルを ? に、IN (?,?,...) を (?...) に畳んで同種の文をまとめる
+    s = _RE_STR.sub("?", sql)
+    s = _RE_NUM.sub("?", s)
+    s = _RE_IN.sub("(?...)", s)
+    return _RE_WS.sub(" ", s).strip()
+
+
+class ExportProfiler:
+    def __init__(self) -> None:
+        self.phases: Dict[str, float] = defaultdict(float)
+        self.sql: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "seconds": 0.0, "vm_steps": 0})
+        self._cur_sql: Optional[str] = None
+        self._cur_start = 0.0
+        self._cur_last = 0.0
+        self._conn: Optional[sqlite3.Connection] = None
+
+    # --- フェーズ ---
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - t0
+
+    # --- SQL ---
+    def attach(self, conn: sqlite3.Connection) -> None:
+        self._conn = conn
+        conn.set_trace_callback(self._on_trace)
+        conn.set_progress_handler(self._on_progress, PROGRESS_OPS)
+
+    def detach(self) -> None:
+        self._close_statement()
+        if self._conn is not None:
+            self._conn.set_trace_callback(None)
+            self._conn.set_progress_handler(None, 0)
+            self._conn = None
+
+    def _close_statement(self) -> None:
+        if self._cur_sql is not None:
+            self.sql[self._cur_sql]["seconds"] += self._cur_last - self._cur_start
+            self._cur_sql = None
+
+    def _on_trace(self, sql: str) -> None:
+        self._close_statement()
+        key = normalize_sql(sql)
+        self.sql[key]["count"] += 1
+        self._cur_sql = key
+        self._cur_start = self._cur_last = time.perf_counter()
+
+    def _on_progress(self) -> int:
+        if self._cur_sql is not None:
+            self._cur_last = time.perf_counter()
+            self.sql[self._cur_sql]["vm_steps"] += PROGRESS_OPS
+        return 0  # 0 = 続行
+
+    # --- 出力 ---
+    def report(self, date: str) -> dict:
+        self._close_statement()
+        stmts = sorted(
+            ({"statement": k, **v} for k, v in self.sql.items()),
+            key=lambda x: x["seconds"],
+            reverse=True,
+        )
+        for st in stmts:
+            st["seconds"] = round(st["seconds"], 6)
+        return {
+            "date": date,
+            "phases": {k: round(v, 6) for k, v in self.phases.items()},
+            "total_seconds": round(sum(self.phases.values()), 6),
+            "sql_statements": sum(int(v["count"]) for v in self.sql.values()),
+            "sql": stmts,
+        }
+
+    def write(self, date: str, outdir: str) -> str:
+        """日次JSONの隣に YYYY-MM-DD.profile.json として書き出す。"""
+        path = os.path.join(outdir, f"{date}.profile.json")
+        tmp = f"{path}.tmp-{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.report(date), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+        return path
+
+
+class NullProfiler:
+    """--profile なしのときの何もしない計測器。"""
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        yield
+
+
+NULL_PROFILER = NullProfiler()
@@ -11,6 +11,7 @@ SQLite → RaceDay(JSON) エクスポート
 出力:
 - data/days/YYYY-MM-DD.json (RaceDayスキーマ)
 - --publish-latest 指定時: public/data/date1..4.json に最新4件を配置
+- --publish-only 指定時: エクスポートせず data/days の最新4件を公開のみ（脚質付与後の再発行用。--db 不要）
 
 使用例:
   python3 scripts/sqlite/export_raceday.py --db path/to/everydb2.sqlite --latest 4 --publish-latest
@@ -20,14 +21,22 @@ SQLite → RaceDay(JSON) エクスポート
 from __future__ import annotations
 
 import argparse
+import gzip
+import hashlib
 import json
 import os
 import sqlite3
+import sys
+import time
 from collections import defaultdict
-from dataclasses import dataclass, asdict
-from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
 import re
 
+from bias_engine import aggregate_bias, aggregate_day, bias_summary
+from export_profile import NULL_PROFILER, ExportProfiler
+from pace_classifier import LABELS, classify_histories, race_pace_scores
+
 
 # --- Static mappings (最小限) ---
 JYOCD_TO_TRACK = {
@@ -107,34 +116,92 @@ def ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def query_single_text_map(cur: sqlite3.Cursor, table: str, code_col: str, name_candidates: List[str]) -> Dict[str, str]:
-    # テーブル存在確認＆定義から最適な名称列を推測
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
-    row = cur.fetchone()
-    if not row:
-        return {}
-    cur.execute(f"PRAGMA table_info({table})")
-    cols = [r[1] for r in cur.fetchall()]
-    name_col = None
-    for cand in name_candidates:
-        if cand in cols:
-            name_col = cand
-            break
-    if not name_col:
+class NameResolver:
+    """コード→氏名の解決（騎手/調教師）。
+
+    - 名称列の推定(sqlite_master / PRAGMA table_info)はDBファイルごとにプロセス内で1回
+    - 氏名は当日の出馬表に現れたコードだけを IN (...) で取得し、
+      (DBファイル, 更新時刻, PRAGMA data_version) が変わるまでキャッシュする
+    """
+
+    CHUNK = 500  # SQLite の変数上限(古い版で999)未満
+
+    def __init__(self, table: str, code_col: str, name_candidates: List[str]):
+        self.table = table
+        self.code_col = code_col
+        self.name_candidates = name_candidates
+        self._name_col: Dict[str, Optional[str]] = {}
+        self._names: Dict[Tuple, Dict[str, Optional[str]]] = {}
+
+    @staticmethod
+    def _db_file(cur: sqlite3.Cursor) -> str:
+        cur.execute("PRAGMA database_list")
+        for _, name, path in cur.fetchall():
+            if name == "main":
+                return path or ""
+        return ""
+
+    def _resolve_name_col(self, cur: sqlite3.Cursor) -> Optional[str]:
+        # テーブル存在確認＆定義から最適な名称列を推測
+        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (self.table,))
+        if not cur.fetchone():
+            return None
+        cur.execute(f"PRAGMA table_info({self.table})")
+        cols = [r[1] for r in cur.fetchall()]
+        for cand in self.name_candidates:
+            if cand in cols:
+                return cand
         # 最後のfallback: コード以外の最初のTEXT列を名称扱い
-        name_col = next((c for c in cols if c != code_col), None)
-    if not name_col:
-        return {}
-    cur.execute(f"SELECT {code_col}, {name_col} FROM {table}")
-    m: Dict[str, str] = {}
-    for code, name in cur.fetchall():
-        if code is None:
-            continue
-        m[str(code)] = str(name) if name is not None else ""
-    return m
+        return next((c for c in cols if c != self.code_col), None)
+
+    def _cache_key(self, cur: sqlite3.Cursor, db_file: str) -> Tuple:
+        cur.execute("PRAGMA data_version")
+        data_version = cur.fetchone()[0]
+        try:
+            mtime = os.stat(db_file).st_mtime_ns if db_file else 0
+        except OSError:
+            mtime = 0
+        return (db_file, mtime, data_version)
+
+    def lookup(self, cur: sqlite3.Cursor, codes: Iterable[Optional[str]]) -> Dict[str, str]:
+        """codes に含まれるコードの氏名を返す（未登録コードは含まない）。"""
+        db_file = self._db_file(cur)
+        if db_file not in self._name_col:
+            self._name_col[db_file] = self._resolve_name_col(cur)
+        name_col = self._name_col[db_file]
+        if not name_col:
+            return {}
+        key = self._cache_key(cur, db_file)
+        cache = self._names.get(key)
+        if cache is None:
+            # DB更新時は同一ファイルの古いキャッシュを捨てる
+            for k in [k for k in self._names if k[0] == db_file]:
+                del self._names[k]
+            cache = self._names[key] = {}
+        wanted = {str(c) for c in codes if c is not None}
+        missing = [c for c in wanted if c not in cache]
+        for i in range(0, len(missing), self.CHUNK):
+            chunk = missing[i : i + self.CHUNK]
+            cur.execute(
+                f"SELECT {self.code_col}, {name_col} FROM {self.table}"
+                f" WHERE {self.code_col} IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for code, name in cur.fetchall():
+                if code is None:
+                    continue
+                cache[str(code)] = str(name) if name is not None else ""
+            for c in chunk:
+                cache.setdefault(c, None)  # 未登録も記録して再問い合わせしない
+        return {c: cache[c] for c in wanted if cache.get(c) is not None}
 
 
-@dataclass
+KISYU_NAMES = NameResolver("N_KISYU", "KisyuCode", ["KisyuName", "KisyuRyakusyo", "KisyuNameKana"])
+CHOKYO_NAMES = NameResolver("N_CHOKYO", "ChokyosiCode", ["ChokyosiName", "ChokyosiRyakusyo", "ChokyosiNameKana"])
+
+
+# 1年分(数十万頭)を1プロセスで保持しても軽いよう __slots__ 付きで定義する
+@dataclass(slots=True)
 class Horse:
     num: int
     draw: int
@@ -150,7 +217,7 @@ class Horse:
     ketto: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Race:
     no: int
     name: str
@@ -164,84 +231,277 @@ class Race:
     horses: List[Horse] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Meeting:
     track: str
     kaiji: int
     nichiji: int
     races: List[Race]
+    # 馬場("芝"/"ダ")ごとのポジション/枠順バイアス。集計対象レースがなければ None
+    position_bias: Optional[Dict[str, dict]] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class RaceDay:
     date: str
     meetings: List[Meeting]
 
 
 def get_available_dates(cur: sqlite3.Cursor) -> List[str]:
+    # 索引(Year, MonthDay, ...)の順に走査できるよう、整形はPython側で行う
     cur.execute(
         """
-        SELECT DISTINCT printf('%04d%04d', CAST(Year AS INTEGER), CAST(MonthDay AS INTEGER)) AS ymd
+        SELECT DISTINCT Year, MonthDay
         FROM N_RACE
         WHERE Year <> '' AND MonthDay <> ''
-        ORDER BY ymd
+        ORDER BY Year, MonthDay
         """
     )
-    return [r[0] for r in cur.fetchall() if r[0]]
+    out: List[str] = []
+    for y, md in cur.fetchall():
+        yi = to_int_or_none(y)
+        mdi = to_int_or_none(md)
+        if yi is None or mdi is None:
+            continue
+        out.append(f"{yi:04d}{mdi:04d}")
+    return sorted(set(out))
 
 
-def build_raceday(cur: sqlite3.Cursor, ymd: str) -> RaceDay:
-    yyyy = ymd[:4]
-    mmdd = ymd[4:]
-    date_iso = f"{yyyy}-{mmdd[:2]}-{mmdd[2:]}"
+# ラベル列は数通りしかないため同一リストを共有する（1頭ごとの list を持たない）。共有物なので変更しないこと
+_PACE_LABELS: Dict[Tuple[str, ...], List[str]] = {}
 
-    # 騎手/調教師のコード→氏名
-    kisyu_map = query_single_text_map(cur, "N_KISYU", "KisyuCode", ["KisyuName", "KisyuRyakusyo", "KisyuNameKana"])
-    chokyo_map = query_single_text_map(cur, "N_CHOKYO", "ChokyosiCode", ["ChokyosiName", "ChokyosiRyakusyo", "ChokyosiNameKana"])
 
-    # レース一覧
+def intern_pace_labels(labels: Optional[List[str]]) -> Optional[List[str]]:
+    if not labels:
+        return None
+    return _PACE_LABELS.setdefault(tuple(labels), list(labels))
+
+
+# pace_classifier のラベルコード -> 共有ラベル列
+PACE_TYPE_BY_CODE: List[Optional[List[str]]] = [intern_pace_labels(list(lb)) for lb in LABELS]
+
+
+def fetch_day_pace_asof(cur: sqlite3.Cursor, kettos: Iterable[str], yyyy: str, mmdd: str) -> Dict[str, int]:
+    """当日出走馬の展開タイプ(ラベルコード)を側DBの idx.horse_pace_asof から主キー参照で取得する。
+
+    edb_tool.py pace-asof で作成。表に無い馬（作成後に追加された出走など）は戻り値に含まれない。
+    """
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS day_ketto (KettoNum TEXT PRIMARY KEY)")
+    cur.execute("DELETE FROM temp.day_ketto")
+    cur.executemany(
+        "INSERT OR IGNORE INTO temp.day_ketto (KettoNum) VALUES (?)",
+        ((k,) for k in kettos if k),
+    )
     cur.execute(
         """
-        SELECT
-          Year, MonthDay, JyoCD, Kaiji, Nichiji, RaceNum,
-          Hondai, Kyori, TrackCD, SibaBabaCD, DirtBabaCD, HassoTime,
-          KigoCD
-        FROM N_RACE
-        WHERE Year = ? AND MonthDay = ?
-        ORDER BY JyoCD, Kaiji, Nichiji, CAST(RaceNum AS INTEGER)
+        SELECT a.KettoNum, a.code
+        FROM temp.day_ketto AS k
+        JOIN idx.horse_pace_asof AS a ON a.KettoNum = k.KettoNum AND a.ymd = ?
         """,
-        (yyyy, mmdd),
+        (int(f"{yyyy}{mmdd}"),),
     )
-    races = cur.fetchall()
+    return dict(cur.fetchall())
+
+
+def fetch_day_pace_history(
+    cur: sqlite3.Cursor,
+    kettos: Iterable[str],
+    yyyy: str,
+    mmdd: str,
+    side_index: bool = False,
+) -> Dict[str, List[Tuple]]:
+    """当日出走馬全頭の近走通過順(対象日より前・新しい順に最大20件)を1クエリで取得する。
+
+    出走馬の KettoNum を一時テーブルへ集め、ROW_NUMBER() で馬ごとの直近20件に絞る。
+    side_index=True のときは ATTACH 済みの側DB(idx.uma_hist, edb_tool.py index --side-db)を参照する。
+    戻り値: KettoNum -> [(Jyuni1c, Jyuni2c, Jyuni3c, Jyuni4c), ...]
+    """
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS day_ketto (KettoNum TEXT PRIMARY KEY)")
+    cur.execute("DELETE FROM temp.day_ketto")
+    cur.executemany(
+        "INSERT OR IGNORE INTO temp.day_ketto (KettoNum) VALUES (?)",
+        ((k,) for k in kettos if k),
+    )
+    if side_index:
+        # 側DB: 確定データのみ・整数日付キー
+        source = """
+          SELECT
+            h.KettoNum, h.Jyuni1c, h.Jyuni2c, h.Jyuni3c, h.Jyuni4c,
+            ROW_NUMBER() OVER (PARTITION BY h.KettoNum ORDER BY h.ymd DESC) AS rn
+          FROM temp.day_ketto AS k
+          JOIN idx.uma_hist AS h ON h.KettoNum = k.KettoNum
+          WHERE h.ymd < ?
+        """
+        params: tuple = (int(f"{yyyy}{mmdd}"),)
+    else:
+        # Year/MonthDay は固定長ゼロ埋め文字列のため、行値比較で索引(KettoNum, Year, MonthDay)を使える
+        source = """
+          SELECT
+            um.KettoNum, um.Jyuni1c, um.Jyuni2c, um.Jyuni3c, um.Jyuni4c,
+            ROW_NUMBER() OVER (
+              PARTITION BY um.KettoNum
+              ORDER BY um.Year DESC, um.MonthDay DESC
+            ) AS rn
+          FROM temp.day_ketto AS k
+          JOIN N_UMA_RACE AS um ON um.KettoNum = k.KettoNum
+          WHERE um.DataKubun IN ('5','7')
+            AND (um.Year, um.MonthDay) < (?, ?)
+        """
+        params = (yyyy, mmdd)
+    cur.execute(
+        f"""
+        SELECT KettoNum, Jyuni1c, Jyuni2c, Jyuni3c, Jyuni4c
+        FROM ({source})
+        WHERE rn <= 20
+        ORDER BY KettoNum, rn
+        """,
+        params,
+    )
+    hist: Dict[str, List[Tuple]] = defaultdict(list)
+    for ketto, c1, c2, c3, c4 in cur.fetchall():
+        hist[ketto].append((c1, c2, c3, c4))
+    return hist
+
+
+# レース識別キー (JyoCD, Kaiji, Nichiji, RaceNum)。DBの生値のまま保持する
+RaceKey = Tuple[str, str, str, str]
+
+
+@dataclass
+class DayRows:
+    """1開催日分の N_RACE / N_UMA_RACE(+単勝オッズ) をレース単位にまとめたもの。
+
+    races:   N_RACE の行（開催→レース番号順）
+    entries: RaceKey -> 出走馬の行（馬番順）。列順:
+      Umaban, Wakuban, Bamei, SexCD, Barei, Futan, KisyuCode, ChokyosiCode,
+      Odds, Ninki, Jyuni1c..Jyuni4c, KettoNum, KakuteiJyuni, DataKubun, RawNinki
+    """
+
+    races: List[Tuple]
+    entries: Dict[RaceKey, List[Tuple]]
+
+
+def coalesce_zero(v, fallback):
+    # SQL の CASE WHEN v IS NULL OR CAST(v AS INTEGER) = 0 THEN fallback ELSE v END と同等
+    return fallback if not to_int_or_none(v) else v
+
+
+def load_day_rows(cur: sqlite3.Cursor, yyyy: str, mmdd: str, prof=NULL_PROFILER) -> DayRows:
+    """開催日単位で N_RACE / N_UMA_RACE / S_ODDS_TANPUKU をテーブルごとに1クエリで読み込む。
+
+    オッズ/人気の S_ODDS_TANPUKU フォールバックはメモリ上で解決する。
+    Odds/Ninki はフォールバック適用後、RawNinki は N_UMA_RACE.Ninki の生値（バイアス集計用）。
+    """
+    with prof.phase("race_list"):
+        cur.execute(
+            """
+            SELECT
+              Year, MonthDay, JyoCD, Kaiji, Nichiji, RaceNum,
+              Hondai, Kyori, TrackCD, SibaBabaCD, DirtBabaCD, HassoTime,
+              KigoCD, JyokenName, Ryakusyo10
+            FROM N_RACE
+            WHERE Year = ? AND MonthDay = ?
+            ORDER BY JyoCD, Kaiji, Nichiji, CAST(RaceNum AS INTEGER)
+            """,
+            (yyyy, mmdd),
+        )
+        races = cur.fetchall()
+
+    with prof.phase("entries"):
+        # 単勝オッズ/人気: (JyoCD, RaceNum, Umaban) -> (TanOdds, TanNinki)
+        cur.execute(
+            """
+            SELECT JyoCD, RaceNum, Umaban, TanOdds, TanNinki
+            FROM S_ODDS_TANPUKU
+            WHERE Year = ? AND MonthDay = ?
+            """,
+            (yyyy, mmdd),
+        )
+        odds_map: Dict[Tuple[str, str, str], Tuple] = {}
+        for jyo, race_num, umaban, tan_odds, tan_ninki in cur.fetchall():
+            odds_map.setdefault((jyo, race_num, umaban), (tan_odds, tan_ninki))
+
+        cur.execute(
+            """
+            SELECT
+              JyoCD, Kaiji, Nichiji, RaceNum,
+              Umaban, Wakuban, Bamei, SexCD, Barei, Futan,
+              KisyuCode, ChokyosiCode, Odds, Ninki,
+              Jyuni1c, Jyuni2c, Jyuni3c, Jyuni4c,
+              KettoNum, KakuteiJyuni, DataKubun
+            FROM N_UMA_RACE
+            WHERE Year = ? AND MonthDay = ?
+              AND DataKubun IN ('1','2','3','4','5','6','7')
+            ORDER BY JyoCD, Kaiji, Nichiji, RaceNum, CAST(Umaban AS INTEGER)
+            """,
+            (yyyy, mmdd),
+        )
+        entries: Dict[RaceKey, List[Tuple]] = defaultdict(list)
+        for (
+            JyoCD, Kaiji, Nichiji, RaceNum,
+            Umaban, Wakuban, Bamei, SexCD, Barei, Futan,
+            KisyuCode, ChokyosiCode, Odds, Ninki,
+            Jyuni1c, Jyuni2c, Jyuni3c, Jyuni4c,
+            KettoNum, KakuteiJyuni, DataKubun,
+        ) in cur.fetchall():
+            tan_odds, tan_ninki = odds_map.get((JyoCD, RaceNum, Umaban), (None, None))
+            entries[(JyoCD, Kaiji, Nichiji, RaceNum)].append(
+                (
+                    Umaban, Wakuban, Bamei, SexCD, Barei, Futan,
+                    KisyuCode, ChokyosiCode,
+                    coalesce_zero(Odds, tan_odds),
+                    coalesce_zero(Ninki, tan_ninki),
+                    Jyuni1c, Jyuni2c, Jyuni3c, Jyuni4c,
+                    KettoNum, KakuteiJyuni, DataKubun, Ninki,
+                )
+            )
+    return DayRows(races=races, entries=entries)
+
+
+def build_raceday(
+    cur: sqlite3.Cursor,
+    ymd: str,
+    side_index: bool = False,
+    pace_asof: bool = False,
+    prof=NULL_PROFILER,
+    day: Optional[DayRows] = None,
+) -> RaceDay:
+    yyyy = ymd[:4]
+    mmdd = ymd[4:]
+    date_iso = f"{yyyy}-{mmdd[:2]}-{mmdd[2:]}"
+
+    # 当日分の N_RACE / N_UMA_RACE / 単勝オッズを一括読み込み（カード生成とバイアス集計で共用）。
+    # 呼び出し側で読み込み済み（指紋の計算に使った行）ならそれを使う
+    if day is None:
+        day = load_day_rows(cur, yyyy, mmdd, prof=prof)
+
+    # 騎手/調教師のコード→氏名（当日の出馬表に現れるコードのみ）
+    with prof.phase("names"):
+        kisyu_map = KISYU_NAMES.lookup(cur, (row[6] for rows in day.entries.values() for row in rows))
+        chokyo_map = CHOKYO_NAMES.lookup(cur, (row[7] for rows in day.entries.values() for row in rows))
+
+    # 出走馬全頭の展開タイプ: pace_asof 表にあれば主キー参照、無い馬だけ近走を一括取得（馬ごとの個別クエリを避ける）
+    day_kettos = [row[14] for rows in day.entries.values() for row in rows if row[14]]
+    with prof.phase("pace_history"):
+        code_by_ketto = fetch_day_pace_asof(cur, day_kettos, yyyy, mmdd) if pace_asof else {}
+        need = list(dict.fromkeys(k for k in day_kettos if k not in code_by_ketto))
+        pace_hist = fetch_day_pace_history(cur, need, yyyy, mmdd, side_index=side_index) if need else {}
+
+    # 展開タイプ(全頭)とレースごとの展開スコアを一括判定
+    with prof.phase("pace_classify"):
+        code_by_ketto.update(zip(need, classify_histories([pace_hist.get(k, []) for k in need])))
+        pace_codes: List[int] = []
+        day_race_idx: List[int] = []
+        for ri, r in enumerate(day.races):
+            for row in day.entries.get((r[2], r[3], r[4], r[5]), []):
+                pace_codes.append(code_by_ketto.get(row[14], 0) if row[14] else 0)
+                day_race_idx.append(ri)
+        pace_scores, pace_marks = race_pace_scores(pace_codes, day_race_idx, len(day.races))
+    hi = 0  # pace_codes の位置（レース・馬の走査順）
 
     # meetingごとにまとめる
     meetings_dict: Dict[Tuple[str, int, int], List[Race]] = defaultdict(list)
-    # ポジション/枠順バイアス集計（当日・開催×馬場）
-    # 形式: agg[(jyo,kaiji,nichiji)][ground] = {
-    #   "pace": { "wp": {A,B,C,total}, "q": {...}, "ls": {...} },
-    #   "draw": { "inner":0, "outer":0, "total":0, "race_count":0 }
-    # }
-    def empty_pace():
-        return {"A": 0, "B": 0, "C": 0, "total": 0}
-    bias_agg: Dict[Tuple[str,int,int], Dict[str, Dict[str, dict]]] = defaultdict(lambda: defaultdict(lambda: {"pace": {"wp": empty_pace(), "q": empty_pace(), "ls": empty_pace()}, "draw": {"inner": 0, "outer": 0, "total": 0, "race_count": 0}}))
-    def to_pos_type(c1, c2, c3, c4) -> str | None:
-        def cnv(x):
-            try:
-                v = int(str(x).strip())
-                return v if v > 0 else None
-            except Exception:
-                return None
-        vals = [cnv(c1), cnv(c2), cnv(c3), cnv(c4)]
-        pres = [v for v in vals if v is not None]
-        if not pres:
-            return None
-        if all(v <= 4 for v in pres):
-            return 'A'  # 先行
-        if all(v >= 5 for v in pres):
-            return 'B'  # 差し（後方）
-        return 'C'
-
-    for r in races:
+    for ri, r in enumerate(day.races):
         (
             Year,
             MonthDay,
@@ -256,215 +516,70 @@ def build_raceday(cur: sqlite3.Cursor, ymd: str) -> RaceDay:
             DirtBabaCD,
             HassoTime,
             KigoCD,
+            JyokenName,
+            Ryakusyo10,
         ) = r
 
-        key_cols = (Year, MonthDay, JyoCD, Kaiji, Nichiji, RaceNum)
-
-        # 馬一覧（出走登録〜確定データ）
-        cur.execute(
-            """
-            SELECT
-              um.Umaban, um.Wakuban, um.Bamei, um.SexCD, um.Barei, um.Futan,
-              um.KisyuCode, um.ChokyosiCode,
-              CASE
-                WHEN um.Odds IS NULL OR CAST(um.Odds AS INTEGER) = 0 THEN so.TanOdds
-                ELSE um.Odds
-              END AS Odds,
-              CASE
-                WHEN um.Ninki IS NULL OR CAST(um.Ninki AS INTEGER) = 0 THEN so.TanNinki
-                ELSE um.Ninki
-              END AS Ninki,
-              um.Jyuni1c, um.Jyuni2c, um.Jyuni3c, um.Jyuni4c,
-              um.KettoNum,
-              um.KakuteiJyuni
-            FROM N_UMA_RACE AS um
-            LEFT JOIN S_ODDS_TANPUKU AS so
-              ON um.Year = so.Year
-              AND um.MonthDay = so.MonthDay
-              AND um.JyoCD = so.JyoCD
-              AND um.RaceNum = so.RaceNum
-              AND um.Umaban = so.Umaban
-            WHERE um.Year=? AND um.MonthDay=? AND um.JyoCD=? AND um.Kaiji=? AND um.Nichiji=? AND um.RaceNum=?
-              AND um.DataKubun IN ('1','2','3','4','5','6','7')
-            ORDER BY CAST(um.Umaban AS INTEGER)
-            """,
-            key_cols,
-        )
-        horses: List[Horse] = []
-        a_headcount = 0
-        b_headcount = 0
-        c_headcount = 0
-        for (
-            Umaban,
-            Wakuban,
-            Bamei,
-            SexCD,
-            Barei,
-            Futan,
-            KisyuCode,
-            ChokyosiCode,
-            Odds,
-            Ninki,
-            Jyuni1c,
-            Jyuni2c,
-            Jyuni3c,
-            Jyuni4c,
-            KettoNum,
-            KakuteiJyuni,
-        ) in cur.fetchall():
-            num = to_int_or_none(Umaban) or 0
-            draw = to_int_or_none(Wakuban) or 0
-            name = (Bamei or "").strip()
-            sex = SEXCD_TO_JA.get(str(SexCD), str(SexCD) if SexCD is not None else "")
-            age = to_int_or_none(Barei) or 0
-            # 斤量: 10倍表現 → 1桁小数
-            fut = to_int_or_none(Futan)
-            weight = round((fut / 10.0), 1) if fut is not None else 0.0
-            jockey = kisyu_map.get(str(KisyuCode), str(KisyuCode) if KisyuCode is not None else "")
-            trainer = chokyo_map.get(str(ChokyosiCode), str(ChokyosiCode) if ChokyosiCode is not None else "")
-            # オッズ: 10倍表現 → 実数
-            o = to_int_or_none(Odds)
-            odds = (o / 10.0) if o is not None else None
-            pop = to_int_or_none(Ninki)
-
-            # 展開タイプ（正式）: 直近3走の分類
-            def to_cint(x):
-                v = to_int_or_none(x)
-                if v is None or v <= 0:
-                    return None
-                return v
-
-            def classify_past(c1,c2,c3,c4):
-                vals = [to_cint(c1), to_cint(c2), to_cint(c3), to_cint(c4)]
-                pres = [v for v in vals if v is not None]
-                if not pres:
-                    return (False, False)  # (nige, senkou)
-                first = pres[0]
-                second = pres[1] if len(pres) >= 2 else None
-                nige = (first == 1) or (first == 2 and second == 1)
-                senkou = all(v <= 4 for v in pres)
-                return (nige, senkou)
-
-            # 直近3走をDBから取得
-            pace_type: Optional[List[str]] = None
-            nige_cnt = 0
-            sen_cnt = 0
-            if KettoNum:
-                cur.execute(
-                    """
-                    SELECT Jyuni1c, Jyuni2c, Jyuni3c, Jyuni4c
-                    FROM N_UMA_RACE
-                    WHERE KettoNum=? AND DataKubun IN ('5','7')
-                      AND CAST(Year AS INTEGER)*10000 + CAST(MonthDay AS INTEGER) < CAST(? AS INTEGER)
-                    ORDER BY CAST(Year AS INTEGER) DESC, CAST(MonthDay AS INTEGER) DESC
-                    LIMIT 20
-                    """,
-                    (KettoNum, f"{yyyy}{mmdd}"),
+        entries = day.entries.get((JyoCD, Kaiji, Nichiji, RaceNum), [])
+
+        with prof.phase("card"):
+            # 馬一覧（出走登録〜確定データ）
+            horses: List[Horse] = []
+            for (
+                Umaban,
+                Wakuban,
+                Bamei,
+                SexCD,
+                Barei,
+                Futan,
+                KisyuCode,
+                ChokyosiCode,
+                Odds,
+                Ninki,
+                Jyuni1c,
+                Jyuni2c,
+                Jyuni3c,
+                Jyuni4c,
+                KettoNum,
+                KakuteiJyuni,
+                DataKubun,
+                RawNinki,
+            ) in entries:
+                num = to_int_or_none(Umaban) or 0
+                draw = to_int_or_none(Wakuban) or 0
+                name = (Bamei or "").strip()
+                sex = SEXCD_TO_JA.get(str(SexCD), str(SexCD) if SexCD is not None else "")
+                age = to_int_or_none(Barei) or 0
+                # 斤量: 10倍表現 → 1桁小数
+                fut = to_int_or_none(Futan)
+                weight = round((fut / 10.0), 1) if fut is not None else 0.0
+                jockey = kisyu_map.get(str(KisyuCode), str(KisyuCode) if KisyuCode is not None else "")
+                trainer = chokyo_map.get(str(ChokyosiCode), str(ChokyosiCode) if ChokyosiCode is not None else "")
+                # オッズ: 10倍表現 → 実数
+                o = to_int_or_none(Odds)
+                odds = (o / 10.0) if o is not None else None
+                pop = to_int_or_none(Ninki)
+
+                # 展開タイプ（正式）: 直近3走の分類（日単位で一括判定済み）
+                pace_type = PACE_TYPE_BY_CODE[pace_codes[hi]]
+                hi += 1
+
+                horses.append(
+                    Horse(
+                        num=num,
+                        draw=draw,
+                        name=name,
+                        sex=sex,
+                        age=age,
+                        weight=weight,
+                        jockey=jockey,
+                        trainer=trainer,
+                        odds=odds,
+                        popularity=pop,
+                        pace_type=pace_type,
+                        ketto=str(KettoNum) if KettoNum else None,
+                    )
                 )
-                considered = 0
-                for p in cur.fetchall():
-                    vals = [to_cint(p[0]), to_cint(p[1]), to_cint(p[2]), to_cint(p[3])]
-                    pres = [v for v in vals if v is not None]
-                    if not pres:
-                        # 全コーナー0/欠損のレースは近3走に含めない
-                        continue
-                    n, s = classify_past(p[0], p[1], p[2], p[3])
-                    nige_cnt += 1 if n else 0
-                    sen_cnt += 1 if s else 0
-                    considered += 1
-                    if considered >= 3:
-                        break
-            # 判定
-            labels: List[str] = []
-            if nige_cnt >= 2:
-                labels.append("A")
-            if sen_cnt >= 2:
-                labels.append("B")
-            elif sen_cnt >= 1:
-                labels.append("C")
-            pace_type = labels or None
-            if pace_type:
-                if "A" in pace_type:
-                    a_headcount += 1
-                if "B" in pace_type:
-                    b_headcount += 1
-                if "C" in pace_type:
-                    c_headcount += 1
-            if pace_type == ["A"]:
-                a_headcount += 1
-
-            horses.append(
-                Horse(
-                    num=num,
-                    draw=draw,
-                    name=name,
-                    sex=sex,
-                    age=age,
-                    weight=weight,
-                    jockey=jockey,
-                    trainer=trainer,
-                    odds=odds,
-                    popularity=pop,
-                    pace_type=pace_type,
-                    ketto=str(KettoNum) if KettoNum else None,
-                )
-            )
-        # バイアス集計（当日・開催×馬場）。障害は除外、新潟芝1000m除外
-        ground = ground_from_trackcd(TrackCD)
-        is_valid_ground = ground in ("芝","ダ")
-        dist_m = to_int_or_none(Kyori) or 0
-        jyo_key = str(JyoCD).zfill(2)
-        skip_course = (jyo_key == "04" and ground == "芝" and dist_m == 1000)
-        if is_valid_ground and not skip_course:
-            # 再取得（同一SQLで再ループする代わりに、上のfetchをやり直す）
-            cur.execute(
-                """
-                SELECT Umaban, Wakuban, Ninki, KakuteiJyuni, Jyuni1c, Jyuni2c, Jyuni3c, Jyuni4c
-                FROM N_UMA_RACE
-                WHERE Year=? AND MonthDay=? AND JyoCD=? AND Kaiji=? AND Nichiji=? AND RaceNum=?
-                  AND DataKubun IN ('5','7')
-                ORDER BY CAST(Umaban AS INTEGER)
-                """,
-                key_cols,
-            )
-            entries = cur.fetchall()
-            headcount = len(entries)
-            agg_entry = bias_agg[(jyo_key, to_int_or_none(Kaiji) or 0, to_int_or_none(Nichiji) or 0)][ground]
-            for (u,w,pop_,fin,c1,c2,c3,c4) in entries:
-                # 着順・人気
-                try:
-                    fin_i = int(str(fin).strip())
-                except Exception:
-                    fin_i = None
-                try:
-                    pop_i = int(str(pop_).strip())
-                except Exception:
-                    pop_i = None
-                pos = to_pos_type(c1,c2,c3,c4)
-                if fin_i is not None and fin_i <= 3 and pos in ('A','B','C'):
-                    agg_entry["pace"]["wp"][pos] += 1
-                    agg_entry["pace"]["wp"]["total"] += 1
-                    # 枠は頭数14以上かつ内外判定可能時に加算
-                    try:
-                        wak = int(str(w).strip())
-                    except Exception:
-                        wak = None
-                    if headcount >= 14 and wak is not None:
-                        if 1 <= wak <= 4:
-                            agg_entry["draw"]["inner"] += 1
-                            agg_entry["draw"]["total"] += 1
-                        elif 5 <= wak <= 8:
-                            agg_entry["draw"]["outer"] += 1
-                            agg_entry["draw"]["total"] += 1
-                    if pop_i is not None and pop_i >= 4:
-                        agg_entry["pace"]["ls"][pos] += 1
-                        agg_entry["pace"]["ls"]["total"] += 1
-                if fin_i is not None and fin_i <= 2 and pos in ('A','B','C'):
-                    agg_entry["pace"]["q"][pos] += 1
-                    agg_entry["pace"]["q"]["total"] += 1
-            if headcount >= 14:
-                agg_entry["draw"]["race_count"] += 1
-
         ground = ground_from_trackcd(TrackCD)
         # 馬場状態の選択（芝/ダで使い分け）
         cond_code = None
@@ -477,24 +592,9 @@ def build_raceday(cur: sqlite3.Cursor, ymd: str) -> RaceDay:
             # 障害は芝コンディションに準拠
             cond_code = SibaBabaCD
 
-        # レースの展開カウント
-        pace_score = None
-        pace_mark = None
-        if (a_headcount + b_headcount + c_headcount) == 0:
-            pace_score = -3.5
-            pace_mark = None
-        else:
-            score = 0.0
-            score += b_headcount * 1.0
-            score += c_headcount * 0.5
-            if a_headcount == 0:
-                score += -2.5
-            if a_headcount >= 2:
-                score += 1.5
-            if b_headcount <= 2:
-                score += -1.0
-            pace_score = round(score, 1)
-            pace_mark = "★" if pace_score <= 4.0 else None
+        # レースの展開スコア（pace_classifier.race_pace_scores）
+        pace_score = pace_scores[ri]
+        pace_mark = "★" if pace_marks[ri] else None
 
         race = Race(
             no=to_int_or_none(RaceNum) or 0,
@@ -509,63 +609,53 @@ def build_raceday(cur: sqlite3.Cursor, ymd: str) -> RaceDay:
             horses=horses,
         )
 
-        # レース名フォールバック: Hondaiが空なら 条件名を生成 → JyokenName → Ryakusyo10 → 距離/馬場
-        if not race.name:
-            # まずは条件から推測
-            # 年齢帯: 出走馬の年齢から推測
-            ages = [h.age for h in horses if isinstance(h.age, int) and h.age > 0]
-            age_label = None
-            if ages:
-                if all(a == 2 for a in ages):
-                    age_label = "2歳"
-                else:
-                    # 3歳以上（混在含む）
-                    age_label = "3歳以上"
-
-            # クラス種別: KigoCD の末尾・パターンで推測
-            class_label = None
-            kigo = (KigoCD or "").strip()
-            if kigo:
-                tail2 = kigo[-2:]
-                if kigo.startswith("A0") or kigo.startswith("A"):
-                    if tail2 == "03":
-                        class_label = "1勝クラス"
-                    elif tail2 == "04":
-                        class_label = "2勝クラス"
-                    elif tail2 == "05":
-                        class_label = "3勝クラス"
-                if class_label is None:
-                    if tail2 == "01":
-                        class_label = "新馬"
-                    elif tail2 in ("02", "03", "23", "00") or kigo in ("000",):
-                        class_label = "未勝利"
-                    elif kigo.startswith("N") and tail2 == "04":
-                        class_label = "オープン"
-
-            if age_label and class_label:
-                if ground == "障":
-                    race.name = f"{age_label}障害{class_label}"
-                else:
-                    race.name = f"{age_label}{class_label}"
-
-            # JyokenName を取りにいく（未決なら）
-            cur.execute(
-                """
-                SELECT JyokenName, Ryakusyo10 FROM N_RACE
-                WHERE Year=? AND MonthDay=? AND JyoCD=? AND Kaiji=? AND Nichiji=? AND RaceNum=?
-                LIMIT 1
-                """,
-                key_cols,
-            )
-            row = cur.fetchone()
-            if row:
-                jname, ryaku = row
-                if not race.name:
-                    race.name = (jname or "").strip() or (ryaku or "").strip()
+        with prof.phase("name_fallback"):
+            # レース名フォールバック: Hondaiが空なら 条件名を生成 → JyokenName → Ryakusyo10 → 距離/馬場
             if not race.name:
-                # 例: 芝1500m / ダ1700m
-                dist = to_int_or_none(Kyori) or 0
-                race.name = f"{ground}{dist}m"
+                # まずは条件から推測
+                # 年齢帯: 出走馬の年齢から推測
+                ages = [h.age for h in horses if isinstance(h.age, int) and h.age > 0]
+                age_label = None
+                if ages:
+                    if all(a == 2 for a in ages):
+                        age_label = "2歳"
+                    else:
+                        # 3歳以上（混在含む）
+                        age_label = "3歳以上"
+
+                # クラス種別: KigoCD の末尾・パターンで推測
+                class_label = None
+                kigo = (KigoCD or "").strip()
+                if kigo:
+                    tail2 = kigo[-2:]
+                    if kigo.startswith("A0") or kigo.startswith("A"):
+                        if tail2 == "03":
+                            class_label = "1勝クラス"
+                        elif tail2 == "04":
+                            class_label = "2勝クラス"
+                        elif tail2 == "05":
+                            class_label = "3勝クラス"
+                    if class_label is None:
+                        if tail2 == "01":
+                            class_label = "新馬"
+                        elif tail2 in ("02", "03", "23", "00") or kigo in ("000",):
+                            class_label = "未勝利"
+                        elif kigo.startswith("N") and tail2 == "04":
+                            class_label = "オープン"
+
+                if age_label and class_label:
+                    if ground == "障":
+                        race.name = f"{age_label}障害{class_label}"
+                    else:
+                        race.name = f"{age_label}{class_label}"
+
+                # JyokenName → Ryakusyo10（レース一覧と同じ行から）
+                if not race.name:
+                    race.name = (JyokenName or "").strip() or (Ryakusyo10 or "").strip()
+                if not race.name:
+                    # 例: 芝1500m / ダ1700m
+                    dist = to_int_or_none(Kyori) or 0
+                    race.name = f"{ground}{dist}m"
 
         meetings_dict[(str(JyoCD).zfill(2), to_int_or_none(Kaiji) or 0, to_int_or_none(Nichiji) or 0)].append(race)
 
@@ -580,112 +670,201 @@ def build_raceday(cur: sqlite3.Cursor, ymd: str) -> RaceDay:
     # 開催順でソート: 競馬場→回→日→レース
     meetings.sort(key=lambda m: (m.track, m.kaiji, m.nichiji))
 
-    # 判定ロジック
-    def decide_pace(stat: dict, min_n: int = 1):
-        total = stat.get("total", 0)
-        if total is None or total < min_n or total == 0:
-            return None
-        best = max((('A', stat.get('A',0)), ('B', stat.get('B',0)), ('C', stat.get('C',0))), key=lambda kv: kv[1])
-        label, cnt = best
-        ratio = (cnt / total) if total > 0 else 0.0
-        if ratio >= 0.7:
-            return {"target": label, "ratio": ratio, "n_total": total}
-        return None
-    def decide_draw(stat: dict):
-        races = stat.get("race_count", 0)
-        total = stat.get("total", 0)
-        if races is None or races < 2 or total == 0:
-            return None
-        best = max((('inner', stat.get('inner',0)), ('outer', stat.get('outer',0))), key=lambda kv: kv[1])
-        label, cnt = best
-        ratio = (cnt / total) if total > 0 else 0.0
-        if ratio >= 0.7:
-            return {"target": label, "ratio": ratio, "n_total": total}
-        return None
-
-    # Meetingへ position_bias を付与
-    pos_map: Dict[Tuple[str,int,int], Dict[str, dict]] = {}
-    for key, gmap in bias_agg.items():
-        out_g: Dict[str, dict] = {}
-        for ground, stat in gmap.items():
-            pace = {
-                **({"win_place": decide_pace(stat["pace"]["wp"]) } if decide_pace(stat["pace"]["wp"]) else {}),
-                **({"quinella": decide_pace(stat["pace"]["q"]) } if decide_pace(stat["pace"]["q"]) else {}),
-                **({"longshot": decide_pace(stat["pace"]["ls"], min_n=6) } if decide_pace(stat["pace"]["ls"], min_n=6) else {}),
-            }
-            draw = decide_draw(stat["draw"]) or None
-            out = {"pace": pace}
-            if draw:
-                out["draw"] = draw
-            # フラットも表示するため、閾値未達でも ground を必ず出力
-            out_g[ground] = out
-        if out_g:
-            pos_map[key] = out_g
-
-    # Meeting オブジェクトに動的属性として付与
-    for m in meetings:
-        jyo = [k for k,v in JYOCD_TO_TRACK.items() if v == m.track]
-        if jyo:
-            key = (jyo[0], m.kaiji, m.nichiji)
-            if key in pos_map:
-                setattr(m, 'position_bias', pos_map[key])
+    # ポジション/枠順バイアス（当日・開催×馬場）。読み込み済みの当日行から bias_engine と同じ集計
+    with prof.phase("bias"):
+        bias_agg = aggregate_day(
+            ymd,
+            (
+                (
+                    r[2], r[3], r[4], r[8], r[7],
+                    [
+                        (e[1], e[17], e[15], e[10], e[11], e[12], e[13])
+                        for e in day.entries.get((r[2], r[3], r[4], r[5]), ())
+                        if str(e[16]) in ("5", "7")
+                    ],
+                )
+                for r in day.races
+            ),
+        )
+        for m in meetings:
+            jyo = [k for k,v in JYOCD_TO_TRACK.items() if v == m.track]
+            if jyo:
+                m.position_bias = bias_summary(bias_agg.get((ymd, jyo[0], m.kaiji, m.nichiji), {}))
 
     return RaceDay(date=date_iso, meetings=meetings)
 
 
-def write_raceday_json(rd: RaceDay, outdir: str) -> str:
+def horse_to_dict(h: Horse) -> dict:
+    out = {
+        "num": h.num,
+        "draw": h.draw,
+        "name": h.name,
+        "sex": h.sex,
+        "age": h.age,
+        "weight": h.weight,
+        "jockey": h.jockey,
+        "trainer": h.trainer,
+    }
+    if h.odds is not None:
+        out["odds"] = h.odds
+    if h.popularity is not None:
+        out["popularity"] = h.popularity
+    if h.pace_type:
+        out["pace_type"] = h.pace_type
+    if h.ketto:
+        out["ketto"] = h.ketto
+    return out
+
+
+def race_to_dict(r: Race) -> dict:
+    out = {
+        "no": r.no,
+        "name": r.name,
+        "distance_m": r.distance_m,
+        "ground": r.ground,
+    }
+    if r.pace_score is not None:
+        out["pace_score"] = r.pace_score
+    if r.pace_mark:
+        out["pace_mark"] = r.pace_mark
+    if r.course_note:
+        out["course_note"] = r.course_note
+    if r.condition:
+        out["condition"] = r.condition
+    if r.start_time:
+        out["start_time"] = r.start_time
+    out["horses"] = [horse_to_dict(h) for h in r.horses]
+    return out
+
+
+def meeting_to_dict(m: Meeting) -> dict:
+    out = {
+        "track": m.track,
+        "kaiji": m.kaiji,
+        "nichiji": m.nichiji,
+    }
+    if m.position_bias is not None:
+        out["position_bias"] = m.position_bias
+    out["races"] = [race_to_dict(r) for r in m.races]
+    return out
+
+
+try:  # 任意依存: あれば compact 出力に使用
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def dumps_compact(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_raceday_json(rd: RaceDay, outdir: str, compact: bool = False) -> str:
+    """RaceDay を開催(meeting)単位で一時ファイルへ書き出し、rename で置き換える。
+
+    既定は従来どおり indent=2（json.dump の出力とバイト単位で同一）。
+    compact=True で改行・インデントなし（orjson があれば使用）。
+    """
     ensure_dir(outdir)
     path = os.path.join(outdir, f"{rd.date}.json")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(
-            {"date": rd.date, "meetings": [
-                {
-                    "track": m.track,
-                    "kaiji": m.kaiji,
-                    "nichiji": m.nichiji,
-                    **({"position_bias": getattr(m, 'position_bias')} if hasattr(m, 'position_bias') else {}),
-                    "races": [
-                        {
-                            "no": r.no,
-                            "name": r.name,
-                            "distance_m": r.distance_m,
-                            "ground": r.ground,
-                            **({"pace_score": r.pace_score} if r.pace_score is not None else {}),
-                            **({"pace_mark": r.pace_mark} if r.pace_mark else {}),
-                            **({"course_note": r.course_note} if r.course_note else {}),
-                            **({"condition": r.condition} if r.condition else {}),
-                            **({"start_time": r.start_time} if r.start_time else {}),
-                            "horses": [
-                                {
-                                    "num": h.num,
-                                    "draw": h.draw,
-                                    "name": h.name,
-                                    "sex": h.sex,
-                                    "age": h.age,
-                                    "weight": h.weight,
-                                    "jockey": h.jockey,
-                                    "trainer": h.trainer,
-                                    **({"odds": h.odds} if h.odds is not None else {}),
-                                    **({"popularity": h.popularity} if h.popularity is not None else {}),
-                                    **({"pace_type": h.pace_type} if h.pace_type else {}),
-                                    **({"ketto": h.ketto} if getattr(h, 'ketto', None) else {}),
-                                }
-                                for h in r.horses
-                            ],
-                        }
-                        for r in m.races
-                    ],
-                }
-                for m in rd.meetings
-            ]},
-            f,
-            ensure_ascii=False,
-            indent=2,
-        )
+    tmp = f"{path}.tmp-{os.getpid()}"
+    head = {"date": rd.date}
+    try:
+        with open(tmp, "wb") as f:
+            if compact:
+                f.write(dumps_compact(head)[:-1] + b',"meetings":[')
+                for i, m in enumerate(rd.meetings):
+                    if i:
+                        f.write(b",")
+                    f.write(dumps_compact(meeting_to_dict(m)))
+                f.write(b"]}")
+            elif not rd.meetings:
+                f.write(json.dumps({**head, "meetings": []}, ensure_ascii=False, indent=2).encode("utf-8"))
+            else:
+                # json.dump(indent=2) と同じ体裁: meeting を個別に整形し、2段分(4桁)字下げして連結
+                f.write(json.dumps(head, ensure_ascii=False, indent=2)[:-2].encode("utf-8"))
+                f.write(b',\n  "meetings": [\n')
+                for i, m in enumerate(rd.meetings):
+                    if i:
+                        f.write(b",\n")
+                    text = json.dumps(meeting_to_dict(m), ensure_ascii=False, indent=2)
+                    f.write(("    " + text.replace("\n", "\n    ")).encode("utf-8"))
+                f.write(b"\n  ]\n}")
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
     return path
 
 
-def publish_latest(days_dir: str, public_dir: str, latest_n: int = 4) -> List[str]:
+try:  # 任意依存: あれば .br サイドカーも出力
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover
+    brotli = None
+
+PUBLISH_MANIFEST_NAME = "publish-manifest.json"
+
+
+def write_bytes_atomic(path: str, data: bytes) -> None:
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def sha256_file(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def publish_file(src: str, dst: str, sidecars: bool = True, prev: Optional[dict] = None) -> Tuple[dict, bool]:
+    """src を dst へ内容ハッシュ比較つきで配置し、.gz/.br サイドカーを生成する。
+
+    サイドカーは元にした JSON の sha256 をマニフェスト（<gzip|br>_source_sha256）に記録し、
+    前回のマニフェスト項目 prev の記録が今回の内容と異なれば作り直す。dst だけを他の出力
+    （publish-latest.ts / pg 版）が書き換えた場合も古いサイドカーを残さない。sidecars=False や
+    brotli 未導入で出力しない形式の既存サイドカーは、dst と食い違わないよう削除する。
+    戻り値: (マニフェスト項目, dst を書き換えたか)
+    """
+    with open(src, "rb") as rf:
+        data = rf.read()
+    digest = hashlib.sha256(data).hexdigest()
+    changed = sha256_file(dst) != digest
+    if changed:
+        write_bytes_atomic(dst, data)
+    entry = {
+        "source": os.path.basename(src),
+        "sha256": digest,
+        "etag": f'"{digest[:32]}"',
+        "bytes": len(data),
+    }
+    # mtime=0 で gzip 出力を内容のみに依存させる（不要な差分を出さない）
+    encoders = [
+        ("gzip", ".gz", lambda b: gzip.compress(b, compresslevel=9, mtime=0)),
+        ("br", ".br", None if brotli is None else lambda b: brotli.compress(b, quality=11)),
+    ]
+    for name, ext, enc in encoders:
+        side = dst + ext
+        if not sidecars or enc is None:
+            if os.path.exists(side):
+                os.remove(side)
+            continue
+        if changed or not os.path.exists(side) or (prev or {}).get(f"{name}_source_sha256") != digest:
+            write_bytes_atomic(side, enc(data))
+        entry[f"{name}_bytes"] = os.path.getsize(side)
+        entry[f"{name}_source_sha256"] = digest
+    return entry, changed
+
+
+def publish_latest(
+    days_dir: str, public_dir: str, latest_n: int = 4, sidecars: bool = True
+) -> List[Tuple[str, bool]]:
+    """最新 latest_n 件を date1..N.json として配置する。戻り値: [(公開パス, 書き換えたか)]"""
     ensure_dir(public_dir)
     # YYYY-MM-DD.json を日付でソート
     # 日次出馬表のみ対象（reco-*.json は除外）
@@ -698,18 +877,298 @@ def publish_latest(days_dir: str, public_dir: str, latest_n: int = 4) -> List[st
     if len(selected) < latest_n:
         pad = [selected[0]] * (latest_n - len(selected))
         selected = pad + selected
-    # date1(最古)→date4(最新)
+    # date1(最古)→date4(最新)。内容が同じファイルは書き換えない
+    manifest_path = os.path.join(public_dir, PUBLISH_MANIFEST_NAME)
+    prev_files: Dict[str, dict] = {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            prev_files = json.load(f).get("files", {})
+    except (OSError, ValueError, AttributeError):
+        pass
+    manifest: Dict[str, dict] = {}
+    outs: List[Tuple[str, bool]] = []
     for idx, fname in enumerate(selected, start=1):
         src = os.path.join(days_dir, fname)
-        dst = os.path.join(public_dir, f"date{idx}.json")
-        with open(src, "r", encoding="utf-8") as rf, open(dst, "w", encoding="utf-8") as wf:
-            wf.write(rf.read())
-    return [os.path.join(public_dir, f"date{idx}.json") for idx in range(1, len(selected) + 1)]
+        name = f"date{idx}.json"
+        dst = os.path.join(public_dir, name)
+        entry, changed = publish_file(src, dst, sidecars=sidecars, prev=prev_files.get(name))
+        manifest[name] = entry
+        outs.append((dst, changed))
+    body = json.dumps({"files": manifest}, ensure_ascii=False, indent=2).encode("utf-8")
+    if sha256_file(manifest_path) != hashlib.sha256(body).hexdigest():
+        write_bytes_atomic(manifest_path, body)
+    return outs
+
+
+# 出力ロジック（判定式・スキーマ）を変えたら上げる。増分出力の全日再生成を強制する
+EXPORT_LOGIC_VERSION = "2025-06"
+MANIFEST_NAME = "export-manifest.json"
+
+
+def day_fingerprint(cur: sqlite3.Cursor, ymd: str, day: DayRows) -> str:
+    """開催日の入力データから安価な指紋を作る（--incremental 用）。
+
+    当日の N_RACE / N_UMA_RACE / 単勝オッズ行（読み込み済みの DayRows。オッズ・着順・通過順・
+    騎手等を含む）、解決後の騎手・調教師名（N_KISYU/N_CHOKYO の名称修正）と、出走馬の対象日前の
+    確定走の件数・'7' の件数・最終出走日・通過順の重み付き合計（過去走の通過順修正で
+    展開タイプが変わる）を対象にする。近走の分類やJSON生成は行わない。
+    """
+    yyyy, mmdd = ymd[:4], ymd[4:]
+    h = hashlib.sha1()
+    h.update(repr(day.races).encode("utf-8"))
+    for key in sorted(day.entries):
+        h.update(repr((key, day.entries[key])).encode("utf-8"))
+    # 名称はキャッシュされ、build_raceday の同じ引き当ては再問い合わせしない
+    kisyu = KISYU_NAMES.lookup(cur, (row[6] for rows in day.entries.values() for row in rows))
+    chokyo = CHOKYO_NAMES.lookup(cur, (row[7] for rows in day.entries.values() for row in rows))
+    h.update(repr((sorted(kisyu.items()), sorted(chokyo.items()))).encode("utf-8"))
+
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS day_ketto (KettoNum TEXT PRIMARY KEY)")
+    cur.execute("DELETE FROM temp.day_ketto")
+    cur.executemany(
+        "INSERT OR IGNORE INTO temp.day_ketto (KettoNum) VALUES (?)",
+        ((row[14],) for rows in day.entries.values() for row in rows if row[14]),
+    )
+    cur.execute(
+        """
+        SELECT COUNT(*), total(um.DataKubun = '7'), MAX(um.Year || um.MonthDay),
+               total(CAST(um.Jyuni1c AS INTEGER) + 3*CAST(um.Jyuni2c AS INTEGER)
+                     + 7*CAST(um.Jyuni3c AS INTEGER) + 11*CAST(um.Jyuni4c AS INTEGER))
+        FROM temp.day_ketto AS k
+        JOIN N_UMA_RACE AS um ON um.KettoNum = k.KettoNum
+        WHERE um.DataKubun IN ('5','7') AND (um.Year, um.MonthDay) < (?, ?)
+        """,
+        (yyyy, mmdd),
+    )
+    h.update(repr(cur.fetchone()).encode("utf-8"))
+    return h.hexdigest()
+
+
+def manifest_entry(fingerprint: str, compact: bool) -> dict:
+    # 入力の指紋に加えて出力ロジックと出力形式も記録し、どれかが変わった日は作り直す
+    return {"fingerprint": fingerprint, "logic": EXPORT_LOGIC_VERSION, "format": "compact" if compact else "indent2"}
+
+
+def load_manifest(days_dir: str) -> Dict[str, dict]:
+    path = os.path.join(days_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data.get("dates", {}) if isinstance(data, dict) else {}
+
+
+def save_manifest(days_dir: str, dates: Dict[str, dict]) -> None:
+    ensure_dir(days_dir)
+    path = os.path.join(days_dir, MANIFEST_NAME)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"dates": dict(sorted(dates.items()))}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def day_json_path(days_dir: str, ymd: str) -> str:
+    return os.path.join(days_dir, f"{ymd[:4]}-{ymd[4:6]}-{ymd[6:]}.json")
+
+
+def open_db(db_path: str, read_only: bool = False, index_db: Optional[str] = None) -> sqlite3.Connection:
+    # read_only: 並列ワーカー用（mode=ro URI）。一時テーブルは temp 側に作られるため読み取り専用でも可
+    if read_only:
+        from edb_tool import sqlite_uri
+
+        conn = sqlite3.connect(sqlite_uri(db_path), uri=True)
+    else:
+        conn = sqlite3.connect(db_path)
+    if index_db:
+        conn.execute("ATTACH DATABASE ? AS idx", (index_db,))
+    return conn
+
+
+def index_db_flags(conn: sqlite3.Connection, db_path: str, index_db: Optional[str]) -> Tuple[bool, bool]:
+    """ATTACH 済み側DBのうち本体と整合している部分: (uma_hist, horse_pace_asof)。"""
+    if not index_db:
+        return False, False
+    from edb_tool import pace_asof_is_fresh, side_index_is_fresh
+
+    return side_index_is_fresh(conn, db_path), pace_asof_is_fresh(conn, db_path)
+
+
+def export_dates(
+    db_path: str,
+    dates: List[str],
+    days_dir: str,
+    index_db: Optional[str] = None,
+    read_only: bool = False,
+    compact: bool = False,
+    profile: bool = False,
+    previous: Optional[Dict[str, dict]] = None,
+) -> List[Tuple[Optional[str], dict]]:
+    """指定日の RaceDay を1接続で順に生成・書き出す（--jobs のワーカー単位）。
+
+    日ごとの指紋は、カード生成用に読み込んだ当日行から計算する（同じ日を読み直さない）。
+    previous（--incremental 時の前回 manifest）と指紋・出力形式が同じで出力済みの日は書き出さない。
+    戻り値は dates と同じ順の (出力パス。書き出さなかった日は None, manifest エントリ)。
+    profile=True のとき、日ごとのフェーズ/SQL計測を YYYY-MM-DD.profile.json に出力する。
+    """
+    conn = open_db(db_path, read_only=read_only, index_db=index_db)
+    try:
+        cur = conn.cursor()
+        side_index, pace_asof = index_db_flags(conn, db_path, index_db)
+        out: List[Tuple[Optional[str], dict]] = []
+        for ymd in dates:
+            prof = ExportProfiler() if profile else NULL_PROFILER
+            if profile:
+                prof.attach(conn)
+            day = load_day_rows(cur, ymd[:4], ymd[4:], prof=prof)
+            with prof.phase("fingerprint"):
+                entry = manifest_entry(day_fingerprint(cur, ymd, day), compact)
+            if previous is not None and previous.get(ymd) == entry and os.path.exists(day_json_path(days_dir, ymd)):
+                if profile:
+                    prof.detach()
+                out.append((None, entry))
+                continue
+            rd = build_raceday(cur, ymd, side_index=side_index, pace_asof=pace_asof, prof=prof, day=day)
+            with prof.phase("serialization"):
+                out.append((write_raceday_json(rd, days_dir, compact=compact), entry))
+            if profile:
+                prof.detach()
+                print(f"profile: {prof.write(rd.date, days_dir)}")
+        return out
+    finally:
+        conn.close()
+
+
+def export_dates_parallel(
+    db_path: str,
+    dates: List[str],
+    days_dir: str,
+    jobs: int,
+    index_db: Optional[str] = None,
+    compact: bool = False,
+    profile: bool = False,
+    previous: Optional[Dict[str, dict]] = None,
+) -> List[Tuple[Optional[str], dict]]:
+    """日付を jobs 個に分け、各ワーカープロセスが読み取り専用接続で担当分を出力する。
+
+    日付は1日ずつ順番に配る（i::jobs）ため、開催の多い週末が1ワーカーに偏りにくい。
+    指紋の計算と --incremental の判定もワーカー側で行う。戻り値は export_dates と同じ形（dates の順）。
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    jobs = max(1, min(jobs, len(dates)))
+    slices = [dates[i::jobs] for i in range(jobs)]
+    by_date: Dict[str, Tuple[Optional[str], dict]] = {}
+    with ProcessPoolExecutor(max_workers=jobs) as ex:
+        futures = [
+            (
+                chunk,
+                ex.submit(
+                    export_dates, db_path, chunk, days_dir, index_db, True, compact, profile,
+                    {d: previous[d] for d in chunk if d in previous} if previous is not None else None,
+                ),
+            )
+            for chunk in slices
+        ]
+        for chunk, fut in futures:
+            by_date.update(zip(chunk, fut.result()))
+    return [by_date[ymd] for ymd in dates]
+
+
+# --- --watch（開催中のライブ更新） ---
+def race_confirm_state(cur: sqlite3.Cursor, yyyy: str, mmdd: str) -> Dict[RaceKey, Tuple]:
+    """レースごとの (確定行数, 行数, DataKubun 最小, 最大)。"""
+    cur.execute(
+        """
+        SELECT JyoCD, Kaiji, Nichiji, RaceNum,
+               SUM(DataKubun IN ('5','7')), COUNT(*), MIN(DataKubun), MAX(DataKubun)
+        FROM N_UMA_RACE
+        WHERE Year = ? AND MonthDay = ?
+          AND DataKubun IN ('1','2','3','4','5','6','7')
+        GROUP BY JyoCD, Kaiji, Nichiji, RaceNum
+        """,
+        (yyyy, mmdd),
+    )
+    return {tuple(r[:4]): tuple(r[4:]) for r in cur.fetchall()}
+
+
+def data_version(cur: sqlite3.Cursor) -> int:
+    # fetchall で文を最後まで進め、待機中に共有ロックを残さない（EveryDB2 側の書き込みを妨げない）
+    return cur.execute("PRAGMA data_version").fetchall()[0][0]
+
+
+def watch_day(
+    db_path: str,
+    ymd: str,
+    days_dir: str,
+    interval: float = 5.0,
+    index_db: Optional[str] = None,
+    compact: bool = False,
+    on_write=None,
+    timeout: Optional[float] = None,
+) -> None:
+    """開催中の1日を監視し、レースの確定状況が変わった開催の position_bias だけを更新して日次JSONを書き直す。
+
+    接続は開いたまま PRAGMA data_version（他接続の書き込みで増える）を interval 秒ごとに確認し、
+    変わったときだけレースごとの DataKubun を読み直す。全レースが確定したら終了（Ctrl-C でも終了）。
+    開始時点でその日の出走行・開催が無い（日付の誤り、N_RACE だけの日など）場合は監視せずに戻り、
+    timeout 秒を指定した場合は未確定のレースが残っていてもそこで打ち切る。
+    出馬表側（オッズ等）は更新しないため、通常のエクスポートで改めて作り直す（manifest は更新しない）。
+    """
+    yyyy, mmdd = ymd[:4], ymd[4:]
+    conn = open_db(db_path, read_only=True, index_db=index_db)
+    cur = conn.cursor()
+    side_index, pace_asof = index_db_flags(conn, db_path, index_db)
+    rd = build_raceday(cur, ymd, side_index=side_index, pace_asof=pace_asof)
+    # 一時テーブル(day_ketto)への書き込みで始まった暗黙のトランザクションを閉じ、本体の共有ロックを解放する
+    conn.commit()
+    state = race_confirm_state(cur, yyyy, mmdd)
+    if not state or not rd.meetings:
+        conn.close()
+        print(f"[WARN] watch: no races with starters on {ymd}, nothing to watch", file=sys.stderr)
+        return
+    version = data_version(cur)
+    print(f"watch: {ymd} races={len(state)} interval={interval}s")
+    deadline = time.monotonic() + timeout if timeout else None
+    try:
+        while not all(conf == n for conf, n, _, _ in state.values()):
+            if deadline is not None and time.monotonic() >= deadline:
+                pending = sum(1 for conf, n, _, _ in state.values() if conf != n)
+                print(f"[WARN] watch: timed out after {timeout:g}s with {pending} races unconfirmed", file=sys.stderr)
+                break
+            time.sleep(interval)
+            v = data_version(cur)
+            if v == version:
+                continue
+            version = v
+            now = race_confirm_state(cur, yyyy, mmdd)
+            changed = {k for k in set(now) | set(state) if now.get(k) != state.get(k)}
+            state = now
+            updated: List[str] = []
+            for jyo_cd in sorted({k[0] for k in changed}):
+                agg = aggregate_bias(cur, ymd, ymd, scope="day", jyo_cd=jyo_cd)
+                jyo = str(jyo_cd).zfill(2)
+                for m in rd.meetings:
+                    if m.track == JYOCD_TO_TRACK.get(jyo, jyo):
+                        m.position_bias = bias_summary(agg.get((ymd, jyo, m.kaiji, m.nichiji), {}))
+                        updated.append(f"{m.track}{m.kaiji}回{m.nichiji}日")
+            if not updated:
+                continue
+            path = write_raceday_json(rd, days_dir, compact=compact)
+            print(f"watch: {path} ({', '.join(updated)})")
+            if on_write:
+                on_write()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
 
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--db", required=True, help="SQLite DB file path")
+    ap.add_argument("--db", help="SQLite DB file path（--publish-only 以外は必須）")
     ap.add_argument("--date", action="append", help="対象日(YYYYMMDD)。複数指定可")
     ap.add_argument("--latest", type=int, help="DB内の最新N日を出力")
     ap.add_argument("--days-dir", default="data/days", help="日次JSON出力先")
@@ -718,12 +1177,78 @@ def main():
         action="store_true",
         help="最新4件を public/data/date1..4.json に出力",
     )
+    ap.add_argument(
+        "--publish-only",
+        action="store_true",
+        help="エクスポートせず data/days の最新4件を公開だけ行う（.gz/.br とマニフェストも更新）",
+    )
     ap.add_argument("--public-data-dir", default="public/data", help="公開用ディレクトリ")
+    ap.add_argument(
+        "--no-sidecars",
+        dest="sidecars",
+        action="store_false",
+        help="公開時に .gz/.br の事前圧縮ファイルを出力しない",
+    )
+    ap.add_argument(
+        "--index-db",
+        help="edb_tool.py index / pace-asof --side-db で作成した側DB（近走・展開タイプ参照に使用。本体と不整合な部分は無視）",
+    )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="並列ワーカー数（各ワーカーが読み取り専用接続で日付を分担）。既定1=逐次",
+    )
+    ap.add_argument(
+        "--incremental",
+        action="store_true",
+        help=f"入力の指紋が前回({MANIFEST_NAME})と同じ日は出力をスキップ",
+    )
+    ap.add_argument(
+        "--compact",
+        action="store_true",
+        help="日次JSONをインデントなしで出力（orjson があれば使用）",
+    )
+    ap.add_argument(
+        "--profile",
+        action="store_true",
+        help="日ごとのフェーズ別時間とSQL文ごとの回数/時間を YYYY-MM-DD.profile.json に出力",
+    )
+    ap.add_argument(
+        "--watch",
+        action="store_true",
+        help="出力後も対象日(最新)を監視し、レース確定ごとにその開催のバイアスを更新して書き直す",
+    )
+    ap.add_argument("--watch-interval", type=float, default=5.0, help="--watch の確認間隔(秒)")
+    ap.add_argument("--watch-timeout", type=float, help="--watch の打ち切り(秒)。既定は全レース確定まで")
     args = ap.parse_args()
 
+    def publish() -> None:
+        outs = publish_latest(args.days_dir, args.public_data_dir, latest_n=4, sidecars=args.sidecars)
+        for p, changed in outs:
+            print(f"{'published' if changed else 'unchanged'}: {p}")
+
+    if args.publish_only:
+        publish()
+        return
+    if not args.db:
+        ap.error("--db is required")
+
     conn = sqlite3.connect(args.db)
     cur = conn.cursor()
 
+    index_db: Optional[str] = None
+    if args.index_db:
+        from edb_tool import pace_asof_is_fresh, side_index_is_fresh
+
+        if not os.path.exists(args.index_db):
+            raise SystemExit(f"index-db not found: {args.index_db}")
+        cur.execute("ATTACH DATABASE ? AS idx", (args.index_db,))
+        if side_index_is_fresh(conn, args.db) or pace_asof_is_fresh(conn, args.db):
+            index_db = args.index_db
+        else:
+            print(f"[WARN] index-db is stale or incomplete, ignored: {args.index_db}", file=sys.stderr)
+
     targets: List[str] = []
     if args.date:
         targets = list(dict.fromkeys(args.date))  # unique
@@ -736,17 +1261,44 @@ def main():
                 raise SystemExit("No dates found in N_RACE")
             targets = [all_ymd[-1]]  # デフォルトは最新1日
 
-    written: List[str] = []
-    for ymd in targets:
-        rd = build_raceday(cur, ymd)
-        path = write_raceday_json(rd, args.days_dir)
-        written.append(path)
+    conn.close()
+
+    # 指紋はワーカーが当日行の読み込みと同時に計算し、--incremental 時は前回から変化のない日を書き出さない
+    manifest = load_manifest(args.days_dir)
+    previous = manifest if args.incremental else None
+    if args.jobs > 1 and len(targets) > 1:
+        results = export_dates_parallel(
+            args.db, targets, args.days_dir, args.jobs,
+            index_db=index_db, compact=args.compact, profile=args.profile, previous=previous,
+        )
+    else:
+        results = export_dates(
+            args.db, targets, args.days_dir, index_db=index_db, compact=args.compact, profile=args.profile,
+            previous=previous,
+        )
+    for ymd, (path, entry) in zip(targets, results):
+        if path is None:
+            print(f"unchanged: {day_json_path(args.days_dir, ymd)}")
+            continue
         print(f"wrote: {path}")
+        manifest[ymd] = entry
+    if any(path for path, _ in results):
+        save_manifest(args.days_dir, manifest)
 
     if args.publish_latest:
-        outs = publish_latest(args.days_dir, args.public_data_dir, latest_n=4)
-        for p in outs:
-            print(f"published: {p}")
+        publish()
+
+    if args.watch and targets:
+        watch_day(
+            args.db,
+            max(targets),
+            args.days_dir,
+            interval=args.watch_interval,
+            index_db=index_db,
+            compact=args.compact,
+            on_write=publish if args.publish_latest else None,
+            timeout=args.watch_timeout,
+        )
 
 
 if __name__ == "__main__":
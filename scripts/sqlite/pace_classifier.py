@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+展開タイプ(A/B/C)とレース展開スコアの判定（export_raceday.py / analytics 共通）
+
+判定:
+- 近走（新しい順）のうち、通過順が1つでも有効(>0)なレースを最大3走みる
+- 逃げ: 最初の有効コーナーが1番手、または 2番手→次の有効コーナーが1番手
+- 先行: 有効コーナーがすべて4番手以内
+- A: 逃げ2回以上 / B: 先行2回以上 / C: 先行1回（B と C は排他、A とは併記）
+
+入力は (頭数 × 走数 × 4コーナー) の整数配列（0 = 欠損）。numpy があれば全頭の近走行を
+1つの (行数 × 4) 配列に変換し、有効走の選択から判定までを配列演算で一括して行う。
+無ければ同じ判定を純Pythonで行う（結果は同一）。
+
+判定結果はラベルコード(int)で返す。LABELS[code] がラベル列、PRIMARY_TYPE[code] が
+1頭1タイプで集計する分析用の代表タイプ（A > B > C）。
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from itertools import chain
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy は任意
+    np = None
+
+
+RUNS = 3  # 判定に使う有効走数
+HEAD_EXTRA = 1  # pack_histories が配列で扱う近走行数 = runs + HEAD_EXTRA（足りない馬だけ続きを見る）
+NO_TYPE_SCORE = -3.5  # 展開タイプのある馬が1頭もいないレース
+PACE_MARK_MAX = 4.0  # スコアがこれ以下なら ★
+
+# code = 3 * (A か) + (0: なし, 1: B, 2: C)
+LABELS: Tuple[Tuple[str, ...], ...] = ((), ("B",), ("C",), ("A",), ("A", "B"), ("A", "C"))
+PRIMARY_TYPE: Tuple[Optional[str], ...] = (None, "B", "C", "A", "A", "A")
+CODE_A_ONLY = 3
+
+
+def corner_int(x) -> int:
+    """通過順位の文字列/数値を int に。欠損・不正・0以下は 0。"""
+    try:
+        s = str(x).strip()
+        if s == "" or s.upper() == "NULL":
+            return 0
+        v = int(float(s))
+    except Exception:
+        return 0
+    return v if v > 0 else 0
+
+
+def valid_runs(rows: Sequence[Sequence], runs: int = RUNS) -> List[Tuple[int, int, int, int]]:
+    """近走行（新しい順の Jyuni1c..4c）から、有効コーナーのある走だけを先頭から最大 runs 件。"""
+    out: List[Tuple[int, int, int, int]] = []
+    for p in rows:
+        c = (corner_int(p[0]), corner_int(p[1]), corner_int(p[2]), corner_int(p[3]))
+        if c[0] or c[1] or c[2] or c[3]:
+            out.append(c)
+            if len(out) >= runs:
+                break
+    return out
+
+
+def corner_block(rows: Sequence[Sequence]):
+    """Jyuni1c..4c の行の並びを (行数, 4) の int16 配列に（corner_int と同じ解釈）。numpy 必須。
+
+    EveryDB2 の固定長文字列（'03' 等）は NUL 区切りで連結した1つのバイト列を (行数, 4, 桁数) に
+    見て数字を配列演算で整数化する。整数の行はそのまま配列にし、それ以外（長さの揃わない文字列・
+    空白・NULL・小数表記等を含む）は文字コードの配列で同じ判定を行い、数字だけでない値は corner_int で個別に解釈する。
+    """
+    n = len(rows)
+    first = rows[0][0] if n else None
+    cp = None
+    if isinstance(first, str) and first:
+        try:
+            buf = ("\0".join(chain.from_iterable(p[:4] for p in rows)) + "\0").encode("ascii")
+        except (TypeError, UnicodeEncodeError):
+            buf = b""
+        width = len(first)
+        if len(buf) == n * 4 * (width + 1):
+            block = np.frombuffer(buf, dtype=np.uint8).reshape(n, 4, width + 1)
+            if (block[..., width] == 0).all():
+                cp = block[..., :width].astype(np.int64)
+    if cp is None:
+        a = np.array([tuple(p[:4]) for p in rows]).reshape(n, 4)
+        if a.dtype.kind in "iub":
+            return np.clip(a.astype(np.int64), 0, np.iinfo(np.int16).max).astype(np.int16)
+        a = a.astype(str)
+        cp = a.view(np.uint32).reshape(n, 4, a.dtype.itemsize // 4).astype(np.int64)
+    pad = cp == 0  # 短い文字列の後ろ詰め
+    ok = ((cp >= 48) & (cp <= 57) | pad).all(axis=2)
+    out = np.zeros((n, 4), dtype=np.int64)
+    for k in range(cp.shape[2]):
+        out = np.where(pad[..., k], out, out * 10 + cp[..., k] - 48)
+    for i, j in zip(*np.nonzero(~ok)):
+        out[i, j] = corner_int(rows[i][j])
+    return np.clip(out, 0, np.iinfo(np.int16).max).astype(np.int16)
+
+
+def pack_histories(histories: Sequence[Sequence[Sequence]], runs: int = RUNS):
+    """近走行のリスト（1頭1要素）を (頭数, runs, 4) の int16 配列に詰める。numpy 必須。
+
+    各馬の先頭 runs + HEAD_EXTRA 行を corner_block で1つの配列にし、有効コーナーのある走の馬ごとの
+    順位（累積和）で先頭 runs 走をマスクして選ぶ（valid_runs と同じ選択）。先頭行だけでは
+    有効走が runs に満たず続きの行がある馬（まれ）は valid_runs で詰め直す。
+    """
+    head_rows = runs + HEAD_EXTRA
+    lengths = np.fromiter((min(len(rows), head_rows) for rows in histories), dtype=np.int64, count=len(histories))
+    out = np.zeros((len(histories), runs, 4), dtype=np.int16)
+    if not lengths.sum():
+        return out
+    block = corner_block([p for rows in histories for p in rows[:head_rows]])
+    horse = np.repeat(np.arange(len(histories)), lengths)
+    present = (block > 0).any(axis=1)
+    seen = np.cumsum(present)
+    # 馬ごとの有効走の順位（1始まり）: 通算の累積数からその馬の先頭行より前の分を引く
+    before = np.concatenate(([0], seen))[np.cumsum(lengths) - lengths]
+    rank = seen - before[horse]
+    keep = present & (rank <= runs)
+    out[horse[keep], rank[keep] - 1] = block[keep]
+    found = np.bincount(horse[keep], minlength=len(histories))
+    for i in np.nonzero(found < runs)[0]:
+        if len(histories[i]) > head_rows:
+            vr = valid_runs(histories[i], runs)
+            out[i] = 0
+            out[i, : len(vr)] = vr
+    return out
+
+
+def classify_array(arr, runs: int = RUNS):
+    """(頭数 × 走数 × 4) の整数配列からラベルコード配列を返す。0 は欠損、全コーナー欠損の走は数えない。"""
+    arr = np.asarray(arr)
+    valid = arr > 0
+    present = valid.any(axis=2)
+    considered = present & (np.cumsum(present, axis=1) <= runs)
+    # 最初と2番目の有効コーナー
+    i1 = valid.argmax(axis=2)[..., None]
+    first = np.take_along_axis(arr, i1, axis=2)[..., 0]
+    rest = valid.copy()
+    np.put_along_axis(rest, i1, False, axis=2)
+    i2 = rest.argmax(axis=2)[..., None]
+    second = np.where(rest.any(axis=2), np.take_along_axis(arr, i2, axis=2)[..., 0], 0)
+    nige = (first == 1) | ((first == 2) & (second == 1))
+    senkou = np.where(valid, arr <= 4, True).all(axis=2)
+    nige_cnt = (nige & considered).sum(axis=1)
+    sen_cnt = (senkou & considered).sum(axis=1)
+    bc = np.where(sen_cnt >= 2, 1, np.where(sen_cnt >= 1, 2, 0))
+    return (3 * (nige_cnt >= 2) + bc).astype(np.int8)
+
+
+def _code_py(vr: List[Tuple[int, int, int, int]]) -> int:
+    nige_cnt = 0
+    sen_cnt = 0
+    for c in vr:
+        pres = [v for v in c if v]
+        first = pres[0]
+        second = pres[1] if len(pres) >= 2 else None
+        if first == 1 or (first == 2 and second == 1):
+            nige_cnt += 1
+        if all(v <= 4 for v in pres):
+            sen_cnt += 1
+    bc = 1 if sen_cnt >= 2 else (2 if sen_cnt >= 1 else 0)
+    return 3 * (nige_cnt >= 2) + bc
+
+
+def classify_histories(histories: Sequence[Sequence[Sequence]]) -> List[int]:
+    """近走行のリスト（1頭1要素、新しい順）をまとめて判定し、ラベルコードのリストを返す。"""
+    if np is None:
+        return [_code_py(valid_runs(rows)) for rows in histories]
+    if not histories:
+        return []
+    return classify_array(pack_histories(histories)).tolist()
+
+
+@dataclass(frozen=True)
+class PaceWeights:
+    """展開スコアの重みと閾値（現行値が既定。pace_sweep_sqlite.py で探索する）。"""
+
+    b: float = 1.0  # B 1頭あたり
+    c: float = 0.5  # C 1頭あたり
+    no_a: float = -2.5  # A数 0
+    multi_a: float = 1.5  # A数 multi_a_min 以上
+    multi_a_min: int = 2
+    few_b: float = -1.0  # B頭数 few_b_max 以下
+    few_b_max: int = 2
+    mark_max: float = PACE_MARK_MAX  # ★ の上限
+
+
+DEFAULT_WEIGHTS = PaceWeights()
+
+
+def race_type_counts(codes: Sequence[int], race_idx: Sequence[int], n_races: int):
+    """レースごとの (A数, B頭数, C頭数, タイプあり頭数)。
+
+    A数は A を含む馬の頭数に A 単独の馬の頭数を加えたもの（A 単独の馬は2と数える、従来どおり）。
+    numpy があれば各 ndarray、無ければ各 list。
+    """
+    if np is not None:
+        c = np.asarray(codes, dtype=np.int8)
+        idx = np.asarray(race_idx, dtype=np.intp)
+
+        def count(mask):
+            return np.bincount(idx, weights=mask, minlength=n_races).astype(np.int64)
+
+        return (
+            count(c >= CODE_A_ONLY) + count(c == CODE_A_ONLY),
+            count((c == 1) | (c == 4)),
+            count((c == 2) | (c == 5)),
+            count(c > 0),
+        )
+    a_l = [0] * n_races
+    b_l = [0] * n_races
+    c_l = [0] * n_races
+    typed_l = [0] * n_races
+    for code, ri in zip(codes, race_idx):
+        if not code:
+            continue
+        typed_l[ri] += 1
+        if code >= CODE_A_ONLY:
+            a_l[ri] += 2 if code == CODE_A_ONLY else 1
+        if code in (1, 4):
+            b_l[ri] += 1
+        elif code in (2, 5):
+            c_l[ri] += 1
+    return a_l, b_l, c_l, typed_l
+
+
+def score_from_counts(a, b, c, w: PaceWeights = DEFAULT_WEIGHTS):
+    """score = w.b×B + w.c×C + w.no_a(A数 0) + w.multi_a(A数 multi_a_min 以上) + w.few_b(B few_b_max 以下)。
+
+    a/b/c はスカラーでも ndarray でもよい（丸め前の値を返す）。
+    """
+    return b * w.b + c * w.c + w.no_a * (a == 0) + w.multi_a * (a >= w.multi_a_min) + w.few_b * (b <= w.few_b_max)
+
+
+def race_pace_scores(
+    codes: Sequence[int], race_idx: Sequence[int], n_races: int, weights: PaceWeights = DEFAULT_WEIGHTS
+) -> Tuple[List[float], List[bool]]:
+    """各馬のラベルコードと所属レース番号(0..n_races-1)から、レースごとの (展開スコア, ★) を返す。
+
+    展開タイプのある馬がいないレースは NO_TYPE_SCORE（★なし）。
+    """
+    a, b, c, typed = race_type_counts(codes, race_idx, n_races)
+    if np is not None:
+        typed = np.asarray(typed)
+        score = np.where(typed > 0, np.round(score_from_counts(a, b, c, weights), 1), NO_TYPE_SCORE)
+        mark = (typed > 0) & (score <= weights.mark_max)
+        return score.tolist(), mark.tolist()
+
+    scores: List[float] = []
+    marks: List[bool] = []
+    for ai, bi, ci, ti in zip(a, b, c, typed):
+        if not ti:
+            scores.append(NO_TYPE_SCORE)
+            marks.append(False)
+            continue
+        s = round(score_from_counts(ai, bi, ci, weights), 1)
+        scores.append(s)
+        marks.append(s <= weights.mark_max)
+    return scores, marks
+
+
+def classify_races(
+    histories: Sequence[Sequence[Sequence]], race_idx: Sequence[int], n_races: int
+) -> Tuple[List[int], List[float], List[bool]]:
+    """出走馬全頭の近走からラベルコードとレースごとの展開スコア/★を一括で求める。"""
+    codes = classify_histories(histories)
+    scores, marks = race_pace_scores(codes, race_idx, n_races)
+    return codes, scores, marks
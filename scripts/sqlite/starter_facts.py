@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+出走馬ファクト（1出走1行・年ごとの列指向ファイル）の作成と読み込み
+
+EveryDB2 は全列 TEXT のため、分析スクリプトは毎回数百万値を to_int_or_none で解釈し、
+単勝オッズの補完結合もやり直している。確定出走（DataKubun 5/7）を一度だけ型付きの列に
+変換して保存し、分析側は NumPy で一括集計する。
+
+- 形式: pyarrow があれば Parquet（facts-YYYY.parquet）、無ければ NumPy の npz（facts-YYYY.npz）
+- 付帯: facts-meta.json（形式・列・年・作成元DBのサイズ/更新時刻。年ごとに行数・最終月日・
+  作成元DB・途中の年か（partial: DB の最新年、または DataKubun 5 の暫定行を含む年））
+- 作成: `python3 scripts/sqlite/edb_tool.py build-facts --db ... --out data/facts`
+- 読み込み時、EDB_PATH が設定されていれば読む年の作成元と現在のDBを比べ、違えば警告する
+
+列（欠損は 0）:
+  ymd, jyo, race_no, ground(TrackCD 先頭桁: 1 芝 / 2 ダ / 5 障), distance,
+  umaban, wakuban, odds10(単勝オッズ×10、N_UMA_RACE.Odds → S_ODDS_TANPUKU.TanOdds の順),
+  ninki, finish, pace(展開タイプのラベルコード、pace_classifier.LABELS), win_pay, place_pay(100円あたり払戻)
+"""
+
+from __future__ import annotations
+
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from edb_tool import build_pace_asof, pace_asof_is_fresh, source_stamp, sqlite_uri
+
+try:
+    import numpy as np
+except ImportError:  # numpy は任意（ファクトの作成・集計には必要）
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow は任意（無ければ npz）
+    pa = None
+    pq = None
+
+
+# (列名, array の型コード, numpy dtype)
+FACT_COLUMNS: Tuple[Tuple[str, str, str], ...] = (
+    ("ymd", "i", "int32"),
+    ("jyo", "b", "int8"),
+    ("race_no", "b", "int8"),
+    ("ground", "b", "int8"),
+    ("distance", "h", "int16"),
+    ("umaban", "b", "int8"),
+    ("wakuban", "b", "int8"),
+    ("odds10", "i", "int32"),
+    ("ninki", "b", "int8"),
+    ("finish", "b", "int8"),
+    ("pace", "b", "int8"),
+    ("win_pay", "i", "int32"),
+    ("place_pay", "i", "int32"),
+)
+META_NAME = "facts-meta.json"
+GROUND_CODE = {"芝": 1, "ダ": 2, "障": 5}
+
+# 単勝オッズ帯（odds_band_*.py と同じ境界: <2, 2-5, 5-10, 10-25, >25）。odds10 は整数なので
+# 「<2.0」は「odds10 < 20」、「<=25.0」は「odds10 < 251」
+BANDS = ("<2", "2-5", "5-10", "10-25", ">25")
+BAND_EDGES10 = (20, 50, 100, 251)
+
+_RE_NONDIGIT = re.compile(r"\D")
+
+
+def to_int0(v) -> int:
+    """TEXT 列を int に（欠損・不正は 0）。分析スクリプトの to_int_or_none と同じ解釈。"""
+    try:
+        s = str(v).strip()
+        if s == "" or s.upper() == "NULL":
+            return 0
+        return int(float(s))
+    except Exception:
+        return 0
+
+
+def digits0(v) -> int:
+    """払戻の馬番・金額（'000006253' 等）を int に（数字が無ければ 0）。"""
+    ds = _RE_NONDIGIT.sub("", str(v or ""))
+    return int(ds) if ds else 0
+
+
+def require_numpy() -> None:
+    if np is None:
+        raise SystemExit("numpy is required for starter facts (pip install numpy)")
+
+
+def fact_path(out_dir: str, year: int, fmt: str) -> str:
+    return os.path.join(out_dir, f"facts-{year:04d}.{fmt}")
+
+
+def pay_pairs(cur: sqlite3.Cursor, key: str, pay: str, max_n: int) -> List[Tuple[str, str]]:
+    cur.execute("PRAGMA table_info(N_HARAI)")
+    cols = {r[1] for r in cur.fetchall()}
+    return [(f"{key}{n}", f"{pay}{n}") for n in range(1, max_n + 1) if f"{key}{n}" in cols and f"{pay}{n}" in cols]
+
+
+def load_payouts(cur: sqlite3.Cursor, year: str) -> Dict[Tuple[str, str, str], Tuple[Dict[int, int], Dict[int, int]]]:
+    """その年の単勝・複勝払戻を (MonthDay, JyoCD, RaceNum) -> ({馬番: 払戻}, {馬番: 払戻}) に。"""
+    tan = pay_pairs(cur, "PayTansyoUmaban", "PayTansyoPay", 3)
+    fuku = pay_pairs(cur, "PayFukusyoUmaban", "PayFukusyoPay", 5)
+    cols = [c for pair in tan + fuku for c in pair]
+    if not cols:
+        return {}
+    cur.execute(
+        f"SELECT MonthDay, JyoCD, RaceNum, {', '.join(cols)} FROM N_HARAI WHERE Year = ?",
+        (year,),
+    )
+    out: Dict[Tuple[str, str, str], Tuple[Dict[int, int], Dict[int, int]]] = {}
+    nt = len(tan)
+    for row in cur.fetchall():
+        key = (row[0], row[1], row[2])
+        if key in out:
+            continue  # 1レース1行（realized_roi_* の LIMIT 1 と同じ）
+        vals = row[3:]
+        maps: Tuple[Dict[int, int], Dict[int, int]] = ({}, {})
+        for i in range(len(vals) // 2):
+            u = digits0(vals[2 * i])
+            p = digits0(vals[2 * i + 1])
+            if u and p:
+                maps[0 if i < nt else 1][u] = p
+        out[key] = maps
+    return out
+
+
+def year_columns(cur: sqlite3.Cursor, year: str, pace_join: str) -> Dict[str, array]:
+    """1年分の確定出走を型付きの列に変換する。"""
+    cols = {name: array(code) for name, code, _ in FACT_COLUMNS}
+    pays = load_payouts(cur, year)
+    pace_code = "pa.code" if pace_join else "NULL"
+    cur.execute(
+        f"""
+        SELECT um.MonthDay, um.JyoCD, um.RaceNum, r.TrackCD, r.Kyori,
+               um.Umaban, um.Wakuban, um.Odds, so.TanOdds, um.Ninki, um.KakuteiJyuni,
+               {pace_code}
+        FROM N_UMA_RACE AS um
+        LEFT JOIN S_ODDS_TANPUKU AS so
+          ON um.Year = so.Year AND um.MonthDay = so.MonthDay
+         AND um.JyoCD = so.JyoCD AND um.RaceNum = so.RaceNum AND um.Umaban = so.Umaban
+        LEFT JOIN N_RACE AS r
+          ON r.Year = um.Year AND r.MonthDay = um.MonthDay AND r.JyoCD = um.JyoCD
+         AND r.Kaiji = um.Kaiji AND r.Nichiji = um.Nichiji AND r.RaceNum = um.RaceNum{pace_join}
+        WHERE um.Year = ? AND um.DataKubun IN ('5','7')
+        ORDER BY um.MonthDay, um.JyoCD, um.RaceNum, um.Umaban
+        """,
+        (year,),
+    )
+    y = int(year) * 10000
+    none: Tuple[Dict[int, int], Dict[int, int]] = ({}, {})
+    while True:
+        batch = cur.fetchmany(5000)
+        if not batch:
+            break
+        for md, jyo, rno, trackcd, kyori, umaban, waku, odds, tan, ninki, fin, pace in batch:
+            uma = to_int0(umaban)
+            o = to_int0(odds)
+            if o <= 0:
+                o = max(to_int0(tan), 0)
+            tan_map, fuku_map = pays.get((md, jyo, rno), none)
+            tc = str(trackcd or "")
+            cols["ymd"].append(y + to_int0(md))
+            cols["jyo"].append(to_int0(jyo))
+            cols["race_no"].append(to_int0(rno))
+            cols["ground"].append(int(tc[0]) if tc[:1].isdigit() else 0)
+            cols["distance"].append(to_int0(kyori))
+            cols["umaban"].append(uma)
+            cols["wakuban"].append(to_int0(waku))
+            cols["odds10"].append(o)
+            cols["ninki"].append(to_int0(ninki))
+            cols["finish"].append(to_int0(fin))
+            cols["pace"].append(pace or 0)
+            cols["win_pay"].append(tan_map.get(uma, 0))
+            cols["place_pay"].append(fuku_map.get(uma, 0))
+    return cols
+
+
+def write_year(cols: Dict[str, array], path: str, fmt: str) -> None:
+    arrays = {name: np.frombuffer(cols[name], dtype=dt) if len(cols[name]) else np.zeros(0, dt) for name, _, dt in FACT_COLUMNS}
+    tmp = f"{path}.tmp-{os.getpid()}"
+    if fmt == "parquet":
+        pq.write_table(pa.table(arrays), tmp, compression="zstd")
+    else:
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+def build_facts(
+    db_path: str, out_dir: str, index_db: Optional[str] = None, years: Optional[Sequence[int]] = None
+) -> List[str]:
+    """確定出走を年ごとのファクトファイルに書き出す（years 指定時はその年だけ作り直す）。
+
+    展開タイプは horse_pace_asof から引く。index_db が無い・古い場合は一時的に作成する。
+    """
+    require_numpy()
+    fmt = "parquet" if pq is not None else "npz"
+    os.makedirs(out_dir, exist_ok=True)
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(sqlite_uri(db_path), uri=True)
+    cur = conn.cursor()
+
+    tmpdir = None
+    if index_db and os.path.exists(index_db):
+        cur.execute("ATTACH DATABASE ? AS idx", (sqlite_uri(index_db),))
+        if not pace_asof_is_fresh(conn, db_path):
+            print(f"[WARN] pace-asof table is stale or missing, building a temporary one: {index_db}", file=sys.stderr)
+            cur.execute("DETACH DATABASE idx")
+            index_db = None
+    else:
+        index_db = None
+    if index_db is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        index_db = os.path.join(tmpdir.name, "pace-asof.sqlite")
+        build_pace_asof(index_db, db_path).close()
+        cur.execute("ATTACH DATABASE ? AS idx", (sqlite_uri(index_db),))
+    pace_join = """
+        LEFT JOIN idx.horse_pace_asof AS pa
+          ON pa.KettoNum = um.KettoNum
+         AND pa.ymd = CAST(um.Year AS INTEGER)*10000 + CAST(um.MonthDay AS INTEGER)"""
+
+    # 年ごとの最終月日と暫定(DataKubun 5)行数。最新年と暫定行を含む年は partial（後で変わりうる）
+    cur.execute(
+        """
+        SELECT Year, MAX(MonthDay), SUM(DataKubun = '5') FROM N_UMA_RACE
+        WHERE DataKubun IN ('5','7') GROUP BY Year ORDER BY Year
+        """
+    )
+    year_state = {y: (md, n5) for y, md, n5 in cur.fetchall() if str(y).isdigit()}
+    all_years = list(year_state)
+    todo = [y for y in all_years if years is None or int(y) in years]
+    stamp = source_stamp(db_path)
+    prev_meta = read_meta(out_dir)
+    prev_info = prev_meta.get("year_info", {})
+    year_info: Dict[str, dict] = {}
+    written: List[str] = []
+    n_rows = 0
+    for y in todo:
+        cols = year_columns(cur, y, pace_join)
+        path = fact_path(out_dir, int(y), fmt)
+        write_year(cols, path, fmt)
+        written.append(path)
+        n_rows += len(cols["ymd"])
+        through, n5 = year_state[y]
+        year_info[y] = {
+            "rows": len(cols["ymd"]),
+            "through": through,
+            "partial": y == all_years[-1] or bool(n5),
+            "source": stamp,
+        }
+    conn.close()
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+    built = sorted(int(y) for y in all_years if os.path.exists(fact_path(out_dir, int(y), fmt)))
+    # 作り直さなかった年は前回の記録を引き継ぐ（年ごとの記録が無い旧形式は前回全体の作成元）
+    for y in built:
+        if str(y) not in year_info:
+            year_info[str(y)] = prev_info.get(str(y), {"source": prev_meta.get("source")})
+    meta = {
+        "format": fmt,
+        "columns": [name for name, _, _ in FACT_COLUMNS],
+        "years": built,
+        "partial_years": sorted(int(y) for y, info in year_info.items() if info.get("partial")),
+        "year_info": dict(sorted(year_info.items())),
+        "source": stamp,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    meta_path = os.path.join(out_dir, META_NAME)
+    tmp = f"{meta_path}.tmp-{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, meta_path)
+    print(f"facts: years={len(todo)} rows={n_rows} format={fmt} {time.perf_counter() - t0:.1f}s -> {out_dir}")
+    return written
+
+
+def read_meta(facts_dir: str) -> dict:
+    try:
+        with open(os.path.join(facts_dir, META_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def warn_if_stale(facts_dir: str, db_path: str, years: Iterable[int]) -> bool:
+    """読む年の作成元（facts-meta.json）が現在の db_path と違えば stderr に警告し、True を返す。"""
+    meta = read_meta(facts_dir)
+    info = meta.get("year_info", {})
+    now = source_stamp(db_path)
+    stale = sorted(y for y in years if info.get(str(y), {}).get("source", meta.get("source")) != now)
+    if not stale:
+        return False
+    partial = [y for y in stale if info.get(str(y), {}).get("partial")]
+    print(
+        f"[WARN] facts in {facts_dir} were built from another state of {db_path} "
+        f"(years {','.join(map(str, stale))}"
+        + (f"; partial when built: {','.join(map(str, partial))}" if partial else "")
+        + "); rebuild with: edb_tool.py build-facts",
+        file=sys.stderr,
+    )
+    return True
+
+
+def fact_files(facts_dir: str, years: Optional[Iterable[int]] = None) -> List[str]:
+    want = set(years) if years is not None else None
+    out = []
+    for p in sorted(glob.glob(os.path.join(facts_dir, "facts-[0-9][0-9][0-9][0-9].*"))):
+        if not p.endswith((".parquet", ".npz")):
+            continue
+        if want is None or int(os.path.basename(p)[6:10]) in want:
+            out.append(p)
+    return out
+
+
+def load_facts(facts_dir: str, columns: Sequence[str], years: Optional[Iterable[int]] = None) -> Dict[str, "np.ndarray"]:
+    """ファクトの指定列を読み、年をまたいで連結した ndarray の dict を返す。
+
+    EDB_PATH が設定されていれば、読む年が現在のDBから作られたものかを確かめる（warn_if_stale）。
+    """
+    require_numpy()
+    files = fact_files(facts_dir, years)
+    if not files:
+        raise SystemExit(f"no fact files in {facts_dir} (run: edb_tool.py build-facts)")
+    edb = os.environ.get("EDB_PATH")
+    if edb and os.path.exists(edb):
+        warn_if_stale(facts_dir, edb, [int(os.path.basename(p)[6:10]) for p in files])
+    parts: Dict[str, List] = {c: [] for c in columns}
+    for p in files:
+        if p.endswith(".parquet"):
+            if pq is None:
+                raise SystemExit(f"pyarrow is required to read {p}")
+            t = pq.read_table(p, columns=list(columns))
+            for c in columns:
+                parts[c].append(t.column(c).to_numpy())
+        else:
+            with np.load(p) as z:
+                for c in columns:
+                    parts[c].append(z[c])
+    return {c: np.concatenate(v) for c, v in parts.items()}
+
+
+def band_index(odds10: "np.ndarray") -> "np.ndarray":
+    """odds10 (>0) -> BANDS の添字。"""
+    return np.searchsorted(np.array(BAND_EDGES10), odds10, side="right")
+
+
+def band_totals(odds10: "np.ndarray", finish: "np.ndarray") -> List[Tuple[int, int, int, int]]:
+    """オッズ帯ごとの (stake, ret, starters, winners)。odds10 が 0 の出走は除く。"""
+    m = odds10 > 0
+    idx = band_index(odds10[m])
+    win = finish[m] == 1
+    n = len(BANDS)
+    starters = np.bincount(idx, minlength=n)
+    winners = np.bincount(idx, weights=win, minlength=n)
+    ret = np.bincount(idx, weights=np.where(win, odds10[m], 0) * 10, minlength=n)
+    return [(int(s) * 100, int(r), int(s), int(w)) for s, r, w in zip(starters, ret, winners)]